@@ -0,0 +1,90 @@
+import re
+import sys
+from bisect import bisect_right
+from itertools import accumulate
+
+# 构建输出的着色 (CMakeWorkflow.py、CMakeInstallToProjectDIR.py、Conan 的 main.py 共用)。
+# 含有单词 error 的行为红色 (包括 "CMake Error"、"ninja: error:"、MSVC 的 "error C2065")，否则含有 warning 的行为黄色。
+# 详细构建可能输出数百万行，因此不逐行执行多个 re.search: 把一批行拼成一段文本，用一个预编译的组合模式扫描一遍，
+# 再按匹配位置找到所在的行；没有匹配的行 (绝大多数) 不经过任何 Python 层面的处理。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+RESET = "\033[0m"
+
+# 第 1 组匹配时为错误，否则为警告；同一行既有 error 又有 warning 时按错误着色。
+# 在转为小写的文本上匹配 (re.IGNORECASE 和以 \b 开头的模式都会让 re 放弃按首字符快速跳过，慢 3~4 倍)，
+# 单词的前边界在匹配后检查。
+DIAGNOSTIC_PATTERN = re.compile(r'e(rror)(?!\w)|warning(?!\w)')
+_DIAGNOSTIC_PATTERN_IGNORECASE = re.compile(DIAGNOSTIC_PATTERN.pattern, re.IGNORECASE)
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+def classify_lines(lines):
+    """返回 {行号: 颜色}，只包含需要着色的行。"""
+    text = "".join(lines)
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        matches = DIAGNOSTIC_PATTERN.finditer(lowered)
+    else:
+        # 个别非 ASCII 字符转小写后长度会变，位置无法对应，退回忽略大小写的匹配
+        matches = _DIAGNOSTIC_PATTERN_IGNORECASE.finditer(text)
+    colors = {}
+    line_ends = None
+    for match in matches:
+        start = match.start()
+        if start and _is_word_char(text[start - 1]):
+            continue
+        if line_ends is None:
+            line_ends = list(accumulate(map(len, lines)))
+        index = bisect_right(line_ends, start)
+        if match.group(1):
+            colors[index] = RED
+        else:
+            colors.setdefault(index, YELLOW)
+    return colors
+
+
+def _wrap(line, color):
+    # RESET 放在换行符之前，颜色不会延续到下一行的行首
+    if line.endswith("\n"):
+        return color + line[:-1] + RESET + "\n"
+    return color + line + RESET
+
+
+def colorize_lines(lines):
+    """返回着色后的行列表；没有需要着色的行时原样返回 lines。"""
+    colors = classify_lines(lines)
+    if not colors:
+        return lines
+    lines = list(lines)
+    for index, color in colors.items():
+        lines[index] = _wrap(lines[index], color)
+    return lines
+
+
+def color_line(line):
+    """单行版本，供逐行处理的调用方使用 (例如 NinjaProgress 中非进度行的输出)。"""
+    color = classify_lines((line,)).get(0)
+    return _wrap(line, color) if color else line
+
+
+class ColorizingSink:
+    """AsyncProcessRunner 的 sink: 每批行着色一次、拼接后只写一次并 flush 一次。
+    prefix 非空时加在每行行首 (多个命令的输出交错显示时区分来源)。"""
+
+    def __init__(self, stream=None, prefix=""):
+        self.stream = stream or sys.stdout
+        self.prefix = prefix
+
+    def write_lines(self, lines):
+        lines = colorize_lines(lines)
+        if self.prefix:
+            self.stream.write(self.prefix + self.prefix.join(lines))
+        else:
+            self.stream.write("".join(lines))
+        self.stream.flush()
@@ -1,13 +1,14 @@
 import json
 import os
 from pathlib import Path
-import re
 import shutil
 import sys
 import subprocess
 import platform
 import argparse
-import threading
+
+import AsyncProcessRunner
+import OutputColorizer
 
 class BaseTask:
     """基类，包含公共方法和属性"""
@@ -43,45 +44,19 @@ class BaseTask:
         elif self.system in ("Linux", "Darwin") and not os.path.exists(self.shell_path):
             raise FileNotFoundError("Bash not found. Please fill the right path in template.json.")
 
-# ANSI 转义码着色函数
+# ANSI 转义码着色函数 (见 OutputColorizer.py)
     def color_line(self,line):
-        RED = "\033[91m"
-        YELLOW = "\033[93m"
-        RESET = "\033[0m"
-        # 根据 MSVC 输出格式，可根据需要调整正则匹配
-        if re.search(r'\berror\b', line, re.IGNORECASE):
-            return RED + line + RESET
-        elif re.search(r'\bwarning\b', line, re.IGNORECASE):
-            return YELLOW + line + RESET
-        return line
+        return OutputColorizer.color_line(line)
     
 
-    def stream_output(self,stream, color_func):
-        for line in iter(stream.readline, ""):
-            sys.stdout.write(color_func(line))
-        stream.close()
     def run_command_with_color(self,cmd, env, cwd):
-        """执行命令，实时着色输出"""
-        process = subprocess.Popen(
-            cmd,
-            env=env,
-            cwd=cwd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            encoding='utf-8',    # 强制使用 UTF-8 编码
-            errors='replace',  
-            bufsize=1,
-            shell=True
-        )
-        t1 = threading.Thread(target=self.stream_output, args=(process.stdout, self.color_line))
-        t2 = threading.Thread(target=self.stream_output, args=(process.stderr, self.color_line))
-        t1.start()
-        t2.start()
-        t1.join()
-        t2.join()
-
-        return process.wait()
+        """执行命令，实时着色输出 (见 AsyncProcessRunner.py)，返回返回码；超时返回 -1"""
+        result = AsyncProcessRunner.run(cmd, env=env, cwd=cwd,
+                                        sink=OutputColorizer.ColorizingSink(sys.stdout))
+        if result.timed_out:
+            print(f"Command timed out after {result.duration:.0f}s and was terminated.")
+            return -1
+        return result.returncode
         
 
     def get_conanrun_env(self, build_type="Debug"):
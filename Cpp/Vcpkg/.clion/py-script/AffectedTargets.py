@@ -0,0 +1,334 @@
+import os
+import re
+import sys
+import json
+import argparse
+import platform
+import subprocess
+
+import NinjaDepsReader
+
+# 根据 git diff (或给定的改动文件列表) 在 ninja 构建图上计算受影响的最终目标和测试，
+# CMakeWorkflow.py 的 "受影响的目标构建与测试" 只构建这些目标，再用 ctest -R 只运行受影响的测试:
+#   python AffectedTargets.py build/ [--base origin/main] [--changed src/a.cpp include/b.h] [--json]
+#
+# 构建图来自 build.ninja (及其 include / subninja 的文件) 中的 build 语句 (等同于对每个节点执行 ninja -t query，
+# 但只需读一遍文件)，头文件依赖来自 .ninja_deps (NinjaDepsReader.py，等同于 ninja -t deps)。
+# 从改动的文件出发沿 "输入 -> 输出" 方向传播 (仅顺序依赖 || 不会触发重新构建，不沿它传播)，
+# 受影响的链接产物 (可执行文件 / 库) 通过 CMake 生成的同名 phony 别名映射回目标名，
+# 再去掉会被其他受影响目标顺带构建的目标，得到最小的目标集合。
+# 测试通过 ctest --show-only=json-v1 列出，命令中的可执行文件受影响的测试即为受影响的测试。ctest 只有在
+# 测试可执行文件存在时才给出命令，所以应在构建受影响的目标之后再查询测试。
+# 改动涉及 CMakeLists.txt / *.cmake / 预设文件时配置本身可能变化，无法从现有构建图推断，结果为 "全部"。
+# 构建目录在源码树内且未被 gitignore 时，其中 CMake 生成的 *.cmake 等文件也会出现在 git 的未跟踪文件中，
+# 因此构建目录 (本预设的以及 excluded_dirs 给出的其他预设的) 中的文件在分类之前就被去掉。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+MANIFEST_NAME = "build.ninja"
+# 改动这些文件时需要重新配置，受影响范围按 "全部" 处理
+CONFIGURATION_FILE_PATTERN = re.compile(r'(^|/)(CMakeLists\.txt|[^/]*\.cmake|CMakePresets\.json|CMakeUserPresets\.json|vcpkg\.json|conanfile\.(txt|py))$', re.IGNORECASE)
+# CMake 链接规则名: CXX_EXECUTABLE_LINKER__app_Debug、C_STATIC_LIBRARY_LINKER__lib_ 等
+LINK_RULE_PATTERN = re.compile(r'_(?:EXECUTABLE|STATIC_LIBRARY|SHARED_LIBRARY|MODULE_LIBRARY)_LINKER__')
+# CMake 生成的内置 phony 目标，不是用户目标
+RESERVED_TARGET_NAMES = {"all", "clean", "help", "edit_cache", "rebuild_cache", "install", "install/local",
+                         "install/strip", "list_install_components", "test", "package", "package_source",
+                         "build.ninja", "codegen"}
+
+# 路径 (可含 "$x" 转义) 或 ":"；续行符 "$\n" 和空白都不属于任何记号。转义按 ninja 的规则还原 ("$ " -> " "、"$:" -> ":"、"$$" -> "$")
+_PATH_TOKEN_PATTERN = re.compile(r'(?:\$[^\r\n]|[^$ \t:\r\n])+|:')
+_PATH_ESCAPE_PATTERN = re.compile(r'\$(.)')
+
+
+def _unescape(token):
+    return _PATH_ESCAPE_PATTERN.sub(r'\1', token)
+
+
+def parse_build_statement(statement):
+    """解析 "build 输出 | 隐式输出: 规则 输入 | 隐式输入 || 仅顺序依赖 |@ 校验"。
+    返回 (全部输出, 规则名, 会触发重新构建的输入 (显式 + 隐式))；不是 build 语句时返回 None。"""
+    tokens = _PATH_TOKEN_PATTERN.findall(statement)
+    if len(tokens) < 3 or tokens[0] != "build" or ":" not in tokens:
+        return None
+    colon = tokens.index(":")
+    outputs = [_unescape(token) for token in tokens[1:colon] if token != "|"]
+    if colon + 1 >= len(tokens):
+        return None
+    rule = tokens[colon + 1]
+    inputs = []
+    for token in tokens[colon + 2:]:
+        if token in ("||", "|@"):
+            break
+        if token != "|":
+            inputs.append(_unescape(token))
+    return outputs, rule, inputs
+
+
+def _iter_statements(manifest_path):
+    """产出 manifest 中每条非缩进语句 (续行已拼接)，并递归进入 include / subninja 的文件。"""
+    build_dir = os.path.dirname(manifest_path)
+    with open(manifest_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        pending = None
+        for line in f:
+            if pending is not None:
+                pending += line
+            elif line[:1] in (' ', '\t', '#', '\n', '\r', ''):
+                continue # 缩进的变量绑定、注释和空行与构建图无关
+            else:
+                pending = line
+            body = pending.rstrip('\r\n')
+            if (len(body) - len(body.rstrip('$'))) % 2 == 1:
+                continue # 续行
+            statement, pending = pending, None
+            if statement.startswith(("include ", "subninja ")):
+                included = _unescape(statement.split(None, 1)[1].strip())
+                yield from _iter_statements(os.path.join(build_dir, included))
+            elif statement.startswith("build "):
+                yield statement
+
+
+class NinjaGraph:
+    """build.ninja 的反向构建图。节点为 ninja 中的路径 (相对构建目录或绝对路径)。"""
+
+    def __init__(self, binary_dir):
+        self.binary_dir = binary_dir
+        self.consumers = {} # 输入节点 -> 以它为输入的边的编号列表
+        self.edges = [] # (输出列表, 规则名, 输入列表)
+        self.node_by_normalized_path = {}
+        for statement in _iter_statements(os.path.join(binary_dir, MANIFEST_NAME)):
+            parsed = parse_build_statement(statement)
+            if parsed is None:
+                continue
+            edge_id = len(self.edges)
+            self.edges.append(parsed)
+            for node in parsed[2]:
+                self.consumers.setdefault(node, []).append(edge_id)
+                self._remember(node)
+            for node in parsed[0]:
+                self._remember(node)
+
+    def _remember(self, node):
+        normalized = NinjaDepsReader.normalize_path(node, self.binary_dir)
+        self.node_by_normalized_path.setdefault(normalized, node)
+
+    def node_for_file(self, absolute_path):
+        return self.node_by_normalized_path.get(NinjaDepsReader.normalize_path(absolute_path, self.binary_dir))
+
+    def downstream(self, start_nodes):
+        """从 start_nodes 沿 输入 -> 输出 方向可达的全部节点 (包含起点)。"""
+        reached = set(start_nodes)
+        stack = list(start_nodes)
+        while stack:
+            node = stack.pop()
+            for edge_id in self.consumers.get(node, ()):
+                for output in self.edges[edge_id][0]:
+                    if output not in reached:
+                        reached.add(output)
+                        stack.append(output)
+        return reached
+
+    def target_aliases(self):
+        """CMake 目标名 -> 其 phony 别名指向的节点列表 (例如 app -> [bin/app])。"""
+        aliases = {}
+        for outputs, rule, inputs in self.edges:
+            if rule != "phony" or len(outputs) != 1 or not inputs:
+                continue
+            name = outputs[0]
+            if name in RESERVED_TARGET_NAMES or "/" in name or "\\" in name or name.endswith("/all"):
+                continue
+            aliases[name] = inputs
+        return aliases
+
+    def link_outputs(self):
+        """全部链接产物节点。"""
+        return {outputs[0] for outputs, rule, _ in self.edges if outputs and LINK_RULE_PATTERN.search(rule)}
+
+
+class AffectedResult:
+    def __init__(self):
+        self.everything = False # 配置文件有改动，需要完整构建
+        self.reason = ""
+        self.changed_files = [] # 改动的文件 (已去掉构建目录中的文件)
+        self.unmatched_files = [] # 不在构建图中的改动文件 (文档、新文件等)
+        self.targets = [] # 需要构建的最小目标集合 (目标名，或没有别名时的产物路径)
+        self.artifacts = set() # 受影响的链接产物节点
+        self.tests = None # 受影响的测试名；None 表示尚未查询 (见 find_affected_tests)
+
+
+def git_changed_files(project_dir, base=None):
+    """返回 base (默认上游分支，没有上游时为 HEAD) 与工作区之间改动过的文件 (绝对路径)，包括未跟踪的新文件。
+    base 为提交时与 HEAD 的合并基准比较，上游前进不会把别人的改动算进来。"""
+    def git(*args, cwd=project_dir):
+        result = subprocess.run(["git", *args], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            raise RuntimeError(f"git {' '.join(args)} 失败: {result.stderr.strip()}")
+        return result.stdout
+
+    root = git("rev-parse", "--show-toplevel").strip()
+    if base is None:
+        probe = subprocess.run(["git", "rev-parse", "--verify", "--quiet", "@{upstream}"], cwd=project_dir,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        base = "@{upstream}" if probe.returncode == 0 else "HEAD"
+    merge_base = git("merge-base", base, "HEAD").strip() if base != "HEAD" else "HEAD"
+    # 两者都在仓库根目录执行，输出的都是相对根目录的路径
+    names = git("diff", "--name-only", "--no-renames", merge_base, cwd=root).splitlines()
+    names += git("ls-files", "--others", "--exclude-standard", cwd=root).splitlines()
+    return sorted({os.path.normpath(os.path.join(root, name)) for name in names if name})
+
+
+def list_tests(binary_dir, ctest_exe="ctest"):
+    """ctest --show-only=json-v1 列出的测试: [(测试名, 命令列表), ...]。"""
+    result = subprocess.run([ctest_exe, "--show-only=json-v1"], cwd=binary_dir, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ctest --show-only 失败: {result.stderr.strip()}")
+    tests = json.loads(result.stdout).get("tests", [])
+    return [(test.get("name"), test.get("command") or []) for test in tests if test.get("name")]
+
+
+def _normalize_path(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+def drop_build_dir_files(changed_files, build_dirs):
+    """去掉位于 build_dirs 中任一目录下的文件。两边都解析符号链接，经由链接路径到达的构建目录文件同样被去掉。"""
+    prefixes = [_normalize_path(directory).rstrip(os.sep) + os.sep for directory in build_dirs]
+    return [path for path in changed_files
+            if not any(_normalize_path(path).startswith(prefix) for prefix in prefixes)]
+
+
+def compute_affected(binary_dir, changed_files, graph=None, deps_index=None, excluded_dirs=()):
+    """计算 changed_files (绝对路径) 影响的最小目标集合。测试用 find_affected_tests() 在构建之后查询。
+    graph / deps_index 可传入已加载的 NinjaGraph / DepsIndex (例如监听模式中复用)，为 None 时从构建目录加载。
+    binary_dir 和 excluded_dirs (例如其他预设的构建目录) 中的文件不算作改动。"""
+    binary_dir = os.path.abspath(binary_dir)
+    result = AffectedResult()
+    changed_files = drop_build_dir_files(changed_files, [binary_dir, *excluded_dirs])
+    result.changed_files = changed_files
+    configuration_files = [path for path in changed_files if CONFIGURATION_FILE_PATTERN.search(path.replace("\\", "/"))]
+    if configuration_files:
+        result.everything = True
+        result.reason = f"配置文件有改动: {', '.join(os.path.basename(path) for path in configuration_files[:3])}"
+        return result
+
+    if graph is None:
+        graph = NinjaGraph(binary_dir)
+    if deps_index is None and os.path.isfile(os.path.join(binary_dir, NinjaDepsReader.NINJA_DEPS_NAME)):
+        deps_index = NinjaDepsReader.load_deps_index(binary_dir)
+
+    start_nodes = set()
+    for path in changed_files:
+        matched = False
+        node = graph.node_for_file(path)
+        if node is not None:
+            start_nodes.add(node)
+            matched = True
+        if deps_index is not None:
+            # 头文件不在 build.ninja 中，由 .ninja_deps 记录的依赖找到包含它的目标文件
+            dependents = deps_index.dependents_of(path)
+            start_nodes.update(dependents)
+            matched = matched or bool(dependents)
+        if not matched:
+            result.unmatched_files.append(path)
+    if not start_nodes:
+        return result
+
+    affected_nodes = graph.downstream(start_nodes)
+    result.artifacts = graph.link_outputs() & affected_nodes
+
+    # 受影响的目标: phony 别名指向受影响产物的目标
+    candidates = {}
+    for name, alias_inputs in graph.target_aliases().items():
+        artifacts = [node for node in alias_inputs if node in result.artifacts]
+        if artifacts:
+            candidates[name] = artifacts
+    aliased = {node for artifacts in candidates.values() for node in artifacts}
+    for artifact in result.artifacts - aliased:
+        candidates[artifact] = [artifact]
+
+    # 最小集合: 产物会被另一个受影响目标的产物 (传递地) 使用的目标，构建后者时会顺带构建
+    selected = []
+    for name, artifacts in candidates.items():
+        reachable = graph.downstream(artifacts) - set(artifacts)
+        if not any(node in reachable for other, other_artifacts in candidates.items() if other != name for node in other_artifacts):
+            selected.append(name)
+    result.targets = sorted(selected)
+    return result
+
+
+def find_affected_tests(binary_dir, result, ctest_exe="ctest"):
+    """填充并返回 result.tests: 命令中用到受影响产物的测试。"""
+    binary_dir = os.path.abspath(binary_dir)
+    affected_paths = {NinjaDepsReader.normalize_path(node, binary_dir) for node in result.artifacts}
+    result.tests = []
+    if affected_paths:
+        for name, command in list_tests(binary_dir, ctest_exe):
+            if any(NinjaDepsReader.normalize_path(part, binary_dir) in affected_paths for part in command if part):
+                result.tests.append(name)
+    return result.tests
+
+
+def ctest_regex(test_names):
+    """只匹配这些测试名的 ctest -R 正则。"""
+    return "^(" + "|".join(re.escape(name) for name in test_names) + ")$"
+
+
+def print_affected(result):
+    if result.everything:
+        print(f"{YELLOW}{result.reason}，需要完整构建并运行全部测试。{RESET}")
+        return
+    print(f"{BLUE}改动文件 {len(result.changed_files)} 个，其中 {len(result.unmatched_files)} 个不在构建图中。{RESET}")
+    if not result.targets:
+        print(f"{GREEN}没有受影响的目标。{RESET}")
+        return
+    print(f"{BLUE}需要构建的目标 ({len(result.targets)}):{RESET} {' '.join(result.targets)}")
+    if result.tests is None:
+        return
+    if result.tests:
+        print(f"{BLUE}受影响的测试 ({len(result.tests)}):{RESET} {' '.join(result.tests)}")
+    else:
+        print(f"{YELLOW}没有受影响的测试。{RESET}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="根据 git diff 计算受影响的 CMake 目标和测试 (只计算，不构建)")
+    parser.add_argument("binary_dir", help="构建目录 (包含 build.ninja)")
+    parser.add_argument("--project-dir", default=".", help="git 仓库目录 (默认当前目录)")
+    parser.add_argument("--base", help="比较的基准提交 (默认上游分支，没有上游时为 HEAD，即只看未提交的改动)")
+    parser.add_argument("--changed", nargs="+", metavar="文件", help="直接给出改动的文件，不读取 git diff")
+    parser.add_argument("--exclude-dir", action="append", default=[], metavar="目录",
+                        help="其中的文件不算作改动 (可重复，例如其他预设的构建目录；binary_dir 本身总是排除)")
+    parser.add_argument("--no-tests", action="store_true", help="不查询 ctest (测试可执行文件尚未构建时 ctest 无法给出其命令)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join(args.binary_dir, MANIFEST_NAME)):
+        print(f"{RED}{args.binary_dir} 中没有 {MANIFEST_NAME} (需要 Ninja 生成器并已配置)。{RESET}")
+        return 1
+    try:
+        changed = [os.path.abspath(path) for path in args.changed] if args.changed else git_changed_files(args.project_dir, args.base)
+        result = compute_affected(args.binary_dir, changed, excluded_dirs=args.exclude_dir)
+        if not args.no_tests and not result.everything:
+            find_affected_tests(args.binary_dir, result)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"{RED}计算受影响的目标失败: {type(e).__name__}: {e}{RESET}")
+        return 1
+    if args.json:
+        print(json.dumps({"everything": result.everything, "targets": result.targets, "tests": result.tests,
+                          "unmatched_files": result.unmatched_files}, ensure_ascii=False, indent=2))
+    else:
+        print_affected(result)
+    return 0
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    sys.exit(main())
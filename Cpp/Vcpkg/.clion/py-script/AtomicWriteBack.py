@@ -0,0 +1,123 @@
+import os
+import json
+import stat
+import filecmp
+import tempfile
+
+# 被监听文件的原子写回与 "自身写入" 识别，ModifyCompileCommand.py 和 ModifyNinjaConfig.py 共用。
+#
+# 写回先写到同目录下的临时文件，再用 os.replace 一次性替换，clangd / ninja 不会读到写了一半的文件。
+# 替换后把结果文件的指纹 (大小、mtime、inode) 记录在旁边的 <文件名>.writeback.json 中。
+# 写回本身会再触发一次 Change New/Change Mod 事件，处理脚本先用 is_self_written() 比较 stat 结果与指纹，
+# 一致就说明文件仍是我们写出的版本，直接跳过，不需要重新读取和扫描整个文件。
+
+FINGERPRINT_SUFFIX = ".writeback.json"
+
+
+def fingerprint_path_for(path):
+    return path + FINGERPRINT_SUFFIX
+
+
+def _stat_fingerprint(stat_result):
+    return {"size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns, "inode": stat_result.st_ino}
+
+
+def record_fingerprint(path):
+    """记录 path 当前的指纹。写指纹失败不影响写回本身。"""
+    try:
+        fingerprint = _stat_fingerprint(os.stat(path))
+        with open(fingerprint_path_for(path), 'w', encoding='utf-8') as f:
+            json.dump(fingerprint, f)
+        return fingerprint
+    except OSError:
+        return None
+
+
+def load_fingerprint(path):
+    try:
+        with open(fingerprint_path_for(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_self_written(path):
+    """path 是否仍是上一次由本工具写回的版本 (只比较 stat 结果，不读取文件内容)。"""
+    fingerprint = load_fingerprint(path)
+    if not fingerprint:
+        return False
+    try:
+        current = _stat_fingerprint(os.stat(path))
+    except OSError:
+        return False
+    return all(fingerprint.get(key) == value for key, value in current.items())
+
+
+class AtomicFileWriter:
+    """以二进制方式写入目标文件同目录下的临时文件，commit() 时原子替换目标文件并记录指纹；
+    未 commit 就关闭 (包括发生异常) 时删除临时文件，目标文件保持不变。"""
+
+    def __init__(self, target_path):
+        self.target_path = target_path
+        directory = os.path.dirname(os.path.abspath(target_path))
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(target_path) + ".", suffix=".tmp")
+        self._file = os.fdopen(fd, 'wb')
+        self.bytes_written = 0
+        self.committed = False
+
+    def write(self, data):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def matches_target(self):
+        """已写入的内容是否与目标文件的当前内容逐字节相同。"""
+        self._file.flush()
+        try:
+            return os.path.getsize(self.target_path) == self.bytes_written and \
+                filecmp.cmp(self.temp_path, self.target_path, shallow=False)
+        except OSError:
+            return False
+
+    def commit(self, times_ns=None, record=True):
+        """替换目标文件。times_ns=(atime_ns, mtime_ns) 时把结果文件的时间戳设为该值。
+        record 为 True 时记录并返回指纹 (用于识别写回触发的事件)，否则返回 None。"""
+        self._file.close()
+        try:
+            # mkstemp 创建的文件权限是 0600，沿用原文件的权限；目标文件尚不存在时使用 umask 决定的默认权限
+            if os.path.exists(self.target_path):
+                mode = stat.S_IMODE(os.stat(self.target_path).st_mode)
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(self.temp_path, mode)
+        except OSError:
+            pass
+        if times_ns is not None:
+            os.utime(self.temp_path, ns=times_ns)
+        os.replace(self.temp_path, self.target_path)
+        self.committed = True
+        return record_fingerprint(self.target_path) if record else None
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.discard()
+        return False
+
+
+def atomic_write_text(path, text, encoding='utf-8', times_ns=None, record=True):
+    """原子地把 text 写入 path，record 为 True 时记录指纹。"""
+    with AtomicFileWriter(path) as writer:
+        writer.write(text.encode(encoding))
+        return writer.commit(times_ns, record)
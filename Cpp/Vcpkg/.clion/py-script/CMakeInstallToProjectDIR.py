@@ -1,14 +1,14 @@
-import json
 import os
 import platform
-import subprocess
 from pathlib import Path
 import shlex
-import re
 import sys
-import threading
 import shutil # For shutil.rmtree
 
+import AsyncProcessRunner
+import OutputColorizer
+import PresetResolver
+
 # --- ANSI Color Codes ---
 RED = "\033[91m"
 YELLOW = "\033[93m"
@@ -33,59 +33,14 @@ current_install_dir = None
 
 # --- Core Helper Functions (largely from previous cmake_helper.py) ---
 
-def color_line(line):
-    if re.search(r'\berror\b', line, re.IGNORECASE) or \
-            re.search(r'CMake Error', line) or \
-            re.search(r'ninja: error:', line, re.IGNORECASE): # Ninja specific error
-        return RED + line + RESET
-    elif re.search(r'\bwarning\b', line, re.IGNORECASE) or \
-            re.search(r'CMake Warning', line):
-        return YELLOW + line + RESET
-    return line
-
-def stream_output(stream, color_func):
-    try:
-        for line_str in iter(stream.readline, ''):
-            sys.stdout.write(color_func(line_str))
-            sys.stdout.flush()
-        stream.close()
-    except Exception as e:
-        sys.stdout.write(f"{RED}读取流时发生错误: {e}{RESET}\n")
-        sys.stdout.flush()
-
 def run_command_realtime_color(command_parts, env_vars, cwd_path=None, error_msg="命令执行失败"):
+    command_to_display = ' '.join(shlex.quote(str(part)) for part in command_parts)
+    print(f"\n{BLUE}▶️  执行命令:{RESET} {command_to_display}")
+    if cwd_path:
+        print(f"{BLUE}  (在目录:{RESET} {cwd_path})")
     try:
-        command_to_display = ' '.join(shlex.quote(str(part)) for part in command_parts)
-        print(f"\n{BLUE}▶️  执行命令:{RESET} {command_to_display}")
-        if cwd_path:
-            print(f"{BLUE}  (在目录:{RESET} {cwd_path})")
-
-        process = subprocess.Popen(
-            command_parts,
-            env=env_vars,
-            cwd=cwd_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            bufsize=1,
-            shell=False
-        )
-        stdout_thread = threading.Thread(target=stream_output, args=(process.stdout, color_line))
-        stderr_thread = threading.Thread(target=stream_output, args=(process.stderr, color_line))
-        stdout_thread.start()
-        stderr_thread.start()
-        stdout_thread.join()
-        stderr_thread.join()
-        return_code = process.wait()
-
-        if return_code == 0:
-            print(f"{GREEN}✅ 命令成功执行 (返回码: {return_code})。{RESET}")
-            return True
-        else:
-            print(f"{RED}❌ {error_msg} (返回码: {return_code})。{RESET}")
-            return False
+        result = AsyncProcessRunner.run(command_parts, env=env_vars, cwd=cwd_path,
+                                        sink=OutputColorizer.ColorizingSink(sys.stdout))
     except FileNotFoundError:
         print(f"{RED}❌ 错误: 命令 '{command_parts[0]}' 未找到。请确保它已安装并在系统 PATH 中。{RESET}")
         return False
@@ -93,18 +48,27 @@ def run_command_realtime_color(command_parts, env_vars, cwd_path=None, error_msg
         print(f"{RED}❌ 执行命令时发生未知错误: {e}{RESET}")
         return False
 
+    if result.timed_out:
+        print(f"{RED}❌ {error_msg} (超时，已终止)。{RESET}")
+        return False
+    if result.ok:
+        print(f"{GREEN}✅ 命令成功执行 (返回码: {result.returncode})。{RESET}")
+        return True
+    print(f"{RED}❌ {error_msg} (返回码: {result.returncode})。{RESET}")
+    return False
+
 def load_presets_data_global(p_dir_str):
     global presets_data, all_presets_map
     presets_file = Path(p_dir_str) / "CMakePresets.json"
     try:
-        with open(presets_file, 'r', encoding='utf-8') as f:
-            presets_data = json.load(f)
-            all_presets_map = get_all_presets_by_name_internal(presets_data) # Populate map
-            return True
+        # 包括 include 和 CMakeUserPresets.json，预设已展开继承、条件已计算 (见 PresetResolver.py)
+        presets_data = PresetResolver.load_presets(p_dir_str).presets_data
+        all_presets_map = get_all_presets_by_name_internal(presets_data) # Populate map
+        return True
     except FileNotFoundError:
         print(f"{RED}错误: CMakePresets.json 文件未在 '{presets_file}' 找到。{RESET}")
-    except json.JSONDecodeError:
-        print(f"{RED}错误: CMakePresets.json 文件 '{presets_file}' 格式无效。{RESET}")
+    except PresetResolver.PresetError as e:
+        print(f"{RED}错误: {e}{RESET}")
     except Exception as e:
         print(f"{RED}加载 CMakePresets.json 文件 '{presets_file}' 时发生错误: {e}{RESET}")
     presets_data = None
@@ -120,18 +84,9 @@ def get_current_os_name_global():
     else: current_os = system
     return current_os
 
-def is_preset_condition_met(preset, os_name):
-    if 'condition' not in preset: return True
-    condition = preset['condition']
-    if isinstance(condition, bool): return condition
-    if isinstance(condition, dict):
-        cond_type, cond_lhs, cond_rhs = condition.get('type'), condition.get('lhs'), condition.get('rhs')
-        if cond_lhs == '${hostSystemName}':
-            if cond_type == 'equals': return cond_rhs == os_name
-            if cond_type == 'notEquals': return cond_rhs != os_name
-        if cond_type == 'always': return True
-        if cond_type == 'never': return False
-    return False
+def is_preset_condition_met(preset):
+    # PresetResolver 已按当前主机把条件计算为布尔值
+    return preset.get('condition', True) is True
 
 def get_all_presets_by_name_internal(p_data):
     _all_presets = {}
@@ -141,45 +96,29 @@ def get_all_presets_by_name_internal(p_data):
                 _all_presets[preset['name']] = preset
     return _all_presets
 
-def is_preset_visible_and_valid(preset, os_name):
+def is_preset_visible_and_valid(preset):
     if preset.get('hidden', False): return False
-    return is_preset_condition_met(preset, os_name)
+    return is_preset_condition_met(preset)
 
-def get_visible_presets_by_type(preset_type_key, os_name):
+def get_visible_presets_by_type(preset_type_key):
     if not presets_data: return []
     visible_presets = []
     for preset in presets_data.get(preset_type_key, []):
-        if is_preset_visible_and_valid(preset, os_name):
+        if is_preset_visible_and_valid(preset):
             visible_presets.append(preset)
     return visible_presets
 
 def get_inherited_variable(preset_name, variable_name):
-    """Recursively search for a variable in a preset and its inherited presets."""
+    """Look up a variable in a preset, cacheVariables first, then top-level fields (e.g. binaryDir).
+    Presets are already resolved by PresetResolver, so inherited values are present on the preset itself."""
     if not all_presets_map or preset_name not in all_presets_map:
         return None
 
     current_preset = all_presets_map[preset_name]
-
-    # Check in current preset's cacheVariables
-    if "cacheVariables" in current_preset and variable_name in current_preset["cacheVariables"]:
-        return current_preset["cacheVariables"][variable_name]
-
-    # Check in current preset directly (for things like binaryDir, not in cacheVariables)
-    if variable_name in current_preset:
-        return current_preset[variable_name]
-
-    # Recurse up the inheritance chain (single inheritance for now)
-    inherits_from = current_preset.get("inherits")
-    if inherits_from:
-        if isinstance(inherits_from, list): # CMakePresets v4+ allows multiple inheritance
-            for inherited_preset_name in reversed(inherits_from): # Last one wins
-                val = get_inherited_variable(inherited_preset_name, variable_name)
-                if val is not None:
-                    return val
-        elif isinstance(inherits_from, str):
-            return get_inherited_variable(inherits_from, variable_name)
-
-    return None
+    cache_variables = current_preset.get("cacheVariables") or {}
+    if variable_name in cache_variables:
+        return cache_variables[variable_name]
+    return current_preset.get(variable_name)
 
 
 def display_menu_and_get_choice(options_list, prompt_message="请选择一个选项:"):
@@ -221,7 +160,7 @@ def do_cleanup(target_dir, dir_description):
 def handle_configure():
     global selected_configure_preset_name, selected_configure_preset_obj, current_build_dir, current_install_dir
 
-    visible_cfg_presets = get_visible_presets_by_type('configurePresets', current_os)
+    visible_cfg_presets = get_visible_presets_by_type('configurePresets')
     if not visible_cfg_presets:
         print(f"{YELLOW}对于操作系统 '{current_os}'，没有找到可见的配置预设。{RESET}")
         return False
@@ -296,7 +235,7 @@ def handle_build():
 
     # Filter build presets compatible with the selected configure preset
     compatible_build_presets = []
-    for bp in get_visible_presets_by_type('buildPresets', current_os):
+    for bp in get_visible_presets_by_type('buildPresets'):
         if bp.get('configurePreset') == selected_configure_preset_name:
             compatible_build_presets.append(bp)
 
@@ -356,7 +295,7 @@ def handle_clean_selected_build_dir():
 
 
 def handle_clean_any_build_dir(): # Similar to original cmake_helper
-    visible_cfg_presets = get_visible_presets_by_type('configurePresets', current_os)
+    visible_cfg_presets = get_visible_presets_by_type('configurePresets')
     if not visible_cfg_presets:
         print(f"{YELLOW}对于操作系统 '{current_os}'，没有找到可见的配置预设。{RESET}")
         return False
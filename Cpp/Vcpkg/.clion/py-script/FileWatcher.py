@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import struct
+import select
+import ctypes
+import ctypes.util
+from collections import namedtuple
+
+# 文件监听的公共实现: Linux 上通过 ctypes 直接调用 inotify (无需第三方依赖)，
+# 其他平台退化为按间隔 stat 轮询。WatchDispatcher.py 和 CMakeWorkflow.py 的监听模式共用。
+
+# --- inotify 常量 (见 <sys/inotify.h>) ---
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+# kind: "created" / "modified" / "deleted" / "overflow"
+FileEvent = namedtuple("FileEvent", ["path", "kind", "is_dir"])
+
+
+class InotifyWatcher:
+    """基于 inotify 的目录监听器。监听的是目录，事件中给出目录内被改动文件的完整路径。"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 失败: {os.strerror(errno)}")
+        self._dirs_by_wd = {}
+        self._wd_by_dir = {}
+
+    @staticmethod
+    def is_supported():
+        return sys.platform.startswith("linux") and bool(ctypes.util.find_library("c") or os.path.exists("/lib/libc.so.6"))
+
+    def add_directory(self, directory):
+        """开始监听 directory (非递归)。目录不存在或无法监听时返回 False。"""
+        directory = os.path.abspath(directory)
+        if directory in self._wd_by_dir:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            return False
+        self._dirs_by_wd[wd] = directory
+        self._wd_by_dir[directory] = wd
+        return True
+
+    def remove_directory(self, directory):
+        wd = self._wd_by_dir.pop(os.path.abspath(directory), None)
+        if wd is not None:
+            self._dirs_by_wd.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def watched_directories(self):
+        return list(self._wd_by_dir)
+
+    def read_events(self, timeout):
+        """等待最多 timeout 秒，返回期间收到的全部事件 (可能为空列表)。"""
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not readable:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                event = self._translate(wd, mask, name)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def _translate(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            return FileEvent(None, "overflow", False)
+        directory = self._dirs_by_wd.get(wd)
+        if mask & IN_IGNORED:
+            # 被监听的目录已删除 (或被移除监听)，清理映射以便之后重新添加
+            if directory is not None:
+                self._dirs_by_wd.pop(wd, None)
+                self._wd_by_dir.pop(directory, None)
+            return None
+        if directory is None:
+            return None
+        path = os.path.join(directory, os.fsdecode(name)) if name else directory
+        is_dir = bool(mask & IN_ISDIR)
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            return FileEvent(path, "created", is_dir)
+        if mask & (IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF | IN_MOVE_SELF):
+            return FileEvent(path, "deleted", is_dir)
+        if mask & (IN_MODIFY | IN_CLOSE_WRITE):
+            return FileEvent(path, "modified", is_dir)
+        return None
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """没有 inotify 的平台 (Windows / macOS) 上的退化实现: 每次调用时扫描被监听目录并比较 mtime/size。"""
+
+    def __init__(self):
+        self._snapshots = {}
+
+    @staticmethod
+    def _scan(directory):
+        snapshot = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        stat_result = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (stat_result.st_mtime_ns, stat_result.st_size, entry.is_dir(follow_symlinks=False))
+        except OSError:
+            return None
+        return snapshot
+
+    def add_directory(self, directory):
+        directory = os.path.abspath(directory)
+        if directory in self._snapshots:
+            return True
+        snapshot = self._scan(directory)
+        if snapshot is None:
+            return False
+        self._snapshots[directory] = snapshot
+        return True
+
+    def remove_directory(self, directory):
+        self._snapshots.pop(os.path.abspath(directory), None)
+
+    def watched_directories(self):
+        return list(self._snapshots)
+
+    def read_events(self, timeout):
+        time.sleep(max(0.0, timeout))
+        events = []
+        for directory, old_snapshot in list(self._snapshots.items()):
+            new_snapshot = self._scan(directory)
+            if new_snapshot is None:
+                del self._snapshots[directory]
+                events.append(FileEvent(directory, "deleted", True))
+                continue
+            for path, (mtime_ns, size, is_dir) in new_snapshot.items():
+                old = old_snapshot.get(path)
+                if old is None:
+                    events.append(FileEvent(path, "created", is_dir))
+                elif old[:2] != (mtime_ns, size) and not is_dir:
+                    events.append(FileEvent(path, "modified", is_dir))
+            for path, (_, _, is_dir) in old_snapshot.items():
+                if path not in new_snapshot:
+                    events.append(FileEvent(path, "deleted", is_dir))
+            self._snapshots[directory] = new_snapshot
+        return events
+
+    def close(self):
+        self._snapshots.clear()
+
+
+def create_watcher():
+    """优先返回 inotify 监听器，不可用时返回轮询监听器。"""
+    if InotifyWatcher.is_supported():
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass # 例如 inotify 实例数达到上限，或 libc 不提供 inotify 接口
+    return PollingWatcher()
+
+
+class Debouncer:
+    """按路径合并突发事件: 某个路径在 quiet_seconds 内没有新事件后才触发一次，
+    持续有事件时最多等待 max_wait_seconds，避免一直被推迟。"""
+
+    def __init__(self, quiet_seconds, max_wait_seconds):
+        self.quiet_seconds = quiet_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = {} # key -> [第一次事件时间, 最近一次事件时间, 合并后的值]
+
+    def add(self, key, value, merge=None, now=None):
+        """记录一次事件。merge(旧值, 新值) 决定合并后的值，默认保留最新值。"""
+        now = time.monotonic() if now is None else now
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = [now, now, value]
+        else:
+            pending[1] = now
+            pending[2] = merge(pending[2], value) if merge else value
+
+    def pop_ready(self, now=None):
+        """取出已经稳定 (或等待过久) 的条目，返回 [(key, 合并后的值), ...]。"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        for key, (first, last, value) in list(self._pending.items()):
+            if now - last >= self.quiet_seconds or now - first >= self.max_wait_seconds:
+                ready.append((key, value))
+                del self._pending[key]
+        return ready
+
+    def time_until_next(self, now=None, idle_timeout=1.0):
+        """距离下一个条目可能就绪的秒数；没有挂起条目时返回 idle_timeout。"""
+        if not self._pending:
+            return idle_timeout
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(min(last + self.quiet_seconds, first + self.max_wait_seconds) - now
+                            for first, last, _ in self._pending.values()))
+
+    def discard(self, key):
+        self._pending.pop(key, None)
+
+    def __bool__(self):
+        return bool(self._pending)
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import datetime
+
+# 改写脚本 (ModifyCompileCommand.py / ModifyNinjaConfig.py) 共用的结构化埋点。
+#
+# 通过环境变量 REWRITE_METRICS 开启: "stderr" 输出到标准错误，其他值视为 JSON Lines 文件路径 (追加写入)。
+# 未设置时 recorder() 返回 NullRecorder，所有方法都是空函数，消息也不会被格式化:
+#   - log_event(类型, 路径, 消息, *参数) 中的消息按 "消息 % 参数" 延迟格式化，也可以传入无参函数；
+#   - 热路径上需要额外计算的统计 (计时、长度等) 用 `if RECORDER.enabled:` 包起来。
+#
+# 输出的记录 (每行一个 JSON 对象，都带有 ts / script / pid / kind):
+#   kind=event   : 一条日志事件 (event、path、message)
+#   kind=summary : 一次处理的汇总 (计数器、分阶段耗时、每条规则的替换次数与耗时)，由 flush() 输出
+
+METRICS_SINK = os.environ.get("REWRITE_METRICS", "")
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullRecorder:
+    """埋点关闭时使用: 不格式化、不计时、不写出任何内容。"""
+    enabled = False
+
+    def __init__(self, script):
+        self.script = script
+
+    def event(self, event_type, path, message="", *args):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def add_time(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def add_rule_stats(self, rule_names, counts, seconds=None):
+        pass
+
+    def flush(self, **fields):
+        pass
+
+
+class _Timer:
+    __slots__ = ("recorder", "name", "started")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Recorder:
+    """埋点开启时使用: 事件立即写出，计数器和耗时在内存中累计，flush() 时写出一条汇总记录。"""
+    enabled = True
+
+    def __init__(self, script, sink):
+        self.script = script
+        self._sink = sink
+        self._reset()
+
+    def _reset(self):
+        self.counters = {}
+        self.timings = {}
+        self.rules = {}
+
+    def _write(self, kind, record):
+        line = {"ts": datetime.datetime.now().isoformat(timespec="milliseconds"), "script": self.script,
+                "pid": os.getpid(), "kind": kind}
+        line.update(record)
+        try:
+            self._sink.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+            self._sink.flush()
+        except (OSError, ValueError):
+            pass # 埋点失败不影响改写本身
+
+    def event(self, event_type, path, message="", *args):
+        if callable(message):
+            message = message()
+        elif args:
+            message = message % args
+        self._write("event", {"event": event_type, "path": path, "message": message})
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def timer(self, name):
+        """with recorder.timer("阶段名"): ... 把代码块的耗时累计到该阶段。"""
+        return _Timer(self, name)
+
+    def add_rule_stats(self, rule_names, counts, seconds=None):
+        """累计每条规则的替换次数；seconds (与 rule_names 对应的列表) 为各规则替换回调的耗时。"""
+        for index, name in enumerate(rule_names):
+            stats = self.rules.get(name)
+            if stats is None:
+                stats = self.rules[name] = {"replacements": 0, "seconds": 0.0}
+            stats["replacements"] += counts[index]
+            if seconds is not None:
+                stats["seconds"] += seconds[index]
+
+    def flush(self, **fields):
+        """写出一条汇总记录 (附带 fields) 并清空累计值。没有任何累计值且没有 fields 时不写出。"""
+        if not (self.counters or self.timings or self.rules or fields):
+            return
+        record = dict(fields)
+        record["counters"] = self.counters
+        record["timings"] = {name: round(seconds, 6) for name, seconds in self.timings.items()}
+        record["rules"] = {name: {"replacements": stats["replacements"], "seconds": round(stats["seconds"], 6)}
+                           for name, stats in self.rules.items()}
+        self._write("summary", record)
+        self._reset()
+
+
+_sink = None
+
+
+def _open_sink():
+    global _sink
+    if _sink is None:
+        if METRICS_SINK.lower() == "stderr":
+            _sink = sys.stderr
+        else:
+            directory = os.path.dirname(os.path.abspath(METRICS_SINK))
+            os.makedirs(directory, exist_ok=True)
+            # 追加模式: 多个进程 (例如并行改写的工作进程) 可以写入同一个文件，每条记录一次 write
+            _sink = open(METRICS_SINK, 'a', encoding='utf-8')
+    return _sink
+
+
+def recorder(script):
+    """返回 script 使用的埋点对象。REWRITE_METRICS 未设置或输出目标无法打开时返回 NullRecorder。"""
+    if not METRICS_SINK:
+        return NullRecorder(script)
+    try:
+        return Recorder(script, _open_sink())
+    except OSError as e:
+        print(f"无法打开埋点输出 {METRICS_SINK}: {e}", file=sys.stderr)
+        return NullRecorder(script)
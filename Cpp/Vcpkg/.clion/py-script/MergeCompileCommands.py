@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+import argparse
+import platform
+
+import AtomicWriteBack
+import ModifyCompileCommand
+
+# 把多个构建配置 (Debug / Release / RelWithDebInfo 等) 各自的 compile_commands.json 合并为一个，供 clangd 使用。
+#
+# 按优先级依次流式读取各个数据库: 某个源文件只要在更高优先级的数据库中出现过，低优先级数据库中它的条目就被丢弃；
+# 同一数据库中同一源文件的多个条目 (例如被多个目标编译) 全部保留。保留的条目在同一遍中经过
+# ModifyCompileCommand.py 的改写规则 (以及条目缓存、多进程改写)，直接写入输出文件。
+# 内存中只保留当前条目和已出现过的源文件路径集合，与命令行的长度和条目总数无关。
+#
+# 用法:
+#   python MergeCompileCommands.py -o build/compile_commands.json --prefer Debug,RelWithDebInfo,Release \
+#       Debug=build-debug/compile_commands.json Release=build-release/compile_commands.json
+# 未写 "标签=" 时，标签取 compile_commands.<标签>.json 中的 <标签>，否则取所在目录名。
+# CMakePresetsGenerator.py 生成的预设共用同一个 binaryDir，可在每次配置后用 --snapshot 把当前数据库
+# 另存为 compile_commands.<预设>.json，再把这些快照合并。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+DEFAULT_PRIORITY = ["Debug", "RelWithDebInfo", "Release", "MinSizeRel"] # 同一源文件优先保留哪个配置的条目
+SNAPSHOT_NAME_PATTERN = re.compile(r'^compile_commands\.([^.]+)\.json$') # 排除 compile_commands.json.index.json 等旁路文件
+
+
+class DatabaseInput:
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path
+        self.kept = 0
+        self.dropped = 0
+
+
+def parse_input_spec(spec):
+    """解析 "标签=路径" 或 "路径"。"""
+    label, separator, path = spec.partition("=")
+    if separator and label and not os.path.exists(spec):
+        return DatabaseInput(label, path)
+    path = spec
+    match = SNAPSHOT_NAME_PATTERN.match(os.path.basename(path))
+    if match:
+        return DatabaseInput(match.group(1), path)
+    return DatabaseInput(os.path.basename(os.path.dirname(os.path.abspath(path))), path)
+
+
+def order_by_priority(inputs, priority):
+    """按 priority 中第一个 (不区分大小写地) 出现在标签里的名字排序；都不匹配的输入按原顺序排在最后。"""
+    lowered = [name.lower() for name in priority]
+
+    def rank(item):
+        position, database = item
+        label = database.label.lower()
+        for index, name in enumerate(lowered):
+            if label == name or name in label:
+                return (index, position)
+        return (len(lowered), position)
+
+    return [database for _, database in sorted(enumerate(inputs), key=rank)]
+
+
+def iter_merged_entries(inputs):
+    """依次流式读取各数据库，跳过已被更高优先级数据库覆盖的源文件，产出保留的条目。"""
+    claimed = set() # 更高优先级数据库中出现过的源文件
+    for database in inputs:
+        seen_here = set()
+        with open(database.path, 'r', encoding='utf-8') as f_read:
+            for entry in ModifyCompileCommand.iter_compile_commands_entries(f_read):
+                source_key = ModifyCompileCommand.compile_command_entry_source_key(entry)
+                if source_key is not None and source_key in claimed:
+                    database.dropped += 1
+                    continue
+                if source_key is not None:
+                    seen_here.add(source_key)
+                database.kept += 1
+                yield entry
+        claimed |= seen_here
+
+
+def merge_compile_commands(inputs, output_path, use_cache=True, entry_filter=None):
+    """合并 inputs (已按优先级排序) 到 output_path。返回 (条目总数, 被改写的条目数, 被过滤掉的条目数)。
+
+    entry_filter (ModifyCompileCommand.CompileCommandEntryFilter) 在去重之后、改写之前丢弃条目。
+    """
+    cache = ModifyCompileCommand.CompileCommandsRewriteCache.for_database(output_path) \
+        if use_cache and ModifyCompileCommand.ENTRY_CACHE_ENABLED else None
+    index = {} if ModifyCompileCommand.INDEX_ENABLED else None
+    parallel = ModifyCompileCommand.should_rewrite_in_parallel(sum(os.path.getsize(d.path) for d in inputs))
+    entry_count = 0
+    filter_stats = {"dropped": 0}
+    entries = iter_merged_entries(inputs)
+    if entry_filter is not None:
+        entries = entry_filter.apply(entries, filter_stats)
+    try:
+        # 输出可以与某个输入是同一个文件: 先写临时文件，全部读完后再原子替换
+        with AtomicWriteBack.AtomicFileWriter(output_path) as writer:
+            entry_count, changed_count, _ = ModifyCompileCommand.write_rewritten_entries(
+                entries, writer, cache, parallel, index)
+            # 记录写回指纹: 监听 compile_commands.json 的改写脚本收到这次写入的事件时会直接跳过
+            writer.commit()
+        if index is not None:
+            ModifyCompileCommand.write_compile_commands_index(output_path, index)
+    finally:
+        if cache is not None:
+            cache.close(entry_count)
+    return entry_count, changed_count, filter_stats["dropped"]
+
+
+def snapshot_database(database_path, label):
+    """把 database_path 另存为同目录下的 compile_commands.<label>.json，返回快照路径。"""
+    snapshot_path = os.path.join(os.path.dirname(os.path.abspath(database_path)), f"compile_commands.{label}.json")
+    with open(database_path, 'rb') as source, AtomicWriteBack.AtomicFileWriter(snapshot_path) as writer:
+        while True:
+            chunk = source.read(1 << 20)
+            if not chunk:
+                break
+            writer.write(chunk)
+        writer.commit(record=False)
+    return snapshot_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按优先级流式合并多个 compile_commands.json，并应用 ModifyCompileCommand.py 的改写规则")
+    parser.add_argument("inputs", nargs="*", metavar="[标签=]路径", help="要合并的编译数据库")
+    parser.add_argument("-o", "--output", help="合并结果的输出路径")
+    parser.add_argument("--prefer", default=",".join(DEFAULT_PRIORITY),
+                        help=f"逗号分隔的标签优先级，同一源文件保留最靠前的配置的条目 (默认 {','.join(DEFAULT_PRIORITY)})")
+    parser.add_argument("--snapshot", nargs=2, metavar=("数据库", "标签"),
+                        help="先把 数据库 另存为 compile_commands.<标签>.json (用于共用 binaryDir 的预设)")
+    parser.add_argument("--merge-snapshots", action="store_true",
+                        help="把 --output 所在目录下的全部 compile_commands.<标签>.json 快照加入输入")
+    parser.add_argument("--no-cache", action="store_true", help="不使用条目级改写缓存")
+    parser.add_argument("--filter", action="store_true", default=ModifyCompileCommand.FILTER_ENABLED,
+                        help="按 ModifyCompileCommand.py 的项目范围过滤规则丢弃第三方 / 生成代码的条目 (COMPILE_COMMANDS_FILTER=1 时默认开启)")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot_path = snapshot_database(*args.snapshot)
+        print(f"{BLUE}已保存快照: {snapshot_path}{RESET}")
+        if not args.output:
+            return 0
+    if not args.output:
+        parser.error("需要指定 --output")
+
+    inputs = [parse_input_spec(spec) for spec in args.inputs]
+    if args.merge_snapshots:
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        known = {os.path.abspath(database.path) for database in inputs}
+        for name in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, name)
+            if SNAPSHOT_NAME_PATTERN.match(name) and os.path.abspath(path) not in known:
+                inputs.append(parse_input_spec(path))
+    missing = [database.path for database in inputs if not os.path.isfile(database.path)]
+    if missing:
+        print(f"{RED}找不到编译数据库: {', '.join(missing)}{RESET}")
+        return 1
+    if not inputs:
+        print(f"{RED}没有可合并的编译数据库。{RESET}")
+        return 1
+
+    inputs = order_by_priority(inputs, [name for name in args.prefer.split(",") if name])
+    try:
+        entry_filter = ModifyCompileCommand.COMPILE_COMMAND_ENTRY_FILTER if args.filter else None
+        entry_count, changed_count, dropped_count = merge_compile_commands(
+            inputs, args.output, use_cache=not args.no_cache, entry_filter=entry_filter)
+    except (OSError, ValueError) as e:
+        print(f"{RED}合并失败: {type(e).__name__}: {e}{RESET}")
+        return 1
+
+    for database in inputs:
+        print(f"  [{database.label}] {database.path}: 保留 {database.kept}，被更高优先级覆盖 {database.dropped}")
+    if args.filter:
+        print(f"{YELLOW}项目范围过滤丢弃了 {dropped_count} 个条目。{RESET}")
+    print(f"{GREEN}已写入 {args.output}: {entry_count} 个条目，其中 {changed_count} 个经过规则改写。{RESET}")
+    return 0
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import struct
+import argparse
+import platform
+
+import AtomicWriteBack
+import NinjaLogAnalyzer
+
+# 读取 ninja 的二进制依赖日志 .ninja_deps (纯 Python)，建立 "头文件 -> 依赖它的目标文件" 的反向索引，回答
+# "改动这个头文件会重新编译多少个目标文件"，并按重新编译的扇出 (以 .ninja_log 中的编译耗时加权) 列出热点头文件:
+#   python NinjaDepsReader.py build/ [--top 20] [--under src] [--header include/foo/bar.h]
+#
+# .ninja_deps 格式 (v3 / v4，小端):
+#   文件头 "# ninjadeps\n" + int32 版本号，之后是连续的记录，每条记录以 uint32 长度开头:
+#   - 最高位为 0: 路径记录 = 路径 (用 \0 补齐到 4 字节) + uint32 校验值 (~节点编号)，节点编号按出现顺序从 0 递增
+#   - 最高位为 1: 依赖记录 = int32 输出节点 + mtime (v4 为 8 字节，v3 为 4 字节) + int32 依赖节点...
+#   同一输出的后一条依赖记录覆盖前一条。文件末尾被截断或校验失败的记录 (ninja 被中断时) 及其后的内容被忽略。
+#
+# 反向索引按 .ninja_deps 的大小和 mtime 缓存在 <构建目录>/.ninja_deps.index.json，依赖日志不变时不再解析。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+NINJA_DEPS_NAME = ".ninja_deps"
+DEPS_SIGNATURE = b"# ninjadeps\n"
+SUPPORTED_DEPS_VERSIONS = (3, 4)
+MAX_RECORD_SIZE = (1 << 19) - 1 # 与 ninja 的 kMaxRecordSize 一致，超过说明文件已损坏
+INDEX_CACHE_NAME = ".ninja_deps.index.json"
+INDEX_CACHE_VERSION = 1
+# 依赖中的这些文件是翻译单元本身 (gcc / clang 的 depfile 会列出源文件)，不计入头文件
+SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx", ".c++", ".m", ".mm", ".cu", ".ixx", ".cppm")
+DEFAULT_TOP_COUNT = 20
+
+_UINT32 = struct.Struct("<I")
+_INT32 = struct.Struct("<i")
+
+
+def read_ninja_deps(deps_path):
+    """解析 .ninja_deps。返回 (路径列表, {输出节点编号: 依赖节点编号元组})。"""
+    with open(deps_path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(DEPS_SIGNATURE) or len(data) < len(DEPS_SIGNATURE) + 4:
+        raise ValueError(f"不是 ninja 依赖日志: {deps_path}")
+    version = _INT32.unpack_from(data, len(DEPS_SIGNATURE))[0]
+    if version not in SUPPORTED_DEPS_VERSIONS:
+        raise ValueError(f"不支持的 .ninja_deps 版本: {version} ({deps_path})")
+    mtime_size = 8 if version >= 4 else 4
+
+    paths = []
+    deps = {}
+    offset = len(DEPS_SIGNATURE) + 4
+    end = len(data)
+    while offset + 4 <= end:
+        size = _UINT32.unpack_from(data, offset)[0]
+        is_deps = bool(size & 0x80000000)
+        size &= 0x7FFFFFFF
+        body = offset + 4
+        if size > MAX_RECORD_SIZE or body + size > end or size % 4 != 0:
+            break # 截断或损坏的记录
+        if is_deps:
+            if size < 4 + mtime_size:
+                break
+            out_id = _INT32.unpack_from(data, body)[0]
+            count = (size - 4 - mtime_size) // 4
+            dep_ids = struct.unpack_from(f"<{count}i", data, body + 4 + mtime_size) if count else ()
+            if not 0 <= out_id < len(paths) or (dep_ids and not 0 <= min(dep_ids) <= max(dep_ids) < len(paths)):
+                break
+            deps[out_id] = dep_ids
+        else:
+            if size < 4:
+                break
+            checksum = _UINT32.unpack_from(data, body + size - 4)[0]
+            if checksum != (~len(paths)) & 0xFFFFFFFF:
+                break
+            raw_path = data[body:body + size - 4].rstrip(b"\0")
+            paths.append(raw_path.decode('utf-8', 'surrogateescape'))
+        offset = body + size
+    return paths, deps
+
+
+def is_translation_unit(path):
+    return path.lower().endswith(SOURCE_EXTENSIONS)
+
+
+def normalize_path(path, base_dir):
+    """相对路径按 base_dir 解析，统一为小写、'/' 分隔的绝对路径，用于比较。"""
+    return os.path.normpath(os.path.join(base_dir, path)).replace("\\", "/").lower()
+
+
+class DepsIndex:
+    """反向依赖索引: headers[头文件] = 依赖它的输出 (目标文件) 列表。路径与 .ninja_deps 中一致 (相对构建目录或绝对路径)。"""
+
+    def __init__(self, binary_dir, headers, output_count):
+        self.binary_dir = binary_dir
+        self.headers = headers
+        self.output_count = output_count
+
+    @classmethod
+    def from_deps(cls, binary_dir, paths, deps):
+        headers = {}
+        for out_id, dep_ids in deps.items():
+            output = paths[out_id]
+            for dep_id in set(dep_ids):
+                header = paths[dep_id]
+                if is_translation_unit(header):
+                    continue
+                dependents = headers.get(header)
+                if dependents is None:
+                    dependents = headers[header] = []
+                dependents.append(output)
+        return cls(binary_dir, headers, len(deps))
+
+    def dependents_of(self, header):
+        """依赖 header 的输出列表。header 可以是 .ninja_deps 中的原样路径，也可以是 (相对当前目录的) 指向同一文件的路径。"""
+        if header in self.headers:
+            return self.headers[header]
+        wanted = normalize_path(header, os.getcwd())
+        for candidate, dependents in self.headers.items():
+            if normalize_path(candidate, self.binary_dir) == wanted:
+                return dependents
+        return []
+
+
+def load_deps_index(binary_dir, use_cache=True):
+    """读取 binary_dir/.ninja_deps 的反向索引。缓存的大小和 mtime 与依赖日志一致时直接使用缓存。"""
+    deps_path = os.path.join(binary_dir, NINJA_DEPS_NAME)
+    stat_result = os.stat(deps_path)
+    cache_path = os.path.join(binary_dir, INDEX_CACHE_NAME)
+    if use_cache:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            if payload.get("version") == INDEX_CACHE_VERSION and payload.get("size") == stat_result.st_size \
+                    and payload.get("mtime_ns") == stat_result.st_mtime_ns:
+                # 缓存中的输出用编号引用 outputs 列表，避免每个头文件重复存储完整路径
+                outputs = payload["outputs"]
+                headers = {header: [outputs[i] for i in output_ids] for header, output_ids in payload["headers"].items()}
+                return DepsIndex(binary_dir, headers, payload["output_count"])
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            pass
+
+    paths, deps = read_ninja_deps(deps_path)
+    index = DepsIndex.from_deps(binary_dir, paths, deps)
+    if use_cache:
+        outputs = sorted({output for dependents in index.headers.values() for output in dependents})
+        output_ids = {output: i for i, output in enumerate(outputs)}
+        payload = {"version": INDEX_CACHE_VERSION, "size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns,
+                   "output_count": index.output_count, "outputs": outputs,
+                   "headers": {header: [output_ids[output] for output in dependents] for header, dependents in index.headers.items()}}
+        try:
+            AtomicWriteBack.atomic_write_text(cache_path, json.dumps(payload, ensure_ascii=False, separators=(',', ':')), record=False)
+        except OSError:
+            pass # 缓存写不进去不影响结果
+    return index
+
+
+def load_compile_times(binary_dir):
+    """从 .ninja_log 读取每个输出最近一次的耗时 (毫秒)。没有日志时返回空字典。"""
+    return NinjaLogAnalyzer.latest_durations(binary_dir)
+
+
+def rank_headers(index, compile_times, under=None):
+    """返回 [(头文件, 依赖的输出数, 重新编译这些输出的总耗时毫秒), ...]，按总耗时 (没有耗时数据时按输出数) 从大到小排列。
+    under 为目录列表 (相对当前目录或绝对路径) 时只保留其下的头文件。"""
+    prefixes = None
+    if under:
+        prefixes = [normalize_path(prefix, os.getcwd()).rstrip("/") + "/" for prefix in under]
+    ranked = []
+    for header, dependents in index.headers.items():
+        if prefixes is not None:
+            normalized = normalize_path(header, index.binary_dir)
+            if not any(normalized.startswith(prefix) for prefix in prefixes):
+                continue
+        cost_ms = sum(compile_times.get(output, 0) for output in dependents)
+        ranked.append((header, len(dependents), cost_ms))
+    if compile_times:
+        ranked.sort(key=lambda item: (item[2], item[1]), reverse=True)
+    else:
+        ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked
+
+
+def _format_ms(milliseconds):
+    return f"{milliseconds / 1000:.1f}s"
+
+
+def print_hotspot_report(binary_dir, top=DEFAULT_TOP_COUNT, under=None, use_cache=True):
+    index = load_deps_index(binary_dir, use_cache)
+    compile_times = load_compile_times(binary_dir)
+    ranked = rank_headers(index, compile_times, under)
+    weighted = bool(compile_times)
+    print(f"{BLUE}{binary_dir}: {index.output_count} 个输出，{len(index.headers)} 个被依赖的头文件。{RESET}")
+    if not weighted:
+        print(f"{YELLOW}没有可用的 .ninja_log，按依赖的输出数排序。{RESET}")
+    print(f"{BLUE}重新编译代价最大的 {min(top, len(ranked))} 个头文件:{RESET}")
+    for header, dependent_count, cost_ms in ranked[:top]:
+        cost = f"{_format_ms(cost_ms):>9}  " if weighted else ""
+        print(f"  {cost}{dependent_count:>6} 个输出  {header}")
+
+
+def print_header_impact(binary_dir, header, use_cache=True, top=DEFAULT_TOP_COUNT):
+    index = load_deps_index(binary_dir, use_cache)
+    dependents = index.dependents_of(header)
+    if not dependents:
+        print(f"{YELLOW}.ninja_deps 中没有依赖 '{header}' 的输出 (路径不对，或尚未构建过)。{RESET}")
+        return
+    compile_times = load_compile_times(binary_dir)
+    cost_ms = sum(compile_times.get(output, 0) for output in dependents)
+    print(f"{BLUE}改动 {header} 会重新编译 {len(dependents)} 个输出" +
+          (f"，按上次的耗时约 {_format_ms(cost_ms)} (串行累计)" if compile_times else "") + f"。{RESET}")
+    for output in sorted(dependents, key=lambda output: compile_times.get(output, 0), reverse=True)[:top]:
+        duration = compile_times.get(output)
+        print(f"  {_format_ms(duration) if duration is not None else '?':>7}  {output}")
+    if len(dependents) > top:
+        print(f"  ... 另有 {len(dependents) - top} 个")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="读取 .ninja_deps，报告头文件的重新编译扇出")
+    parser.add_argument("binary_dir", help="构建目录 (包含 .ninja_deps)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_COUNT, help=f"显示的行数 (默认 {DEFAULT_TOP_COUNT})")
+    parser.add_argument("--under", action="append", metavar="前缀",
+                        help="只统计该目录下的头文件 (可重复，例如项目的源码目录)，排除系统和第三方头文件")
+    parser.add_argument("--header", help="只报告改动该头文件会重新编译哪些输出")
+    parser.add_argument("--no-cache", action="store_true", help=f"不读写 {INDEX_CACHE_NAME}")
+    args = parser.parse_args()
+
+    binary_dir = os.path.abspath(args.binary_dir)
+    if not os.path.isfile(os.path.join(binary_dir, NINJA_DEPS_NAME)):
+        print(f"{RED}未找到 {os.path.join(binary_dir, NINJA_DEPS_NAME)} (需要 Ninja 生成器并至少构建过一次)。{RESET}")
+        return 1
+    try:
+        if args.header:
+            print_header_impact(binary_dir, args.header, not args.no_cache, args.top)
+        else:
+            print_hotspot_report(binary_dir, args.top, args.under, not args.no_cache)
+    except (OSError, ValueError) as e:
+        print(f"{RED}读取依赖日志失败: {type(e).__name__}: {e}{RESET}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    sys.exit(main())
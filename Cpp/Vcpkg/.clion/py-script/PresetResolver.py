@@ -0,0 +1,359 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import platform
+
+import AtomicWriteBack
+
+# CMake 预设的加载与解析，CMakeWorkflow.py 和 CMakeInstallToProjectDIR.py 共用:
+#   - 读取 CMakePresets.json 以及 (存在时) CMakeUserPresets.json，递归展开两者的 "include" (用户预设隐式包含 CMakePresets.json)；
+#   - 按 CMake 的规则展开 "inherits": 自身的字段优先，其次按 inherits 列表的顺序 (靠前的父预设优先)，
+#     cacheVariables / environment 按键合并；name、hidden、inherits、description、displayName 不继承；
+#   - 计算 "condition" (const、equals、notEquals、inList、notInList、matches、notMatches、anyOf、allOf、not)，
+#     结果以布尔值写回预设的 "condition" 字段；
+#   - 每个预设的继承结果和条件结果都只计算一次 (按 (类型, 名称) 记忆)。
+# 解析结果缓存在 CMAKE_PRESETS_CACHE_DIR (默认 ~/.cache/cmake-presets) 中，以参与解析的所有文件的 mtime / 大小、
+# 主机系统名以及条件中引用的环境变量为键；这些都没变时直接读取缓存，不再解析 JSON 和继承链。
+#
+# 用法:
+#   graph = PresetResolver.load_presets(project_dir)
+#   graph.presets_data["buildPresets"]     # 与 CMakePresets.json 结构相同，其中的预设已展开继承
+#   graph.get("configurePresets", "dev")   # 单个预设
+#   python PresetResolver.py <项目目录> [--show 预设名] [--no-cache]
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+PRESETS_FILE_NAME = "CMakePresets.json"
+USER_PRESETS_FILE_NAME = "CMakeUserPresets.json"
+PRESET_TYPE_KEYS = ['configurePresets', 'buildPresets', 'testPresets', 'packagePresets', 'workflowPresets']
+NOT_INHERITED_FIELDS = {"name", "hidden", "inherits", "description", "displayName"}
+MERGED_FIELDS = {"cacheVariables", "environment"}
+CACHE_VERSION = 1
+CACHE_DIR = os.environ.get("CMAKE_PRESETS_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "cmake-presets")
+MACRO_PATTERN = re.compile(r'\$(env|penv|vendor)?\{([^}]*)\}')
+
+
+class PresetError(ValueError):
+    """预设文件无法读取、格式无效或继承关系有误。"""
+
+
+def host_system_name():
+    """与 CMake 的 ${hostSystemName} 一致: Windows、Linux、Darwin 等。"""
+    return platform.system()
+
+
+def _file_stamp(path):
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return [path, None, None] # 文件不存在也要记录: 之后创建 CMakeUserPresets.json 时缓存应失效
+    return [path, stat_result.st_mtime_ns, stat_result.st_size]
+
+
+class PresetGraph:
+    """一个项目完整的预设集合。presets_data 与 CMakePresets.json 结构相同 (键为 PRESET_TYPE_KEYS)，
+    其中每个预设都已展开继承、条件已计算为布尔值；source_files 记录每个预设来自哪个文件。"""
+
+    def __init__(self, project_dir, host=None):
+        self.project_dir = os.path.abspath(str(project_dir))
+        self.host = host or host_system_name()
+        self.files = [] # [[路径, mtime_ns, 大小], ...]，参与解析的所有文件 (包括不存在的用户预设文件)
+        self.env_used = {} # 条件中读取的进程环境变量 {名称: 值或 None}
+        self.raw = {type_key: {} for type_key in PRESET_TYPE_KEYS} # 类型 -> {名称: 原始预设}，按文件中的顺序
+        self.source_files = {type_key: {} for type_key in PRESET_TYPE_KEYS}
+        self.presets_data = {}
+        self._resolved = {} # (类型, 名称) -> 展开继承后的预设 (condition 保持原样，子预设继承的是未计算的条件)
+        self._final = {} # (类型, 名称) -> 展开继承且条件已计算的预设
+
+    # --- 读取 ---
+
+    def load(self):
+        presets_path = os.path.join(self.project_dir, PRESETS_FILE_NAME)
+        user_presets_path = os.path.join(self.project_dir, USER_PRESETS_FILE_NAME)
+        if not os.path.isfile(presets_path):
+            raise FileNotFoundError(presets_path)
+        loaded = set()
+        self._load_file(presets_path, loaded, [])
+        # 用户预设隐式包含 CMakePresets.json，已经读过的文件不会重复读取
+        self._load_file(user_presets_path, loaded, [], optional=True)
+        for type_key in PRESET_TYPE_KEYS:
+            self.presets_data[type_key] = [self._resolve_with_condition(type_key, name) for name in self.raw[type_key]]
+        return self
+
+    def _load_file(self, path, loaded, include_stack, optional=False):
+        path = os.path.normpath(os.path.abspath(path))
+        if path in include_stack:
+            raise PresetError(f"预设文件循环包含: {' -> '.join(include_stack + [path])}")
+        if path in loaded:
+            return
+        loaded.add(path)
+        self.files.append(_file_stamp(path))
+        if optional and not os.path.isfile(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise PresetError(f"找不到被包含的预设文件 '{path}'。")
+        except ValueError as e:
+            raise PresetError(f"预设文件 '{path}' 格式无效: {e}")
+        if not isinstance(data, dict):
+            raise PresetError(f"预设文件 '{path}' 格式无效: 顶层不是对象。")
+        base_dir = os.path.dirname(path)
+        for include in data.get("include", []):
+            include_path = self._expand_file_macros(include, base_dir)
+            if not os.path.isabs(include_path):
+                include_path = os.path.join(base_dir, include_path)
+            self._load_file(include_path, loaded, include_stack + [path])
+        for type_key in PRESET_TYPE_KEYS:
+            for preset in data.get(type_key, []):
+                name = preset.get('name') if isinstance(preset, dict) else None
+                if not name:
+                    continue
+                if name in self.raw[type_key]:
+                    raise PresetError(f"{type_key} 中的预设 '{name}' 重复定义 "
+                                      f"({self.source_files[type_key][name]} 和 {path})。")
+                self.raw[type_key][name] = preset
+                self.source_files[type_key][name] = path
+
+    def _expand_file_macros(self, value, file_dir):
+        # include 中只允许 ${sourceDir} 等与预设无关的宏
+        return self.expand(value, preset_name="", file_dir=file_dir)
+
+    # --- 继承 ---
+
+    def _resolve(self, type_key, name, chain=()):
+        key = (type_key, name)
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            return resolved
+        if name in chain:
+            raise PresetError(f"{type_key} 中的预设继承关系存在循环: {' -> '.join(chain + (name,))}")
+        preset = self.raw[type_key].get(name)
+        if preset is None:
+            raise PresetError(f"{type_key} 中找不到被继承的预设 '{name}'。")
+        resolved = dict(preset)
+        inherits = preset.get('inherits', [])
+        for parent_name in [inherits] if isinstance(inherits, str) else inherits:
+            parent = self._resolve(type_key, parent_name, chain + (name,))
+            for field, value in parent.items():
+                if field in NOT_INHERITED_FIELDS:
+                    continue
+                if field in MERGED_FIELDS and isinstance(value, dict):
+                    # 自身和靠前的父预设中已有的键优先
+                    merged = dict(value)
+                    merged.update(resolved.get(field) or {})
+                    resolved[field] = merged
+                elif field not in resolved:
+                    resolved[field] = value
+        self._resolved[key] = resolved
+        return resolved
+
+    def _resolve_with_condition(self, type_key, name):
+        key = (type_key, name)
+        final = self._final.get(key)
+        if final is None:
+            final = self._resolve(type_key, name)
+            if 'condition' in final and not isinstance(final['condition'], bool):
+                # 条件中的 ${presetName} 等宏按当前预设展开，因此对每个预设分别计算
+                final = dict(final, condition=self.evaluate_condition(final['condition'], final))
+            self._final[key] = final
+        return final
+
+    # --- 宏与条件 ---
+
+    def expand(self, value, preset=None, preset_name=None, file_dir=None):
+        """展开 ${sourceDir}、${presetName}、$env{X} 等宏 (不支持的宏原样保留)。"""
+        if not isinstance(value, str) or "$" not in value:
+            return value
+        preset = preset or {}
+        source_dir = self.project_dir.replace("\\", "/")
+        macros = {
+            "sourceDir": source_dir,
+            "sourceParentDir": os.path.dirname(source_dir),
+            "sourceDirName": os.path.basename(source_dir),
+            "presetName": preset.get("name", "") if preset_name is None else preset_name,
+            "generator": preset.get("generator", ""),
+            "hostSystemName": self.host,
+            "fileDir": (file_dir or "").replace("\\", "/"),
+            "dollar": "$",
+            "pathListSep": ";" if self.host == "Windows" else ":",
+        }
+
+        def replace(match):
+            namespace, name = match.group(1), match.group(2)
+            if namespace is None:
+                return macros.get(name, match.group(0))
+            if namespace == "vendor":
+                return match.group(0)
+            if namespace == "env" and name in (preset.get("environment") or {}):
+                env_value = preset["environment"][name]
+                return "" if env_value is None else str(env_value)
+            self.env_used[name] = os.environ.get(name)
+            return os.environ.get(name, "")
+
+        return MACRO_PATTERN.sub(replace, value)
+
+    def evaluate_condition(self, condition, preset):
+        if condition is None:
+            return True
+        if isinstance(condition, bool):
+            return condition
+        if not isinstance(condition, dict):
+            return False
+        cond_type = condition.get('type')
+        if cond_type == 'const':
+            return bool(condition.get('value'))
+        if cond_type in ('equals', 'notEquals'):
+            equal = self.expand(condition.get('lhs'), preset) == self.expand(condition.get('rhs'), preset)
+            return equal if cond_type == 'equals' else not equal
+        if cond_type in ('inList', 'notInList'):
+            found = self.expand(condition.get('string'), preset) in [self.expand(item, preset) for item in condition.get('list', [])]
+            return found if cond_type == 'inList' else not found
+        if cond_type in ('matches', 'notMatches'):
+            try:
+                matched = re.search(self.expand(condition.get('regex', ''), preset), self.expand(condition.get('string', ''), preset)) is not None
+            except re.error:
+                return False
+            return matched if cond_type == 'matches' else not matched
+        if cond_type == 'anyOf':
+            return any(self.evaluate_condition(item, preset) for item in condition.get('conditions', []))
+        if cond_type == 'allOf':
+            return all(self.evaluate_condition(item, preset) for item in condition.get('conditions', []))
+        if cond_type == 'not':
+            return not self.evaluate_condition(condition.get('condition'), preset)
+        # 旧版本脚本支持的写法
+        if cond_type == 'always':
+            return True
+        if cond_type == 'never':
+            return False
+        return False
+
+    # --- 查询 ---
+
+    def get(self, type_key, name):
+        return self._final.get((type_key, name))
+
+    def presets_by_name(self):
+        """所有类型的预设按名称放入一个字典 (不同类型同名时，靠后的类型覆盖靠前的，与脚本原来的行为一致)。"""
+        all_presets = {}
+        for type_key in PRESET_TYPE_KEYS:
+            for preset in self.presets_data.get(type_key, []):
+                all_presets[preset['name']] = preset
+        return all_presets
+
+    # --- 缓存 ---
+
+    def to_cache(self):
+        return {"version": CACHE_VERSION, "project_dir": self.project_dir, "host": self.host, "files": self.files,
+                "env": self.env_used, "presets": self.presets_data, "source_files": self.source_files}
+
+    @classmethod
+    def from_cache(cls, payload, project_dir, host):
+        """缓存有效 (版本、主机、文件和环境变量都一致) 时返回 PresetGraph，否则返回 None。"""
+        if payload.get("version") != CACHE_VERSION or payload.get("host") != host \
+                or payload.get("project_dir") != os.path.abspath(str(project_dir)):
+            return None
+        if any(_file_stamp(path) != [path, mtime_ns, size] for path, mtime_ns, size in payload["files"]):
+            return None
+        if any(os.environ.get(name) != value for name, value in payload["env"].items()):
+            return None
+        graph = cls(project_dir, host)
+        graph.files = payload["files"]
+        graph.env_used = payload["env"]
+        graph.presets_data = payload["presets"]
+        graph.source_files = payload["source_files"]
+        for type_key in PRESET_TYPE_KEYS:
+            for preset in graph.presets_data.get(type_key, []):
+                graph._final[(type_key, preset['name'])] = preset
+        return graph
+
+
+def cache_path_for(project_dir):
+    digest = hashlib.sha1(os.path.abspath(str(project_dir)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{os.path.basename(os.path.abspath(str(project_dir)))}-{digest}.json")
+
+
+def load_presets(project_dir, use_cache=True, host=None):
+    """加载并解析项目的所有预设，返回 PresetGraph。
+    CMakePresets.json 不存在时抛出 FileNotFoundError，格式或继承关系有误时抛出 PresetError。"""
+    host = host or host_system_name()
+    cache_path = cache_path_for(project_dir)
+    if use_cache:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                graph = PresetGraph.from_cache(json.load(f), project_dir, host)
+            if graph is not None:
+                return graph
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    graph = PresetGraph(project_dir, host).load()
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            AtomicWriteBack.atomic_write_text(cache_path, json.dumps(graph.to_cache(), ensure_ascii=False, separators=(',', ':')),
+                                              record=False)
+        except OSError:
+            pass # 缓存写不进去不影响结果
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析 CMakePresets.json / CMakeUserPresets.json (包括 include、继承和条件)")
+    parser.add_argument("project_dir", nargs="?", default=".", help="项目目录 (包含 CMakePresets.json，默认当前目录)")
+    parser.add_argument("--show", metavar="预设", help="打印该预设展开继承后的完整内容")
+    parser.add_argument("--no-cache", action="store_true", help="不读写解析结果的缓存")
+    args = parser.parse_args()
+
+    try:
+        graph = load_presets(args.project_dir, use_cache=not args.no_cache)
+    except FileNotFoundError as e:
+        print(f"{RED}错误: 未找到 {e}。{RESET}")
+        return 1
+    except PresetError as e:
+        print(f"{RED}错误: {e}{RESET}")
+        return 1
+
+    if args.show:
+        found = [(type_key, graph.get(type_key, args.show)) for type_key in PRESET_TYPE_KEYS if graph.get(type_key, args.show)]
+        if not found:
+            print(f"{RED}找不到预设 '{args.show}'。{RESET}")
+            return 1
+        for type_key, preset in found:
+            print(f"{BLUE}{type_key} / {args.show}{RESET} ({graph.source_files[type_key].get(args.show)})")
+            print(json.dumps(preset, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"{BLUE}预设文件:{RESET}")
+    for path, mtime_ns, _ in graph.files:
+        print(f"  {path}" + ("" if mtime_ns is not None else f" {YELLOW}(不存在){RESET}"))
+    for type_key in PRESET_TYPE_KEYS:
+        presets = graph.presets_data.get(type_key, [])
+        if not presets:
+            continue
+        print(f"{BLUE}{type_key}:{RESET}")
+        for preset in presets:
+            flags = []
+            if preset.get('hidden'):
+                flags.append("隐藏")
+            if preset.get('condition') is False:
+                flags.append(f"条件不满足 ({graph.host})")
+            print(f"  {preset['name']}" + (f"  {YELLOW}[{'，'.join(flags)}]{RESET}" if flags else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import io
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ModifyCompileCommand
+
+
+def cmake_database(entries, newline="\n"):
+    """按 CMake 生成 compile_commands.json 的格式拼出数据库文本。"""
+    text = "[\n" + ",\n".join(json.dumps(entry, indent=2, ensure_ascii=False) for entry in entries) + "\n]\n"
+    return text.replace("\n", newline)
+
+
+ENTRIES = [
+    {
+        "directory": "/work/build",
+        "command": "/usr/bin/c++ -imsvc C:/sdk/include /MP -std:c++17 -o a.o -c /work/src/a.cpp",
+        "file": "/work/src/a.cpp",
+        "output": "a.o",
+    },
+    {
+        "directory": "C:\\work\\build",
+        "command": "cl.exe /nologo -DNAME=\\\"a b\\\" -IC:\\work\\inc /MP /Foobj\\b.obj /c C:\\work\\src\\b.cpp",
+        "file": "C:\\work\\src\\b.cpp",
+        "output": "obj\\b.obj",
+    },
+]
+# CMake 只生成 command 形式；arguments 形式只有流式模式按参数处理 (文本模式不跨越 JSON 字符串边界)
+ARGUMENTS_ENTRY = {
+    "directory": "/work/build",
+    "arguments": ["/usr/bin/c++", "-imsvc", "C:/sdk/include", "/MP", "-c", "/work/src/c.cpp"],
+    "file": "/work/src/c.cpp",
+}
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def run_event(self, raw_bytes, name="db", **settings):
+        """把 raw_bytes 写成 compile_commands.json 并处理一次 Change Mod 事件，返回处理后的文件内容。"""
+        directory = os.path.join(self.directory, name)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, ModifyCompileCommand.TARGET_FILE_BASENAME)
+        with open(path, 'wb') as f:
+            f.write(raw_bytes)
+        settings.setdefault("ENTRY_CACHE_ENABLED", False)
+        with mock.patch.multiple(ModifyCompileCommand, **settings):
+            self.assertEqual(ModifyCompileCommand.handle_file_event("Change Mod", path), 0)
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class StreamingParserTest(unittest.TestCase):
+    def test_entries_across_chunk_boundaries(self):
+        text = cmake_database(ENTRIES + [ARGUMENTS_ENTRY])
+        for chunk_size in (1, 7, 64, len(text)):
+            entries = list(ModifyCompileCommand.iter_compile_commands_entries(io.StringIO(text), chunk_size))
+            self.assertEqual(entries, ENTRIES + [ARGUMENTS_ENTRY])
+
+    def test_empty_array_and_empty_file(self):
+        for text in ("[]", "[\n]\n", " \r\n[ \r\n ]", ""):
+            self.assertEqual(list(ModifyCompileCommand.iter_compile_commands_entries(io.StringIO(text), 2)), [])
+
+    def test_malformed_input_raises(self):
+        for text in ('{"a": 1}', '[{"a": 1} {"b": 2}]', '[{"a": 1},'):
+            with self.assertRaises(ValueError):
+                list(ModifyCompileCommand.iter_compile_commands_entries(io.StringIO(text), 4))
+
+
+class StreamingTextModeEquivalenceTest(DatabaseTestCase):
+    def assert_modes_identical(self, raw_bytes):
+        streamed = self.run_event(raw_bytes, "stream", STREAMING_MODE=True)
+        text_mode = self.run_event(raw_bytes, "text", STREAMING_MODE=False)
+        self.assertEqual(streamed, text_mode)
+        return streamed
+
+    def test_rules_applied_identically(self):
+        output = self.assert_modes_identical(cmake_database(ENTRIES).encode('utf-8'))
+        rewritten = json.loads(output)
+        self.assertEqual(rewritten[0]["command"], "/usr/bin/c++ -IC:/sdk/include /std:c++17 -o a.o -c /work/src/a.cpp")
+        self.assertEqual(rewritten[1]["command"], ENTRIES[1]["command"].replace(" /MP", ""))
+
+    def test_arguments_entry_in_streaming_mode(self):
+        output = self.run_event(cmake_database([ARGUMENTS_ENTRY]).encode('utf-8'), STREAMING_MODE=True)
+        self.assertEqual(json.loads(output)[0]["arguments"], ["/usr/bin/c++", "-IC:/sdk/include", "-c", "/work/src/c.cpp"])
+
+    def test_crlf_input(self):
+        output = self.assert_modes_identical(cmake_database(ENTRIES, "\r\n").encode('utf-8'))
+        self.assertEqual(json.loads(output)[1]["command"], ENTRIES[1]["command"].replace(" /MP", ""))
+
+    def test_escaped_quotes_and_non_ascii(self):
+        entry = {
+            "directory": "/work/build",
+            "command": "c++ -DMSG=\"\\\"你好 /MP\\\"\" /MP -c /work/src/中文.cpp",
+            "file": "/work/src/中文.cpp",
+        }
+        output = self.assert_modes_identical(cmake_database([entry]).encode('utf-8'))
+        self.assertEqual(json.loads(output)[0]["command"], "c++ -DMSG=\"\\\"你好\\\"\" -c /work/src/中文.cpp")
+
+    def test_unchanged_database_is_left_untouched(self):
+        raw_bytes = cmake_database([{"directory": "/b", "command": "c++ -c a.cpp", "file": "a.cpp"}], "\r\n").encode('utf-8')
+        self.assertEqual(self.assert_modes_identical(raw_bytes), raw_bytes)
+
+    def test_empty_array(self):
+        for raw_bytes in (b"[]\n", b"[\r\n]\r\n"):
+            self.assertEqual(self.assert_modes_identical(raw_bytes), raw_bytes)
+
+
+class CompactionTest(DatabaseTestCase):
+    SHARED_FLAGS = " ".join(f"-I/work/src/module{index}/include" for index in range(20)) + " /MP -std:c++17"
+
+    def compact_entries(self):
+        return [{"directory": "/work/build",
+                 "command": f"/usr/bin/c++ {self.SHARED_FLAGS} -o obj/f{index}.o -c /work/src/f{index}.cpp",
+                 "file": f"/work/src/f{index}.cpp"} for index in range(10)]
+
+    def test_arguments_written_on_one_line(self):
+        raw_bytes = cmake_database(self.compact_entries()).encode('utf-8')
+        output = self.run_event(raw_bytes, COMPACT_ENABLED=True, RESPONSE_FILES_ENABLED=False)
+        arguments_lines = [line for line in output.decode('utf-8').splitlines() if '"arguments"' in line]
+        self.assertEqual(len(arguments_lines), 10)
+        entry = json.loads(output)[0]
+        self.assertNotIn("command", entry)
+        self.assertEqual(entry["arguments"][-4:], ["-c", "-o", "obj/f0.o", "/work/src/f0.cpp"])
+        self.assertNotIn("/MP", entry["arguments"])
+        self.assertIn("/std:c++17", entry["arguments"])
+
+    def test_response_files_shrink_the_database(self):
+        raw_bytes = cmake_database(self.compact_entries()).encode('utf-8')
+        response_dir = os.path.join(self.directory, "rsp")
+        output = self.run_event(raw_bytes, COMPACT_ENABLED=True, RESPONSE_FILES_ENABLED=True, RESPONSE_FILE_DIR=response_dir)
+        self.assertLess(len(output) * 3, len(raw_bytes))
+        entries = json.loads(output)
+        self.assertEqual(len({entry["arguments"][1] for entry in entries}), 1)
+        response_path = entries[0]["arguments"][1][1:]
+        self.assertEqual(os.path.dirname(response_path), response_dir)
+        with open(response_path, 'r', encoding='utf-8') as f:
+            response_arguments = f.read().split()
+        self.assertEqual(response_arguments[0], "-I/work/src/module0/include")
+        self.assertNotIn("/MP", response_arguments)
+
+
+class RewriteCacheTest(DatabaseTestCase):
+    RAW_BYTES = cmake_database(ENTRIES).encode('utf-8')
+
+    def setUp(self):
+        super().setUp()
+        self.expected = self.run_event(self.RAW_BYTES, "expected")
+
+    def run_cached(self, **settings):
+        return self.run_event(self.RAW_BYTES, "cached", ENTRY_CACHE_ENABLED=True, **settings)
+
+    def cache_path(self):
+        return os.path.join(self.directory, "cached", ModifyCompileCommand.TARGET_FILE_BASENAME) + \
+            ModifyCompileCommand.ENTRY_CACHE_SUFFIX
+
+    def test_cached_run_matches_uncached_run(self):
+        self.assertEqual(self.run_cached(), self.expected)
+        self.assertTrue(os.path.exists(self.cache_path()))
+        self.assertEqual(self.run_cached(), self.expected)
+
+    def test_rule_change_invalidates_cached_rewrites(self):
+        self.run_cached()
+        rules = [rule for rule in ModifyCompileCommand.COMPILE_COMMAND_RULES if not rule[0].startswith("Rule 2")]
+        output = self.run_cached(COMPILE_COMMAND_RULES=rules,
+                                 COMPILE_COMMAND_RULE_ENGINE=ModifyCompileCommand.CompiledRuleEngine(rules))
+        commands = [entry["command"] for entry in json.loads(output)]
+        self.assertIn(" /MP ", commands[0])
+        self.assertIn(" /MP ", commands[1])
+        self.assertNotIn("-imsvc", commands[0])
+        # 换回原来的规则后同样不能复用上一轮 (没有规则 2) 的结果
+        self.assertEqual(self.run_cached(), self.expected)
+
+    def test_settings_change_invalidates_cached_rewrites(self):
+        self.run_cached()
+        output = self.run_cached(COMPACT_ENABLED=True, RESPONSE_FILES_ENABLED=False)
+        self.assertIn("arguments", json.loads(output)[0])
+
+    def test_corrupt_cache_file(self):
+        self.run_cached()
+        with open(self.cache_path(), 'wb') as f:
+            f.write(b"not a sqlite database" * 100)
+        self.assertEqual(self.run_cached(), self.expected)
+
+    def test_cache_failing_mid_run_falls_back_to_uncached_rewrite(self):
+        self.run_cached()
+        original_get = ModifyCompileCommand.CompileCommandsRewriteCache.get
+        calls = []
+
+        def failing_after_first_lookup(cache, key):
+            calls.append(key)
+            if len(calls) > 1:
+                # 模拟读到损坏的页: 后续查询报错
+                cache.connection.close()
+            return original_get(cache, key)
+
+        with mock.patch.object(ModifyCompileCommand.CompileCommandsRewriteCache, "get", failing_after_first_lookup):
+            self.assertEqual(self.run_cached(), self.expected)
+        self.assertFalse(os.path.exists(self.cache_path()))
+        self.assertEqual(self.run_cached(), self.expected)
+
+    def test_locked_cache_file(self):
+        self.run_cached()
+        locker = sqlite3.connect(self.cache_path(), isolation_level=None)
+        self.addCleanup(locker.close)
+        locker.execute("BEGIN EXCLUSIVE")
+        self.assertEqual(self.run_cached(), self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
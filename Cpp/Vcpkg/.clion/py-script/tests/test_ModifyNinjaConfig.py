@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ModifyNinjaConfig
+
+
+def rewrite(text):
+    output = []
+    rewritten_count, _, _ = ModifyNinjaConfig.stream_process_ninja_file(text.splitlines(True), output.append)
+    return "".join(output), rewritten_count
+
+
+class MpValueRuleTest(unittest.TestCase):
+    def test_leading_flag_removes_trailing_whitespace(self):
+        text = "build a.obj: CXX_COMPILER__app_Debug a.cpp\n  FLAGS = /MP /W3\n"
+        output, rewritten_count = rewrite(text)
+        self.assertEqual(output, "build a.obj: CXX_COMPILER__app_Debug a.cpp\n  FLAGS = /W3\n")
+        self.assertEqual(rewritten_count, 1)
+
+    def test_leading_flag_on_continued_lines(self):
+        text = ("build a.obj: CXX_COMPILER__app_Debug a.cpp\n"
+                "  FLAGS = /MP /W3 $\n"
+                "      /MP   /O2\n")
+        output, _ = rewrite(text)
+        self.assertEqual(output, ("build a.obj: CXX_COMPILER__app_Debug a.cpp\n"
+                                  "  FLAGS = /W3 $\n"
+                                  "      /O2\n"))
+
+    def test_flag_alone_on_continued_line(self):
+        text = ("build a.obj: CXX_COMPILER__app_Debug a.cpp\n"
+                "  FLAGS = /MP $\n"
+                "      /W3\n")
+        output, _ = rewrite(text)
+        self.assertEqual(output, ("build a.obj: CXX_COMPILER__app_Debug a.cpp\n"
+                                  "  FLAGS = $\n"
+                                  "      /W3\n"))
+
+    def test_middle_and_trailing_flag(self):
+        text = "FLAGS = /W3 /MP /O2 /MP\n"
+        output, _ = rewrite(text)
+        self.assertEqual(output, "FLAGS = /W3 /O2\n")
+
+    def test_flag_inside_path_or_escaped_space_is_kept(self):
+        text = "FLAGS = /EHsc/MP -I/MP$ /MP\n"
+        output, rewritten_count = rewrite(text)
+        self.assertEqual(output, text)
+        self.assertEqual(rewritten_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import codecs
+import signal
+import asyncio
+import platform
+from collections import deque
+
+# 构建脚本共用的子进程执行器 (CMakeWorkflow.py、CMakeInstallToProjectDIR.py、Conan 的 main.py)。
+# 基于 asyncio: 一个事件循环同时读取多个子进程的 stdout / stderr，不再为每条命令启动两个读线程；
+# 输出按读取到的数据块成批交给 sink (一块通常包含多行，一次 write + flush)，而不是每行 flush 一次。
+# 支持超时与取消 (Ctrl+C)，超时或取消时终止整个子进程树；返回结构化结果 (返回码、耗时、输出末尾若干行)。
+#
+# 用法:
+#   result = AsyncProcessRunner.run(["cmake", "--build", "--preset", "x"], env=env, cwd=project_dir,
+#                                   sink=OutputColorizer.ColorizingSink(sys.stdout))
+#   results = AsyncProcessRunner.run_many([{"command": [...]}, {"command": [...]}], max_concurrency=2)
+
+# --- 配置 ---
+# BUILD_COMMAND_TIMEOUT=秒数 为所有命令设置默认超时，0 或未设置表示不限
+DEFAULT_TIMEOUT = float(os.environ.get("BUILD_COMMAND_TIMEOUT", "0") or 0) or None
+DEFAULT_TAIL_LINES = 200 # 结果中保留的输出末尾行数
+READ_CHUNK_SIZE = 64 * 1024
+TERMINATE_GRACE_SECONDS = 5.0 # 超时 / 取消时先发送中断信号，等待这么久后强制结束
+
+
+class ProcessResult:
+    def __init__(self, command):
+        self.command = command
+        self.returncode = None # 超时或取消时为 None
+        self.duration = 0.0 # 秒
+        self.timed_out = False
+        self.cancelled = False
+        self.tail = [] # 输出的最后 DEFAULT_TAIL_LINES 行 (stdout 与 stderr 按到达顺序交错)
+        self.output = None # capture=True 时为全部输出行
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+class OutputSink:
+    """把输出行着色后写入 stream。每批行只写一次、flush 一次。"""
+
+    def __init__(self, stream=None, color_func=None):
+        self.stream = stream or sys.stdout
+        self.color_func = color_func
+
+    def write_lines(self, lines):
+        if self.color_func is not None:
+            lines = [self.color_func(line) for line in lines]
+        self.stream.write("".join(lines))
+        self.stream.flush()
+
+
+class _LineSplitter:
+    """把字节块解码并切分为完整的行 (统一为 "\n" 结尾)，不完整的末行留到下一块。"""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+
+    def feed(self, data, final=False):
+        text = self._partial + self._decoder.decode(data, final)
+        lines = text.split("\n")
+        self._partial = "" if final else lines.pop()
+        if final and lines and lines[-1] == "":
+            lines.pop()
+        return [(line[:-1] if line.endswith("\r") else line) + "\n" for line in lines]
+
+
+async def _pump(stream, sink, tail, output):
+    splitter = _LineSplitter()
+    while True:
+        data = await stream.read(READ_CHUNK_SIZE)
+        lines = splitter.feed(data, final=not data)
+        if lines:
+            tail.extend(lines)
+            if output is not None:
+                output.extend(lines)
+            if sink is not None:
+                sink.write_lines(lines)
+        if not data:
+            return
+
+
+async def _terminate(process, interrupt_signal):
+    """结束子进程及其子孙进程: 先发送 interrupt_signal (取消时为 SIGINT，相当于在终端按 Ctrl+C；超时为 SIGTERM)，
+    超过宽限时间后强制结束。"""
+    if process.returncode is not None:
+        return
+    windows = platform.system() == "Windows"
+    try:
+        if windows:
+            killer = await asyncio.create_subprocess_exec("taskkill", "/T", "/F", "/PID", str(process.pid),
+                                                          stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            await killer.wait()
+        else:
+            os.killpg(process.pid, interrupt_signal)
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE_SECONDS)
+    except asyncio.TimeoutError: # 3.11 起是 OSError 的子类，必须先于 OSError 捕获
+        # process.wait() 要等到管道关闭才返回，忽略了该信号的后台进程也会让它超时
+        try:
+            if windows:
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        await process.wait()
+    except OSError:
+        pass # 进程已经退出
+
+
+async def _drain(tasks):
+    """等待读取任务读完子进程结束后剩余的输出；仍有孙进程占用管道时，超过宽限时间后放弃。"""
+    pending = [task for task in tasks if not task.done()]
+    if pending:
+        _, pending = await asyncio.wait(pending, timeout=TERMINATE_GRACE_SECONDS)
+        for task in pending:
+            task.cancel()
+
+
+async def run_process(command, env=None, cwd=None, sink=None, timeout=DEFAULT_TIMEOUT,
+                      tail_lines=DEFAULT_TAIL_LINES, capture=False):
+    """执行 command (参数列表)，输出成批交给 sink.write_lines(lines)。返回 ProcessResult。
+    命令不存在时抛出 FileNotFoundError (与 subprocess.Popen 相同)。"""
+    result = ProcessResult(command)
+    tail = deque(maxlen=tail_lines)
+    output = [] if capture else None
+    started = time.monotonic()
+    # POSIX 上放入独立的进程组，超时 / 取消时可以结束整棵进程树
+    process = await asyncio.create_subprocess_exec(
+        *[str(part) for part in command], env=env, cwd=cwd,
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=platform.system() != "Windows")
+    tasks = [asyncio.ensure_future(_pump(process.stdout, sink, tail, output)),
+             asyncio.ensure_future(_pump(process.stderr, sink, tail, output)),
+             asyncio.ensure_future(process.wait())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=timeout)
+        if len(done) < len(tasks):
+            result.timed_out = True
+            await _terminate(process, signal.SIGTERM)
+        else:
+            for task in done:
+                task.result() # sink 抛出的异常在这里传播
+            result.returncode = process.returncode
+    except asyncio.CancelledError:
+        result.cancelled = True
+        await asyncio.shield(_terminate(process, signal.SIGINT))
+        raise
+    except BaseException:
+        await asyncio.shield(_terminate(process, signal.SIGTERM))
+        raise
+    finally:
+        await asyncio.shield(_drain(tasks))
+        result.duration = time.monotonic() - started
+        result.tail = list(tail)
+        result.output = output
+    return result
+
+
+async def run_processes(jobs, max_concurrency=None):
+    """并发执行多条命令，jobs 为 run_process 的关键字参数字典列表；最多同时运行 max_concurrency 个。
+    按 jobs 的顺序返回结果；某条命令无法启动时，对应位置是该异常。"""
+    semaphore = asyncio.Semaphore(max_concurrency or len(jobs) or 1)
+
+    async def run_one(job):
+        async with semaphore:
+            return await run_process(**job)
+
+    return await asyncio.gather(*(run_one(job) for job in jobs), return_exceptions=True)
+
+
+def run_async(coroutine):
+    """在新的事件循环中运行 coroutine (调用方自己组织多条命令时使用)。"""
+    if platform.system() == "Windows" and sys.version_info < (3, 8):
+        # 3.8 之前 Windows 默认的 SelectorEventLoop 不支持子进程
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+    return asyncio.run(coroutine)
+
+
+def run(command, **kwargs):
+    """同步执行单条命令，参数同 run_process。Ctrl+C 时终止子进程树后抛出 KeyboardInterrupt。"""
+    return run_async(run_process(command, **kwargs))
+
+
+def run_many(jobs, max_concurrency=None):
+    """同步并发执行多条命令，参数同 run_processes。"""
+    return run_async(run_processes(jobs, max_concurrency))
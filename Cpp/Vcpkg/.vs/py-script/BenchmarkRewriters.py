@@ -0,0 +1,416 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+try:
+    import resource # 仅 POSIX 平台可用，用于读取峰值内存
+except ImportError:
+    resource = None
+
+# 改写脚本 (ModifyCompileCommand.py / ModifyNinjaConfig.py) 的基准测试。
+# 按给定规模生成合成的 compile_commands.json 和 build.ninja (MSVC / clang-cl / clang 风格的编译参数)，
+# 每个改写路径在独立的子进程中运行 (环境变量开关在模块导入时读取，且峰值内存互不干扰)，
+# 结果以 JSON Lines 输出: 吞吐量 (MB/s)、耗时、峰值内存。
+#
+# 用法:
+#   python BenchmarkRewriters.py --sizes 1000,100000 --output before.jsonl
+#   python BenchmarkRewriters.py --sizes 1000,100000 --output after.jsonl
+#   python BenchmarkRewriters.py --compare before.jsonl after.jsonl
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+DEFAULT_SIZES = [1000, 10000, 100000]
+MAX_SIZE = 500000
+DEFAULT_STYLES = ["msvc", "clang"]
+SUPPORTED_STYLES = ["msvc", "clang-cl", "clang"]
+DEFAULT_REPEAT = 3
+DEFAULT_REGRESSION_THRESHOLD = 0.10 # 对比时吞吐量下降或内存增长超过该比例视为回退
+ENTRIES_PER_TARGET = 500 # 合成 build.ninja 中每个目标 (一条链接边) 包含的目标文件数
+RESPONSE_FILE_SUBDIR = "rsp" # 压缩用例的响应文件目录 (位于运行目录下)，大小计入 response_file_bytes
+
+# 基准用例: 名称 -> (处理模块, 被处理文件名, 额外环境变量, 是否先预热一次)
+# 预热用例先完整运行一次 (填充条目缓存)，再恢复原始输入后计时，对应 "只改了少量条目" 的常见场景
+# 环境变量值中的 {run_dir} 替换为用例的运行目录 (合成输入中条目的 directory 并不存在，响应文件写到运行目录中)
+BENCHMARK_CASES = {
+    "compile_commands:text": ("ModifyCompileCommand", "compile_commands.json",
+                              {"COMPILE_COMMANDS_STREAMING": "0"}, False),
+    "compile_commands:stream": ("ModifyCompileCommand", "compile_commands.json",
+                                {"COMPILE_COMMANDS_CACHE": "0", "COMPILE_COMMANDS_PARALLEL": "0"}, False),
+    "compile_commands:parallel": ("ModifyCompileCommand", "compile_commands.json",
+                                  {"COMPILE_COMMANDS_CACHE": "0", "COMPILE_COMMANDS_PARALLEL": "1"}, False),
+    "compile_commands:cached": ("ModifyCompileCommand", "compile_commands.json",
+                                {"COMPILE_COMMANDS_CACHE": "1"}, True),
+    "compile_commands:compact": ("ModifyCompileCommand", "compile_commands.json",
+                                 {"COMPILE_COMMANDS_CACHE": "0", "COMPILE_COMMANDS_COMPACT": "1",
+                                  "COMPILE_COMMANDS_RESPONSE_FILE_DIR": os.path.join("{run_dir}", RESPONSE_FILE_SUBDIR)}, False),
+    "compile_commands:compact-inline": ("ModifyCompileCommand", "compile_commands.json",
+                                        {"COMPILE_COMMANDS_CACHE": "0", "COMPILE_COMMANDS_COMPACT": "1",
+                                         "COMPILE_COMMANDS_RESPONSE_FILES": "0"}, False),
+    "ninja": ("ModifyNinjaConfig", "build.ninja", {}, False),
+    "ninja:text": ("ModifyNinjaConfig", "build.ninja", {"NINJA_CONFIG_STREAMING": "0"}, False),
+}
+# 数值越大越好的指标；其余指标 (耗时、内存) 越小越好
+HIGHER_IS_BETTER = {"mb_per_s"}
+COMPARED_METRICS = ["mb_per_s", "wall_seconds", "peak_rss_kb"]
+
+
+# --- 合成输入 ---
+def _style_flags(style, index):
+    """返回 (编译器, 目录, 源文件, 目标文件, 共享参数列表)。每 50 个文件换一组宏，模拟多个目标。"""
+    target = f"lib{index // ENTRIES_PER_TARGET}"
+    variant = index // 50
+    if style == "clang":
+        directory = "/home/dev/proj/build"
+        source = f"/home/dev/proj/src/{target}/module_{index}.cpp"
+        obj = f"CMakeFiles/{target}.dir/src/{target}/module_{index}.cpp.o"
+        flags = [f"-DPROJ_VARIANT={variant}", "-DNDEBUG", f"-I/home/dev/proj/src/{target}",
+                 "-I/home/dev/proj/include", "-isystem", "/home/dev/vcpkg/installed/x64-linux/include",
+                 "-O2", "-g", "-std=c++20", "-fPIC", "-Wall", "-Wextra", "-Wpedantic", "-fcolor-diagnostics"]
+        return "/usr/bin/clang++", directory, source, obj, flags
+    directory = "C:\\dev\\proj\\build"
+    source = f"C:\\dev\\proj\\src\\{target}\\module_{index}.cpp"
+    obj = f"CMakeFiles\\{target}.dir\\src\\{target}\\module_{index}.cpp.obj"
+    if style == "clang-cl":
+        flags = [f"-DPROJ_VARIANT={variant}", "-DWIN32", "-D_WINDOWS", f"-IC:\\dev\\proj\\src\\{target}",
+                 "-imsvc", "C:\\dev\\vcpkg\\installed\\x64-windows\\include", "/W3", "/GR", "/EHsc",
+                 "/MP", "/Zi", "/Ob0", "/Od", "-std:c++20", "-MDd"]
+        return "C:\\PROGRA~1\\LLVM\\bin\\clang-cl.exe", directory, source, obj, flags
+    flags = [f"-DPROJ_VARIANT={variant}", "-DWIN32", "-D_WINDOWS", f"-IC:\\dev\\proj\\src\\{target}",
+             "-external:IC:\\dev\\vcpkg\\installed\\x64-windows\\include", "-external:W0", "/DWIN32",
+             "/D_WINDOWS", "/W3", "/GR", "/EHsc", "/MP", "/Zi", "/Ob0", "/Od", "/RTC1", "-std:c++20", "-MDd"]
+    return "C:\\PROGRA~1\\MICROS~1\\2022\\COMMUN~1\\VC\\Tools\\MSVC\\1440~1.338\\bin\\Hostx64\\x64\\cl.exe", \
+        directory, source, obj, flags
+
+
+def generate_compile_commands(path, entries, style):
+    """写出与 CMake 输出格式一致的 compile_commands.json (缩进 2 格的条目数组)。"""
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("[\n")
+        for index in range(entries):
+            compiler, directory, source, obj, flags = _style_flags(style, index)
+            output_flag = f"-o {obj}" if style == "clang" else f"/Fo{obj} /FdTARGET_COMPILE_PDB /FS"
+            command = " ".join([compiler, "/nologo /TP" if style != "clang" else ""] + flags + [output_flag, "-c", source])
+            entry = {"directory": directory, "command": " ".join(command.split()), "file": source, "output": obj}
+            f.write(json.dumps(entry, indent=2, ensure_ascii=False))
+            f.write(",\n" if index + 1 < entries else "\n")
+        f.write("]")
+
+
+def _ninja_escape_path(path):
+    return path.replace("$", "$$").replace(":", "$:").replace(" ", "$ ")
+
+
+def _join_separate_values(flags):
+    """把 "-isystem <路径>" 这类值独立成参数的选项合并成一项，便于按前缀分到 DEFINES / INCLUDES / FLAGS。"""
+    joined = []
+    for flag in flags:
+        if joined and joined[-1] in ("-isystem", "-imsvc"):
+            joined[-1] += " " + flag
+        else:
+            joined.append(flag)
+    return joined
+
+
+def generate_build_ninja(path, entries, style):
+    """写出与 CMake Ninja 生成器结构一致的 build.ninja: 每个目标一条编译规则、每个源文件一条编译边。"""
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("# CMAKE generated file: DO NOT EDIT!\n# Generated by \"Ninja\" Generator, CMake Version 3.28\n\n")
+        f.write("ninja_required_version = 1.5\n\nCONFIGURATION = Debug\n\n")
+        target_count = (entries + ENTRIES_PER_TARGET - 1) // ENTRIES_PER_TARGET
+        for target_index in range(target_count):
+            target = f"lib{target_index}"
+            first = target_index * ENTRIES_PER_TARGET
+            compiler = _style_flags(style, first)[0]
+            deps = "gcc" if style == "clang" else "msvc"
+            f.write(f"rule CXX_COMPILER__{target}_Debug\n")
+            f.write(f"  depfile = $DEP_FILE\n  deps = {deps}\n")
+            f.write(f"  command = {compiler} $DEFINES $INCLUDES $FLAGS -o $out -c $in\n")
+            f.write("  description = Building CXX object $out\n\n")
+            f.write(f"rule CXX_STATIC_LIBRARY_LINKER__{target}_Debug\n")
+            f.write("  command = lib.exe /nologo /out:$TARGET_FILE $in\n  description = Linking CXX static library $TARGET_FILE\n\n")
+            objects = []
+            for index in range(first, min(entries, first + ENTRIES_PER_TARGET)):
+                _, _, source, obj, flags = _style_flags(style, index)
+                objects.append(obj)
+                flags = _join_separate_values(flags)
+                defines = " ".join(flag for flag in flags if flag.startswith(("-D", "/D")))
+                includes = " ".join(flag for flag in flags if flag.startswith(("-I", "-external:I", "-imsvc", "-isystem")))
+                other = " ".join(flag for flag in flags if not flag.startswith(("-D", "/D", "-I", "-external:I", "-imsvc", "-isystem")))
+                f.write(f"build {_ninja_escape_path(obj)}: CXX_COMPILER__{target}_Debug {_ninja_escape_path(source)}"
+                        f" || cmake_object_order_depends_target_{target}\n")
+                f.write(f"  DEFINES = {defines}\n  DEP_FILE = {obj}.d\n  FLAGS = {other}\n")
+                f.write(f"  INCLUDES = {includes}\n  OBJECT_DIR = CMakeFiles/{target}.dir\n\n")
+            f.write(f"build {target}.lib: CXX_STATIC_LIBRARY_LINKER__{target}_Debug $\n")
+            for obj in objects[:-1]:
+                f.write(f"    {_ninja_escape_path(obj)} $\n")
+            if objects:
+                f.write(f"    {_ninja_escape_path(objects[-1])}\n")
+            f.write(f"  TARGET_FILE = {target}.lib\n\n")
+        f.write("build all: phony " + " ".join(f"lib{i}.lib" for i in range(target_count)) + "\n\ndefault all\n")
+
+
+INPUT_GENERATORS = {
+    "compile_commands.json": generate_compile_commands,
+    "build.ninja": generate_build_ninja,
+}
+
+
+def ensure_input(work_dir, file_name, entries, style):
+    """生成 (或复用已生成的) 原始输入文件，返回其路径。"""
+    source_dir = os.path.join(work_dir, "inputs", f"{style}-{entries}")
+    source_path = os.path.join(source_dir, file_name)
+    if not os.path.exists(source_path):
+        os.makedirs(source_dir, exist_ok=True)
+        temp_path = source_path + ".partial"
+        INPUT_GENERATORS[file_name](temp_path, entries, style)
+        os.replace(temp_path, source_path)
+    return source_path
+
+
+# --- 子进程中执行单次改写 ---
+def _peak_rss_kb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # macOS 以字节为单位，Linux 以 KB 为单位
+
+
+def run_worker(module_name, file_path):
+    """在当前进程内调用处理模块的 handle_file_event，把结果以一行 JSON 打印到 stdout。"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import importlib
+    import_started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_seconds = time.perf_counter() - import_started
+    started = time.perf_counter()
+    exit_code = module.handle_file_event("Change Mod", file_path)
+    wall_seconds = time.perf_counter() - started
+    result = {
+        "exit_code": exit_code,
+        "wall_seconds": wall_seconds,
+        "import_seconds": import_seconds,
+        "peak_rss_kb": _peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+        "peak_rss_children_kb": _peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+    print(json.dumps(result))
+    return 0
+
+
+def _prepare_run_dir(run_dir, source_path, file_name, keep_sidecars):
+    """把原始输入复制到 run_dir。keep_sidecars 为 False 时清空目录 (缓存、索引、响应文件等一并删除)。"""
+    if not keep_sidecars and os.path.isdir(run_dir):
+        shutil.rmtree(run_dir)
+    os.makedirs(run_dir, exist_ok=True)
+    target_path = os.path.join(run_dir, file_name)
+    shutil.copyfile(source_path, target_path)
+    # 写回指纹与新复制的文件无关，删除以免被当作自身写入而跳过
+    fingerprint_path = target_path + ".writeback.json"
+    if os.path.exists(fingerprint_path):
+        os.remove(fingerprint_path)
+    return target_path
+
+
+def _spawn_worker(module_name, target_path, extra_env):
+    env = dict(os.environ)
+    env.update(extra_env)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", module_name, target_path],
+                               env=env, capture_output=True, text=True)
+    process_seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"基准子进程失败 (返回码 {completed.returncode}): {completed.stderr.strip()[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = process_seconds
+    return result
+
+
+def _git_revision():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   capture_output=True, text=True, timeout=10)
+        return completed.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _directory_bytes(path):
+    """目录中所有文件的总大小，目录不存在时返回 0。"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def benchmark_case(case_name, entries, style, work_dir, repeat):
+    """运行一个用例 repeat 次，返回汇总记录 (耗时取中位数，内存取最大值)。"""
+    module_name, file_name, extra_env, warm = BENCHMARK_CASES[case_name]
+    source_path = ensure_input(work_dir, file_name, entries, style)
+    input_bytes = os.path.getsize(source_path)
+    run_dir = os.path.join(work_dir, "runs", case_name.replace(":", "-"), f"{style}-{entries}")
+    extra_env = {key: value.replace("{run_dir}", run_dir) for key, value in extra_env.items()}
+    runs = []
+    for _ in range(repeat):
+        target_path = _prepare_run_dir(run_dir, source_path, file_name, keep_sidecars=False)
+        if warm:
+            _spawn_worker(module_name, target_path, extra_env)
+            target_path = _prepare_run_dir(run_dir, source_path, file_name, keep_sidecars=True)
+        result = _spawn_worker(module_name, target_path, extra_env)
+        if result["exit_code"] != 0:
+            raise RuntimeError(f"{case_name} 返回码 {result['exit_code']}")
+        runs.append(result)
+
+    wall_seconds = statistics.median(run["wall_seconds"] for run in runs)
+    peaks = [run["peak_rss_kb"] for run in runs if run["peak_rss_kb"] is not None]
+    children_peaks = [run["peak_rss_children_kb"] for run in runs if run["peak_rss_children_kb"] is not None]
+    return {
+        "case": case_name,
+        "style": style,
+        "entries": entries,
+        "input_bytes": input_bytes,
+        "output_bytes": os.path.getsize(os.path.join(run_dir, file_name)),
+        "response_file_bytes": _directory_bytes(os.path.join(run_dir, RESPONSE_FILE_SUBDIR)),
+        "repeat": repeat,
+        "wall_seconds": round(wall_seconds, 4),
+        "wall_seconds_min": round(min(run["wall_seconds"] for run in runs), 4),
+        "process_seconds": round(statistics.median(run["process_seconds"] for run in runs), 4),
+        "mb_per_s": round(input_bytes / (1024 * 1024) / wall_seconds, 3) if wall_seconds > 0 else None,
+        "peak_rss_kb": max(peaks) if peaks else None,
+        "peak_rss_children_kb": max(children_peaks) if children_peaks else None,
+    }
+
+
+# --- 结果对比 ---
+def load_results(path):
+    """读取结果文件，返回 {(用例, 风格, 条目数): 记录}。--output 是追加写入的，同一用例有多条记录时各指标取中位数。"""
+    grouped = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "case" in record:
+                grouped.setdefault((record["case"], record["style"], record["entries"]), []).append(record)
+    results = {}
+    for key, records in grouped.items():
+        merged = dict(records[-1])
+        if len(records) > 1:
+            for metric in COMPARED_METRICS:
+                values = [record[metric] for record in records if record.get(metric) is not None]
+                merged[metric] = statistics.median(values) if values else None
+        results[key] = merged
+    duplicated = sum(1 for records in grouped.values() if len(records) > 1)
+    if duplicated:
+        print(f"{YELLOW}{path}: {duplicated} 个用例有多条记录 (多次追加写入)，对比时各指标取中位数。{RESET}")
+    return results
+
+
+def compare_results(baseline_path, current_path, threshold):
+    """逐用例对比两次运行结果，打印变化比例。存在回退时返回 1，否则返回 0。"""
+    baseline = load_results(baseline_path)
+    current = load_results(current_path)
+    regressions = 0
+    print(f"{BLUE}{'用例':<28} {'风格':<9} {'条目数':>8} " + " ".join(f"{metric:>22}" for metric in COMPARED_METRICS) + RESET)
+    for key in sorted(set(baseline) & set(current), key=lambda k: (k[0], k[1], k[2])):
+        old, new = baseline[key], current[key]
+        cells = []
+        for metric in COMPARED_METRICS:
+            old_value, new_value = old.get(metric), new.get(metric)
+            if not old_value or new_value is None:
+                cells.append(f"{'-':>22}")
+                continue
+            change = (new_value - old_value) / old_value
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            color = RED if worse > threshold else GREEN if worse < -threshold else ""
+            if worse > threshold:
+                regressions += 1
+            cells.append(f"{color}{f'{old_value:g} -> {new_value:g} ({change:+.0%})':>22}{RESET if color else ''}")
+        print(f"{key[0]:<28} {key[1]:<9} {key[2]:>8} " + " ".join(cells))
+    only_baseline = len(set(baseline) - set(current))
+    only_current = len(set(current) - set(baseline))
+    if only_baseline or only_current:
+        print(f"{YELLOW}跳过 {only_baseline} 个仅基线有结果、{only_current} 个仅本次有结果的用例。{RESET}")
+    if regressions:
+        print(f"{RED}发现 {regressions} 项超过 {threshold:.0%} 的回退。{RESET}")
+        return 1
+    print(f"{GREEN}没有超过 {threshold:.0%} 的回退。{RESET}")
+    return 0
+
+
+def _parse_sizes(text):
+    sizes = [int(part) for part in text.split(",") if part.strip()]
+    for size in sizes:
+        if not 1 <= size <= MAX_SIZE:
+            raise argparse.ArgumentTypeError(f"规模必须在 1 到 {MAX_SIZE} 之间: {size}")
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ModifyCompileCommand.py / ModifyNinjaConfig.py 改写吞吐量基准测试")
+    parser.add_argument("--sizes", type=_parse_sizes, default=DEFAULT_SIZES, help="逗号分隔的条目数 (默认 1000,10000,100000)")
+    parser.add_argument("--styles", default=",".join(DEFAULT_STYLES), help=f"逗号分隔的参数风格: {', '.join(SUPPORTED_STYLES)}")
+    parser.add_argument("--cases", default=",".join(BENCHMARK_CASES), help="逗号分隔的用例名")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每个用例的重复次数 (耗时取中位数)")
+    parser.add_argument("--work-dir", help="生成输入和运行用的目录 (默认使用临时目录，结束后删除)")
+    parser.add_argument("--output", help="把 JSON Lines 结果追加写入该文件 (默认只输出到 stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="对比两份结果文件")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="对比时判定回退的比例")
+    parser.add_argument("--worker", nargs=2, metavar=("MODULE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(*args.worker)
+    if args.compare:
+        return compare_results(args.compare[0], args.compare[1], args.threshold)
+
+    styles = [style for style in args.styles.split(",") if style]
+    unknown = [style for style in styles if style not in SUPPORTED_STYLES]
+    if unknown:
+        parser.error(f"未知参数风格: {', '.join(unknown)} (可选: {', '.join(SUPPORTED_STYLES)})")
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = [case for case in cases if case not in BENCHMARK_CASES]
+    if unknown:
+        parser.error(f"未知用例: {', '.join(unknown)} (可选: {', '.join(BENCHMARK_CASES)})")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="rewriter-bench-")
+    environment = {"python": platform.python_version(), "platform": platform.platform(),
+                   "cpu_count": os.cpu_count(), "revision": _git_revision(),
+                   "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    output_file = open(args.output, 'a', encoding='utf-8') if args.output else None
+    try:
+        for entries in args.sizes:
+            for style in styles:
+                for case_name in cases:
+                    print(f"{BLUE}运行 {case_name} ({style}, {entries} 条目)...{RESET}", file=sys.stderr)
+                    record = benchmark_case(case_name, entries, style, work_dir, args.repeat)
+                    record.update(environment)
+                    line = json.dumps(record, ensure_ascii=False)
+                    print(line)
+                    if output_file:
+                        output_file.write(line + "\n")
+                        output_file.flush()
+    finally:
+        if output_file:
+            output_file.close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    sys.exit(main())
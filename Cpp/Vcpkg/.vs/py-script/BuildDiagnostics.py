@@ -0,0 +1,326 @@
+import os
+import re
+import sys
+import json
+import datetime
+
+import AtomicWriteBack
+import NinjaProgress
+import OutputColorizer
+
+# 从构建输出中提取结构化的诊断 (编译器、链接器、CMake 的错误和警告)，CMakeWorkflow.py 执行构建时使用。
+# DiagnosticCollector 包装另一个 sink (着色输出或 NinjaProgress.BuildProgress)，输出照常显示，同时逐批解析；
+# 构建结束后把诊断写入 <构建目录>/.build_logs/diagnostics-<预设>.json，按 "文件:行号" 索引并记录出现次数，
+# IDE 可以直接读取，不需要重新构建。与上一次构建的索引比较，列出新出现的警告。
+#
+# 支持的格式:
+#   GCC / Clang:   src/a.cpp:12:5: warning: unused variable 'x' [-Wunused-variable]
+#   MSVC:          C:\src\a.cpp(12,5): warning C4101: 'x': unreferenced local variable
+#   MSVC 链接器:   main.obj : error LNK2019: unresolved external symbol ...
+#   GNU ld / lld:  main.cpp:(.text+0x9): undefined reference to `foo()'、/usr/bin/ld: error: ...
+#   CMake:         CMake Error at CMakeLists.txt:12 (add_executable):  (说明在随后缩进的行中)
+#
+# "新警告" 按 (文件, 严重程度, 代码, 消息) 比较，不比较行号，编辑文件使行号移动不会被当作新警告。
+# 增量构建只编译部分文件，未出现在本次输出中的文件沿用上一次记录的警告作为比较基准。
+
+# --- 配置 ---
+# CMAKE_WORKFLOW_DIAGNOSTICS=0 时不收集诊断
+DIAGNOSTICS_ENABLED = os.environ.get("CMAKE_WORKFLOW_DIAGNOSTICS", "1") != "0"
+INDEX_FILE_PREFIX = "diagnostics-"
+INDEX_VERSION = 1
+NEW_WARNINGS_SHOWN = 20 # 构建结束时最多列出的新警告条数
+MAX_MESSAGE_LENGTH = 500
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+WINDOWS_ABSOLUTE_PATH_PATTERN = re.compile(r'^[A-Za-z]:/')
+ANSI_ESCAPE_PATTERN = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+GCC_PATTERN = re.compile(
+    r'^(?P<file>[^\s:][^:]*(?::[\\/][^:]*)?):(?P<line>\d+):(?:(?P<column>\d+):)? '
+    r'(?P<severity>fatal error|error|warning): (?P<message>.*?)(?: \[(?P<code>[^\]]+)\])?$')
+MSVC_PATTERN = re.compile(
+    r'^(?P<file>.+?)(?:\((?P<line>\d+)(?:,(?P<column>\d+))?\))?\s*: '
+    r'(?P<severity>fatal error|error|warning) (?P<code>[A-Z]+\d+)\s*: (?P<message>.*)$')
+UNDEFINED_REFERENCE_PATTERN = re.compile(
+    r'(?:^|: )(?P<file>[^\s:][^:]*):(?:(?P<line>\d+)|\([^)]*\)): (?P<message>undefined reference to .*)$')
+TOOL_PATTERN = re.compile(
+    r'^(?:\S*[\\/])?(?P<tool>ld(?:\.\w+)?|ld64\.lld|lld-link|collect2|ninja|cc1plus|cc1|clang(?:\+\+)?|g\+\+|gcc|c\+\+)'
+    r'(?:\.exe)?: (?P<severity>fatal error|error|warning): (?P<message>.*)$')
+CMAKE_PATTERN = re.compile(
+    r'^CMake (?:Deprecation )?(?P<severity>Error|Warning)(?: \((?P<code>[^)]+)\))?'
+    r'(?: at (?P<file>.+?):(?P<line>\d+) \((?P<command>[^)]*)\))?:\s*(?P<message>.*)$')
+
+
+class Diagnostic:
+    __slots__ = ("file", "line", "column", "severity", "code", "message", "tool", "count")
+
+    def __init__(self, file, line, column, severity, code, message, tool):
+        self.file = file
+        self.line = line
+        self.column = column
+        self.severity = severity # "error" 或 "warning"
+        self.code = code # 如 "-Wunused-variable"、"C4101"、"LNK2019"，没有时为 None
+        self.message = message
+        self.tool = tool # "compiler"、"linker" 或 "cmake"
+        self.count = 1
+
+    @property
+    def key(self):
+        return f"{self.file}:{self.line}"
+
+    @property
+    def signature(self):
+        return f"{self.severity}|{self.code or ''}|{self.message}"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        diagnostic = cls(data.get("file", ""), data.get("line", 0), data.get("column"), data.get("severity", "warning"),
+                         data.get("code"), data.get("message", ""), data.get("tool"))
+        diagnostic.count = data.get("count", 1)
+        return diagnostic
+
+    def format(self):
+        location = self.file or self.tool or "?"
+        if self.line:
+            location += f":{self.line}" + (f":{self.column}" if self.column else "")
+        text = f"{location}: {self.severity}: {self.message}"
+        if self.code:
+            text += f" [{self.code}]"
+        if self.count > 1:
+            text += f" (x{self.count})"
+        return text
+
+
+def index_path_for(binary_dir, label):
+    safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)
+    return os.path.join(binary_dir, NinjaProgress.BUILD_LOG_DIR_NAME, f"{INDEX_FILE_PREFIX}{safe_label}.json")
+
+
+def load_index(binary_dir, label):
+    """读取上一次构建保存的诊断索引，不存在或无法解析时返回 None。"""
+    try:
+        with open(index_path_for(binary_dir, label), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if isinstance(index, dict) and index.get("version") == INDEX_VERSION else None
+
+
+def _normalize_severity(severity):
+    return "error" if "error" in severity.lower() else "warning"
+
+
+class DiagnosticCollector:
+    """AsyncProcessRunner 的 sink: 把输出原样交给 inner_sink，同时解析其中的诊断。
+    编译器和链接器输出的相对路径相对于 binary_dir (ninja 在构建目录中执行编译命令)，CMake 输出的相对路径相对于 source_dir；
+    未给出 source_dir 时 CMake 诊断的相对路径保持原样 (它们不在构建目录中)。"""
+
+    def __init__(self, binary_dir, label, inner_sink=None, source_dir=None, stream=None):
+        self.binary_dir = binary_dir
+        self.label = label
+        self.inner_sink = inner_sink
+        self.source_dir = source_dir
+        self.stream = stream or sys.stdout
+        self.diagnostics = {} # (key, signature) -> Diagnostic，按首次出现的顺序
+        self._pending_cmake = None # 等待后续缩进行补充说明的 CMake 诊断
+        self._pending_message = []
+
+    def write_lines(self, lines):
+        if self.inner_sink is not None:
+            self.inner_sink.write_lines(lines)
+        self.parse_lines(lines)
+
+    def parse_lines(self, lines):
+        start = 0
+        if self._pending_cmake is not None:
+            start = self._continue_cmake(lines, 0)
+            if self._pending_cmake is not None:
+                return
+        text = "".join(lines[start:])
+        if "\x1b" in text:
+            lines = [ANSI_ESCAPE_PATTERN.sub("", line) for line in lines]
+            text = "".join(lines[start:])
+        # 与着色共用同一个快速扫描，只有包含 error / warning 的行才逐一匹配各种格式
+        candidates = sorted(index + start for index in OutputColorizer.classify_lines(lines[start:]))
+        if "undefined reference" in text:
+            candidates = sorted(set(candidates).union(index for index in range(start, len(lines))
+                                                      if "undefined reference" in lines[index]))
+        skip_until = start
+        for index in candidates:
+            if index < skip_until:
+                continue
+            skip_until = self._parse_line(lines, index)
+
+    def _parse_line(self, lines, index):
+        """解析第 index 行，返回下一个需要解析的行号 (CMake 诊断会消耗随后的说明行)。"""
+        line = lines[index].rstrip("\r\n")
+        stripped = line.strip()
+        match = CMAKE_PATTERN.match(stripped)
+        if match is not None:
+            file = match.group("file") or ""
+            if file and self.source_dir:
+                file = self._resolve(file, self.source_dir)
+            self._pending_cmake = Diagnostic(file, int(match.group("line") or 0), None, _normalize_severity(match.group("severity")),
+                                             match.group("code"), "", "cmake")
+            self._pending_message = [match.group("message")] if match.group("message") else []
+            return self._continue_cmake(lines, index + 1)
+        match = GCC_PATTERN.match(stripped)
+        if match is not None:
+            self._add(self._resolve(match.group("file"), self.binary_dir), match.group("line"), match.group("column"),
+                      match.group("severity"), match.group("code"), match.group("message"), "compiler")
+            return index + 1
+        match = MSVC_PATTERN.match(stripped)
+        if match is not None:
+            code = match.group("code")
+            tool = "linker" if code.startswith("LNK") else "compiler"
+            file = match.group("file").strip()
+            # 链接器诊断的 "文件" 是 LINK 或目标文件，不是源文件位置
+            file = file if tool == "linker" else self._resolve(file, self.binary_dir)
+            self._add(file, match.group("line"), match.group("column"), match.group("severity"), code,
+                      match.group("message"), tool)
+            return index + 1
+        match = UNDEFINED_REFERENCE_PATTERN.search(stripped)
+        if match is not None:
+            self._add(self._resolve(match.group("file"), self.binary_dir), match.group("line"), None, "error", None,
+                      match.group("message"), "linker")
+            return index + 1
+        match = TOOL_PATTERN.match(stripped)
+        if match is not None:
+            tool = match.group("tool")
+            self._add(tool, 0, None, match.group("severity"), None, match.group("message"),
+                      "linker" if tool.startswith(("ld", "lld", "collect2")) else "compiler")
+        return index + 1
+
+    def _continue_cmake(self, lines, index):
+        """收集 CMake 诊断随后的缩进说明行，遇到空行或不缩进的行时结束；本批行用完时留到下一批继续。"""
+        while index < len(lines):
+            line = lines[index].rstrip("\r\n")
+            if line.startswith((" ", "\t")) and line.strip():
+                self._pending_message.append(line.strip())
+                index += 1
+            elif not line.strip() and not self._pending_message:
+                index += 1 # 标题行与说明之间的空行
+            else:
+                self._finish_cmake()
+                return index
+        return index
+
+    def _finish_cmake(self):
+        diagnostic, self._pending_cmake = self._pending_cmake, None
+        if diagnostic is not None:
+            diagnostic.message = " ".join(self._pending_message)[:MAX_MESSAGE_LENGTH]
+            self._pending_message = []
+            self._insert(diagnostic)
+
+    def _resolve(self, path, base_dir):
+        path = path.replace("\\", "/")
+        if not os.path.isabs(path) and not WINDOWS_ABSOLUTE_PATH_PATTERN.match(path):
+            path = os.path.join(base_dir, path)
+        return os.path.normpath(path).replace("\\", "/")
+
+    def _add(self, file, line, column, severity, code, message, tool):
+        self._insert(Diagnostic(file, int(line or 0), int(column) if column else None, _normalize_severity(severity),
+                                code, message.strip()[:MAX_MESSAGE_LENGTH], tool))
+
+    def _insert(self, diagnostic):
+        # 头文件中的警告会在每个包含它的编译单元中重复出现，只记录一次并计数
+        slot = (diagnostic.key, diagnostic.signature)
+        existing = self.diagnostics.get(slot)
+        if existing is not None:
+            existing.count += 1
+        else:
+            self.diagnostics[slot] = diagnostic
+
+    def counts(self):
+        counts = {"error": 0, "warning": 0}
+        for diagnostic in self.diagnostics.values():
+            counts[diagnostic.severity] += 1
+        return counts
+
+    def save(self, succeeded, command=None):
+        """写入诊断索引，返回 (索引路径或 None, 新警告列表；没有上一次的索引时为 None)。"""
+        self._finish_cmake()
+        previous = load_index(self.binary_dir, self.label)
+        known = {file: set(signatures) for file, signatures in (previous or {}).get("known", {}).items()}
+        new_warnings = None
+        if previous is not None:
+            new_warnings = [diagnostic for diagnostic in self.diagnostics.values()
+                            if diagnostic.severity == "warning" and diagnostic.signature not in known.get(diagnostic.file, ())]
+        # 本次输出中出现的文件用本次的诊断替换基准，其余文件沿用上一次的记录
+        current = {}
+        for diagnostic in self.diagnostics.values():
+            current.setdefault(diagnostic.file, set()).add(diagnostic.signature)
+        known.update(current)
+
+        by_location = {}
+        for diagnostic in self.diagnostics.values():
+            by_location.setdefault(diagnostic.key, []).append(diagnostic.to_dict())
+        index = {
+            "version": INDEX_VERSION,
+            "label": self.label,
+            "command": command,
+            "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "succeeded": succeeded,
+            "counts": self.counts(),
+            "diagnostics": by_location,
+            "new_warnings": [diagnostic.to_dict() for diagnostic in new_warnings] if new_warnings is not None else None,
+            "known": {file: sorted(signatures) for file, signatures in known.items()},
+        }
+        path = index_path_for(self.binary_dir, self.label)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            AtomicWriteBack.atomic_write_text(path, json.dumps(index, ensure_ascii=False, indent=1), record=False)
+        except OSError:
+            path = None
+        return path, new_warnings
+
+    def close(self, succeeded, command=None):
+        """保存索引并打印诊断汇总 (有新警告时列出)。"""
+        path, new_warnings = self.save(succeeded, command)
+        counts = self.counts()
+        if not counts["error"] and not counts["warning"] and not new_warnings:
+            return
+        summary = f"诊断: {RED}{counts['error']} 个错误{RESET}，{YELLOW}{counts['warning']} 个警告{RESET}"
+        if new_warnings is not None:
+            summary += f" (新增警告 {len(new_warnings)} 个)"
+        parts = [summary + "\n"]
+        for diagnostic in (new_warnings or [])[:NEW_WARNINGS_SHOWN]:
+            parts.append(f"  {YELLOW}新增{RESET} {diagnostic.format()}\n")
+        if new_warnings and len(new_warnings) > NEW_WARNINGS_SHOWN:
+            parts.append(f"  ... 另有 {len(new_warnings) - NEW_WARNINGS_SHOWN} 个新警告\n")
+        if path:
+            parts.append(f"  诊断索引: {path}\n")
+        self.stream.write("".join(parts))
+        self.stream.flush()
+
+
+def print_index(binary_dir, label, new_only=False, stream=None):
+    """按编译器的格式打印上一次构建保存的诊断 (终端和 IDE 可以直接跳转到位置)。返回是否找到索引。"""
+    stream = stream or sys.stdout
+    index = load_index(binary_dir, label)
+    if index is None:
+        stream.write(f"{YELLOW}没有预设 '{label}' 的诊断记录 ({index_path_for(binary_dir, label)})。{RESET}\n")
+        return False
+    if new_only:
+        diagnostics = [Diagnostic.from_dict(data) for data in index.get("new_warnings") or []]
+    else:
+        diagnostics = [Diagnostic.from_dict(data) for entries in index.get("diagnostics", {}).values() for data in entries]
+    counts = index.get("counts", {})
+    status = f"{GREEN}成功{RESET}" if index.get("succeeded") else f"{RED}失败{RESET}"
+    stream.write(f"{BLUE}上一次构建 ({index.get('finished_at')}，{status}{BLUE}):{RESET} "
+                 f"{counts.get('error', 0)} 个错误，{counts.get('warning', 0)} 个警告\n")
+    for diagnostic in diagnostics:
+        color = RED if diagnostic.severity == "error" else YELLOW
+        stream.write(f"{color}{diagnostic.format()}{RESET}\n")
+    if new_only and index.get("new_warnings") is None:
+        stream.write("(这是第一次记录，没有可比较的上一次构建)\n")
+    stream.flush()
+    return True
@@ -1,12 +1,23 @@
-import json
 import os
 import platform
-import subprocess
 from pathlib import Path
 import shlex
 import re # 新增
 import sys # 新增
-import threading # 新增
+import argparse
+import asyncio
+import fnmatch
+import time
+
+import AsyncProcessRunner
+import OutputColorizer
+import NinjaLogAnalyzer
+import AffectedTargets
+import NinjaProgress
+import NinjaDepsReader
+import BuildDiagnostics
+import PresetResolver
+import FileWatcher
 
 # ANSI 转义码
 RED = "\033[91m"
@@ -18,93 +29,68 @@ RESET = "\033[0m"
 # 获取当前环境变量（副本）
 global_env = os.environ.copy()
 
-def color_line(line):
-    """根据行内容应用 ANSI 颜色转义码。"""
-    # MSVC and GCC/Clang error/warning patterns
-    # General "error" or "warning"
-    if re.search(r'\berror\b', line, re.IGNORECASE) or \
-            re.search(r'CMake Error', line): # CMake specific error
-        return RED + line + RESET
-    elif re.search(r'\bwarning\b', line, re.IGNORECASE) or \
-            re.search(r'CMake Warning', line): # CMake specific warning
-        return YELLOW + line + RESET
-    return line
-
-def stream_output(stream, color_func):
-    """从流中读取数据，着色后输出到 sys.stdout。"""
+# 执行构建预设后分析其构建目录中的 .ninja_log，记录耗时历史并报告最慢的输出和回退 (见 NinjaLogAnalyzer.py)
+# CMAKE_WORKFLOW_BUILD_TIMINGS=0 关闭
+BUILD_TIMINGS_ENABLED = os.environ.get("CMAKE_WORKFLOW_BUILD_TIMINGS", "1") != "0"
+
+# 监听模式: 源码改动后只增量构建受影响的目标 (见 run_watch_mode)
+WATCH_DEBOUNCE_SECONDS = 0.3 # 一次保存往往产生多个事件，静默这么久后才开始构建
+WATCH_MAX_WAIT_SECONDS = 2.0 # 事件持续不断时最多推迟这么久
+# 不监听的目录: 以 "." 开头的目录 (.git、.vs、.idea 等)、cmake-build-* 和下面这些名字，以及所有配置预设的 binaryDir
+WATCH_PRUNED_DIR_NAMES = {"build", "out", "node_modules", "vcpkg_installed", "vcpkg", "_deps", "__pycache__"}
+# 编辑器的临时文件 / 备份文件 (vim 的 .swp 和 4913、emacs 的 .#xxx、xxx~ 等)
+WATCH_IGNORED_FILE_PATTERN = re.compile(r'(\.sw[a-p]x?$|~$|^\.#|^4913$|\.tmp$)')
+# CMAKE_WORKFLOW_WATCH_DIRECT_NINJA=0 时监听模式每轮也经由 cmake --build --preset
+WATCH_DIRECT_NINJA = os.environ.get("CMAKE_WORKFLOW_WATCH_DIRECT_NINJA", "1") != "0"
+
+def run_command(command_parts, env, cwd_path=None, progress=None, timeout=AsyncProcessRunner.DEFAULT_TIMEOUT, diagnostics=None):
+    """执行命令，实时着色其 stdout 和 stderr 输出 (见 AsyncProcessRunner.py)。
+    progress 不为 None 时显示单行构建状态 (见 NinjaProgress.py)；diagnostics 不为 None 时收集并保存诊断 (见 BuildDiagnostics.py)。"""
+    # 使用 shlex.quote 来安全地将列表转换为适合打印的命令字符串
+    command_to_display = ' '.join(shlex.quote(str(part)) for part in command_parts)
+    print(f"\n{BLUE}▶️  执行命令:{RESET} {command_to_display}")
+    if cwd_path:
+        print(f"{BLUE}  (在目录:{RESET} {cwd_path})")
+
+    result = None
+    sink = progress or OutputColorizer.ColorizingSink(sys.stdout)
+    if diagnostics is not None:
+        diagnostics.inner_sink = sink
+        sink = diagnostics
     try:
-        # 使用 text=True 时，stream 会是文本流，可以直接迭代 readline
-        for line_str in iter(stream.readline, ''):
-            sys.stdout.write(color_func(line_str))
-            sys.stdout.flush() # 确保立即输出
-        stream.close()
-    except Exception as e:
-        # 确保错误信息本身也被着色，如果可能的话
-        sys.stdout.write(f"{RED}读取流时发生错误: {e}{RESET}\n")
-        sys.stdout.flush()
-
-
-def run_command(command_parts, env, cwd_path=None):
-    """执行命令，实时着色其 stdout 和 stderr 输出。"""
-    try:
-        # 使用 shlex.join 来安全地将列表转换为适合打印的命令字符串
-        # (注意：实际执行时 Popen 仍使用列表形式的 command_parts)
-        command_to_display = ' '.join(shlex.quote(str(part)) for part in command_parts)
-        print(f"\n{BLUE}▶️  执行命令:{RESET} {command_to_display}")
-        if cwd_path:
-            print(f"{BLUE}  (在目录:{RESET} {cwd_path})")
-
-        process = subprocess.Popen(
-            command_parts, # 应该是列表形式，shell=False
-            env=env,
-            cwd=cwd_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True, # 使 stdout/stderr 成为文本流
-            encoding='utf-8',
-            errors='replace', #替换无法解码的字符
-            bufsize=1,        # 行缓冲
-            shell=False       # 为了安全性和可预测性，使用 False
-        )
-
-        stdout_thread = threading.Thread(target=stream_output, args=(process.stdout, color_line))
-        stderr_thread = threading.Thread(target=stream_output, args=(process.stderr, color_line))
-
-        stdout_thread.start()
-        stderr_thread.start()
-
-        stdout_thread.join()
-        stderr_thread.join()
-
-        return_code = process.wait() # 等待进程结束并获取返回码
-
-        if return_code == 0:
-            print(f"{GREEN}✅ 命令成功执行 (返回码: {return_code})。{RESET}")
-            return True
-        else:
-            print(f"{RED}❌ 命令执行失败 (返回码: {return_code})。{RESET}")
-            return False
-
+        result = AsyncProcessRunner.run(command_parts, env=env, cwd=cwd_path, timeout=timeout, sink=sink)
     except FileNotFoundError:
         print(f"{RED}❌ 错误: 命令 '{command_parts[0]}' 未找到。请确保它已安装并在系统 PATH 中。{RESET}")
         return False
     except Exception as e:
         print(f"{RED}❌ 执行命令时发生未知错误: {e}{RESET}")
-        # import traceback # 可选，用于调试
-        # traceback.print_exc() # 可选，用于调试
         return False
+    finally:
+        if progress is not None:
+            progress.close(result is not None and result.ok)
+        if diagnostics is not None:
+            diagnostics.close(result is not None and result.ok, command_to_display)
+
+    if result.timed_out:
+        print(f"{RED}❌ 命令超时 (超过 {timeout:g} 秒)，已终止。{RESET}")
+        return False
+    if result.ok:
+        print(f"{GREEN}✅ 命令成功执行 (返回码: {result.returncode}，耗时 {result.duration:.1f}s)。{RESET}")
+        return True
+    print(f"{RED}❌ 命令执行失败 (返回码: {result.returncode})。{RESET}")
+    return False
 
 def load_presets_data(project_dir_str):
-    """加载并解析 CMakePresets.json 文件。"""
+    """加载 CMakePresets.json 和 CMakeUserPresets.json (包括 include)，返回与 CMakePresets.json 结构相同的字典，
+    其中的预设已展开继承、条件已计算 (见 PresetResolver.py)。"""
     presets_file = Path(project_dir_str) / "CMakePresets.json"
     try:
-        with open(presets_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return PresetResolver.load_presets(project_dir_str).presets_data
     except FileNotFoundError:
         print(f"{RED}错误: CMakePresets.json 文件未在 '{presets_file}' 找到。{RESET}")
         return None
-    except json.JSONDecodeError:
-        print(f"{RED}错误: CMakePresets.json 文件 '{presets_file}' 格式无效。{RESET}")
+    except PresetResolver.PresetError as e:
+        print(f"{RED}错误: {e}{RESET}")
         return None
     except Exception as e:
         print(f"{RED}加载 CMakePresets.json 文件 '{presets_file}' 时发生错误: {e}{RESET}")
@@ -118,23 +104,9 @@ def get_current_os_name():
     if system == "Linux": return "Linux"
     return system
 
-def is_preset_condition_met(preset, current_os_name, debug_prefix=""):
-    """检查预设的 'condition' 是否满足当前操作系统。"""
-    preset_name = preset.get('name', "Unnamed")
-    if 'condition' not in preset: return True
-    condition = preset['condition']
-    if isinstance(condition, bool): return condition
-    if isinstance(condition, dict):
-        cond_type = condition.get('type')
-        cond_lhs = condition.get('lhs')
-        cond_rhs = condition.get('rhs')
-        if cond_lhs == '${hostSystemName}':
-            if cond_type == 'equals': return cond_rhs == current_os_name
-            if cond_type == 'notEquals': return cond_rhs != current_os_name
-        if cond_type == 'always': return True
-        if cond_type == 'never': return False
-        return False
-    return False
+def is_preset_condition_met(preset):
+    """检查预设的 'condition' 是否满足 (PresetResolver 已按当前主机把条件计算为布尔值)。"""
+    return preset.get('condition', True) is True
 
 def get_all_presets_by_name(presets_data):
     """将所有类型的预设按名称存入字典，方便查找。"""
@@ -145,35 +117,34 @@ def get_all_presets_by_name(presets_data):
                 all_presets[preset['name']] = preset
     return all_presets
 
-def is_preset_visible_and_valid(preset, current_os_name, debug_prefix=""):
-    """检查预设是否可见 (非隐藏) 且其条件满足当前操作系统。"""
+def is_preset_visible_and_valid(preset):
+    """检查预设是否可见 (非隐藏) 且其条件满足。"""
     if preset.get('hidden', False): return False
-    return is_preset_condition_met(preset, current_os_name, debug_prefix)
+    return is_preset_condition_met(preset)
 
-def get_all_valid_configure_preset_names_for_os(presets_data, current_os_name, all_presets_map):
-    """获取对当前操作系统其自身条件满足的配置预设 (configurePresets) 的名称集合。"""
+def get_valid_configure_preset_names(presets_data):
+    """获取自身条件满足的配置预设 (configurePresets) 的名称集合。"""
     valid_names = set()
     for preset in presets_data.get('configurePresets', []):
         name = preset.get('name')
         if not name: continue
-        if is_preset_condition_met(preset, current_os_name, debug_prefix=f"  CfgValid Check (direct for {name}): "):
+        if is_preset_condition_met(preset):
             valid_names.add(name)
     return valid_names
 
-def get_visible_configure_presets_for_os(presets_data, current_os_name, all_presets_map):
-    """获取对当前操作系统可见 (非隐藏且条件满足) 的配置预设列表。"""
+def get_visible_configure_presets(presets_data):
+    """获取可见 (非隐藏且条件满足) 的配置预设列表。"""
     visible_and_valid_presets = []
     for preset in presets_data.get('configurePresets', []):
-        if is_preset_visible_and_valid(preset, current_os_name, debug_prefix="  VisibleCfgCheck: "):
+        if is_preset_visible_and_valid(preset):
             visible_and_valid_presets.append(preset)
     return visible_and_valid_presets
 
-def get_dependent_presets(preset_list_key, presets_data, valid_cfg_names, current_os, all_presets_map):
+def get_dependent_presets(preset_list_key, presets_data, valid_cfg_names):
     """获取特定类型 (构建、测试、打包) 的活动预设。"""
     active_presets = []
     for preset in presets_data.get(preset_list_key, []):
-        name = preset.get('name', 'N/A_DepPreset')
-        if not is_preset_visible_and_valid(preset, current_os, debug_prefix=f"    Dep Check '{name}': "):
+        if not is_preset_visible_and_valid(preset):
             continue
         cfg_name = preset.get('configurePreset')
         if not cfg_name or cfg_name not in valid_cfg_names:
@@ -181,20 +152,18 @@ def get_dependent_presets(preset_list_key, presets_data, valid_cfg_names, curren
         active_presets.append(preset)
     return active_presets
 
-def get_active_workflow_presets(presets_data, valid_cfg_names, current_os, all_presets_map):
+def get_active_workflow_presets(presets_data, valid_cfg_names, all_presets_map):
     """获取活动的工作流预设。工作流预设及其所有步骤都必须满足条件。"""
     active_workflows = []
     for preset in presets_data.get('workflowPresets', []):
-        wf_name = preset.get('name', "N/A_WF")
-        if not is_preset_visible_and_valid(preset, current_os, debug_prefix=f"    WF Self Check '{wf_name}': "):
+        if not is_preset_visible_and_valid(preset):
             continue
         steps_ok = True
         for step in preset.get("steps", []):
             step_name = step.get("name")
             step_type = step.get("type")
             step_preset_obj = all_presets_map.get(step_name)
-            if not step_preset_obj or \
-                    not is_preset_visible_and_valid(step_preset_obj, current_os, debug_prefix=f"      WF '{wf_name}', Step '{step_name}' Check: "):
+            if not step_preset_obj or not is_preset_visible_and_valid(step_preset_obj):
                 steps_ok = False; break
             if step_type in ["build", "test", "package"]:
                 step_cfg_preset_name = step_preset_obj.get("configurePreset")
@@ -231,7 +200,7 @@ def display_menu_and_get_choice(options_list, prompt_message="请选择一个选
 
     for i, (display_name, actual_name) in enumerate(menu_items):
         print(f"  {i + 1}. {display_name}" + (f" ({actual_name})" if display_name != actual_name else ""))
-    print(f"  0. 返回/退出")
+    print("  0. 返回/退出")
 
     while True:
         try:
@@ -247,16 +216,356 @@ def display_menu_and_get_choice(options_list, prompt_message="请选择一个选
             print(f"\n{YELLOW}操作已取消。{RESET}")
             raise
 
+def get_build_preset_binary_dir(build_preset, all_presets_map, project_dir):
+    """返回构建预设所用配置预设的 binaryDir (展开 ${sourceDir} / ${sourceDirName} / ${presetName})；无法确定时返回 None。"""
+    configure_name = build_preset.get('configurePreset')
+    configure_preset = all_presets_map.get(configure_name) if configure_name else None
+    if configure_preset is None:
+        return None
+    binary_dir_template = configure_preset.get('binaryDir')
+    if not binary_dir_template:
+        return None
+    binary_dir = binary_dir_template.replace("${sourceDir}", str(project_dir)) \
+        .replace("${sourceDirName}", Path(project_dir).name).replace("${presetName}", configure_name)
+    binary_dir_path = Path(binary_dir)
+    if not binary_dir_path.is_absolute():
+        binary_dir_path = Path(project_dir) / binary_dir_path
+    return binary_dir_path.resolve()
+
+def create_build_progress(build_preset_name, all_presets_map, project_dir):
+    """为 Ninja 构建目录创建单行进度显示；未启用或不是 Ninja 构建目录时返回 None (照常逐行输出)。"""
+    if not NinjaProgress.PROGRESS_ENABLED:
+        return None
+    build_preset = all_presets_map.get(build_preset_name)
+    binary_dir = get_build_preset_binary_dir(build_preset, all_presets_map, project_dir) if build_preset else None
+    if binary_dir is None or not (binary_dir / AffectedTargets.MANIFEST_NAME).is_file():
+        return None
+    return NinjaProgress.BuildProgress(str(binary_dir), build_preset_name)
+
+def get_preset_binary_dir(preset_type, preset, all_presets_map, project_dir):
+    """工作流预设取其配置步骤的构建目录，构建预设取其配置预设的构建目录；无法确定时返回 None。"""
+    if preset_type == "workflow":
+        configure_step = next((step for step in preset.get("steps", []) if step.get("type") == "configure"), None)
+        return get_build_preset_binary_dir({'configurePreset': configure_step.get("name")}, all_presets_map,
+                                           project_dir) if configure_step else None
+    return get_build_preset_binary_dir(preset, all_presets_map, project_dir)
+
+def create_build_diagnostics(binary_dir, label, project_dir):
+    """创建诊断收集器；未启用或无法确定构建目录时返回 None。"""
+    if not BuildDiagnostics.DIAGNOSTICS_ENABLED or binary_dir is None:
+        return None
+    return BuildDiagnostics.DiagnosticCollector(str(binary_dir), label, source_dir=str(project_dir))
+
+def analyze_build_timings(build_preset_name, all_presets_map, project_dir):
+    """导入构建预设对应构建目录中 .ninja_log 的新内容，并打印耗时报告。返回是否成功。"""
+    build_preset = all_presets_map.get(build_preset_name)
+    binary_dir = get_build_preset_binary_dir(build_preset, all_presets_map, project_dir) if build_preset else None
+    if binary_dir is None:
+        print(f"{YELLOW}无法确定构建预设 '{build_preset_name}' 的构建目录，跳过构建耗时分析。{RESET}")
+        return False
+    return NinjaLogAnalyzer.analyze_build_dir(str(binary_dir), build_preset_name, project_dir=str(project_dir))
+
+def get_all_binary_dirs(all_presets_map, project_dir):
+    """所有配置预设的构建目录 (字符串集合)。"""
+    binary_dirs = set()
+    for preset in all_presets_map.values():
+        if 'generator' in preset or 'binaryDir' in preset:
+            candidate = get_build_preset_binary_dir({'configurePreset': preset['name']}, all_presets_map, project_dir)
+            if candidate is not None:
+                binary_dirs.add(str(candidate))
+    return binary_dirs
+
+def run_affected_build_and_test(build_preset_name, all_presets_map, project_dir, cmake_exe, ctest_exe, active_tests,
+                                base_ref=None, changed_files=None):
+    """只构建受改动影响的目标，再用 ctest -R 只运行受影响的测试 (见 AffectedTargets.py)。返回是否全部成功。"""
+    build_preset = all_presets_map.get(build_preset_name)
+    binary_dir = get_build_preset_binary_dir(build_preset, all_presets_map, project_dir) if build_preset else None
+    if binary_dir is None or not (binary_dir / AffectedTargets.MANIFEST_NAME).is_file():
+        print(f"{YELLOW}构建预设 '{build_preset_name}' 的构建目录中没有 {AffectedTargets.MANIFEST_NAME}，"
+              f"受影响模式需要 Ninja 生成器并已完成配置。{RESET}")
+        return False
+    try:
+        changed = changed_files or AffectedTargets.git_changed_files(str(project_dir), base_ref)
+        # 源码树内的构建目录未被 gitignore 时，其中生成的 *.cmake 会被当作改动的配置文件
+        result = AffectedTargets.compute_affected(str(binary_dir), changed,
+                                                  excluded_dirs=get_all_binary_dirs(all_presets_map, project_dir))
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"{RED}计算受影响的目标失败: {e}{RESET}")
+        return False
+    AffectedTargets.print_affected(result)
+    return build_and_test_affected(result, build_preset_name, all_presets_map, project_dir, binary_dir,
+                                   cmake_exe, ctest_exe, active_tests)
+
+def build_and_test_affected(result, build_preset_name, all_presets_map, project_dir, binary_dir, cmake_exe, ctest_exe,
+                            active_tests, run_tests=True, build_command_for_targets=None, analyze_timings=BUILD_TIMINGS_ENABLED):
+    """按 AffectedTargets.compute_affected() 的结果构建，再 (可选) 运行受影响的测试。返回是否全部成功。
+    build_command_for_targets(targets) 返回只构建这些目标的命令，默认使用 cmake --build --preset。"""
+    build_preset = all_presets_map.get(build_preset_name)
+    # 测试优先使用同一配置预设的测试预设，没有时直接指定构建目录
+    configure_name = build_preset.get('configurePreset')
+    test_preset = next((tp for tp in active_tests
+                        if tp.get('configurePreset') == configure_name), None)
+    test_command = [ctest_exe, "--preset", test_preset['name']] if test_preset else [ctest_exe, "--test-dir", str(binary_dir)]
+
+    if result.everything:
+        # 配置文件改动需要 cmake 重新配置，始终经由 cmake --build
+        build_command = [cmake_exe, "--build", "--preset", build_preset_name]
+    elif result.targets:
+        build_command = build_command_for_targets(result.targets) if build_command_for_targets else \
+            [cmake_exe, "--build", "--preset", build_preset_name, "--target", *result.targets]
+    else:
+        return True
+    build_ok = run_command(build_command, global_env, cwd_path=project_dir,
+                           progress=create_build_progress(build_preset_name, all_presets_map, project_dir),
+                           diagnostics=create_build_diagnostics(binary_dir, build_preset_name, project_dir))
+    if analyze_timings:
+        analyze_build_timings(build_preset_name, all_presets_map, project_dir)
+    if not build_ok or not run_tests:
+        return build_ok
+
+    if not result.everything:
+        try:
+            tests = AffectedTargets.find_affected_tests(str(binary_dir), result, ctest_exe)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"{RED}查询受影响的测试失败: {e}{RESET}")
+            return False
+        if not tests:
+            print(f"{GREEN}没有受影响的测试。{RESET}")
+            return True
+        print(f"{BLUE}受影响的测试 ({len(tests)}):{RESET} {' '.join(tests)}")
+        test_command += ["-R", AffectedTargets.ctest_regex(tests)]
+    return run_command(test_command + ["--output-on-failure"], global_env, cwd_path=project_dir)
+
+def read_cmake_cache_value(binary_dir, key):
+    """从 <binary_dir>/CMakeCache.txt 读取 KEY:TYPE=VALUE 形式的缓存项，不存在时返回 None。"""
+    try:
+        with open(Path(binary_dir) / "CMakeCache.txt", 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                name, sep, value = line.partition("=")
+                if sep and name.split(":", 1)[0] == key:
+                    return value.rstrip("\r\n")
+    except OSError:
+        pass
+    return None
+
+def get_direct_build_command(build_preset_name, all_presets_map, binary_dir):
+    """监听模式下直接调用构建目录所用的 ninja 构建目标，省去每次 cmake --build --preset 解析预设的开销。
+    预设 (或其配置预设) 定义了 environment、configuration 时返回 None，仍经由 cmake --build --preset。"""
+    build_preset = all_presets_map.get(build_preset_name)
+    configure_name = build_preset.get('configurePreset')
+    configure_preset = all_presets_map.get(configure_name) or {}
+    if build_preset.get('environment') or configure_preset.get('environment') or build_preset.get('configuration'):
+        return None
+    make_program = read_cmake_cache_value(binary_dir, "CMAKE_MAKE_PROGRAM")
+    if not make_program or Path(make_program).stem.lower() != "ninja" or not Path(make_program).is_file():
+        return None
+    jobs = build_preset.get('jobs')
+    native_options = build_preset.get('nativeToolOptions') or []
+
+    def build_command_for_targets(targets):
+        return [make_program, "-C", str(binary_dir), *(["-j", str(jobs)] if jobs else []), *native_options, *targets]
+    return build_command_for_targets
+
+def _is_watch_ignored_file(path):
+    return bool(WATCH_IGNORED_FILE_PATTERN.search(os.path.basename(path)))
+
+def _add_source_watches(watcher, directory, pruned_dirs, list_files=False):
+    """递归为 directory 下未被排除的目录添加监听，返回 (添加失败的目录数, list_files 时这些目录中已有的文件)。
+    文件在添加监听之后才列出，监听生效前创建的文件不会漏掉。"""
+    failed = 0
+    watched = []
+    for root, dir_names, _ in os.walk(directory):
+        dir_names[:] = [name for name in dir_names
+                        if not (name.startswith(".") or name in WATCH_PRUNED_DIR_NAMES or name.startswith("cmake-build-")
+                                or os.path.join(root, name) in pruned_dirs)]
+        if watcher.add_directory(root):
+            watched.append(root)
+        else:
+            failed += 1
+    files = []
+    for root in watched if list_files else ():
+        try:
+            with os.scandir(root) as entries:
+                files.extend(entry.path for entry in entries if entry.is_file())
+        except OSError:
+            continue
+    return failed, files
+
+def run_watch_mode(build_preset_name, all_presets_map, project_dir, cmake_exe, ctest_exe, active_tests, run_tests=False):
+    """监听源码目录，改动去抖合并后只增量构建受影响的目标 (可选运行受影响的测试)，直到 Ctrl+C。
+    预设、构建图和 .ninja_deps 索引在各轮之间保留，只在 build.ninja / .ninja_deps 变化后重新加载。"""
+    build_preset = all_presets_map.get(build_preset_name)
+    binary_dir = get_build_preset_binary_dir(build_preset, all_presets_map, project_dir) if build_preset else None
+    if binary_dir is None or not (binary_dir / AffectedTargets.MANIFEST_NAME).is_file():
+        print(f"{YELLOW}构建预设 '{build_preset_name}' 的构建目录中没有 {AffectedTargets.MANIFEST_NAME}，"
+              f"监听模式需要 Ninja 生成器并已完成配置。{RESET}")
+        return False
+
+    # 所有配置预设的构建目录都不监听，避免构建产物触发新一轮构建
+    pruned_dirs = {str(binary_dir)} | get_all_binary_dirs(all_presets_map, project_dir)
+
+    watcher = FileWatcher.create_watcher()
+    debouncer = FileWatcher.Debouncer(WATCH_DEBOUNCE_SECONDS, WATCH_MAX_WAIT_SECONDS)
+    failed, _ = _add_source_watches(watcher, str(project_dir), pruned_dirs)
+    print(f"{BLUE}监听模式 ({type(watcher).__name__}): 构建预设 '{build_preset_name}'，"
+          f"{len(watcher.watched_directories())} 个目录{'，构建后运行受影响的测试' if run_tests else ''}。按 Ctrl+C 退出。{RESET}")
+    if failed:
+        print(f"{YELLOW}有 {failed} 个目录无法监听 (可能超过了 fs.inotify.max_user_watches)，这些目录中的改动不会触发构建。{RESET}")
+
+    direct_build = get_direct_build_command(build_preset_name, all_presets_map, binary_dir) if WATCH_DIRECT_NINJA else None
+    loaded = {"key": None, "graph": None, "deps_index": None}
+
+    def warm_graph():
+        manifest = binary_dir / AffectedTargets.MANIFEST_NAME
+        deps_file = binary_dir / NinjaDepsReader.NINJA_DEPS_NAME
+        key = (manifest.stat().st_mtime_ns, deps_file.stat().st_mtime_ns if deps_file.is_file() else None)
+        if key[0] != (loaded["key"] or (None,))[0]:
+            loaded["graph"] = AffectedTargets.NinjaGraph(str(binary_dir))
+        if key[1] is not None and key[1] != (loaded["key"] or (None, None))[1]:
+            loaded["deps_index"] = NinjaDepsReader.load_deps_index(str(binary_dir))
+        loaded["key"] = key
+        return loaded["graph"], loaded["deps_index"]
+
+    def merge(old, new):
+        return old | new
+
+    try:
+        while True:
+            for event in watcher.read_events(debouncer.time_until_next(idle_timeout=1.0)):
+                if event.kind == "overflow":
+                    debouncer.add("changes", {None}, merge)
+                elif event.is_dir:
+                    if event.kind == "created" and not any(event.path == d or event.path.startswith(d + os.sep) for d in pruned_dirs):
+                        # 新目录: 补上监听，其中已经存在的文件也算作改动
+                        _, new_files = _add_source_watches(watcher, event.path, pruned_dirs, list_files=True)
+                        if new_files:
+                            debouncer.add("changes", set(new_files), merge)
+                elif not _is_watch_ignored_file(event.path):
+                    debouncer.add("changes", {event.path}, merge)
+
+            for _, changed in debouncer.pop_ready():
+                print(f"\n{BLUE}[{time.strftime('%H:%M:%S')}] 检测到 {len(changed)} 个文件改动。{RESET}")
+                started = time.monotonic()
+                try:
+                    if None in changed:
+                        # 事件队列溢出，无法确定改了哪些文件，构建整个预设
+                        result = AffectedTargets.AffectedResult()
+                        result.everything, result.reason = True, "监听事件队列溢出"
+                    else:
+                        graph, deps_index = warm_graph()
+                        result = AffectedTargets.compute_affected(str(binary_dir), sorted(changed), graph, deps_index,
+                                                                  excluded_dirs=pruned_dirs)
+                except (OSError, ValueError, RuntimeError) as e:
+                    print(f"{RED}计算受影响的目标失败: {e}{RESET}")
+                    continue
+                if not result.everything and not result.targets:
+                    print(f"{YELLOW}改动的文件不影响任何构建目标，跳过。{RESET}")
+                    continue
+                AffectedTargets.print_affected(result)
+                # 监听模式每轮都打印耗时报告太吵，不做 .ninja_log 分析
+                ok = build_and_test_affected(result, build_preset_name, all_presets_map, project_dir, binary_dir,
+                                             cmake_exe, ctest_exe, active_tests, run_tests, direct_build, analyze_timings=False)
+                color = GREEN if ok else RED
+                print(f"{color}[{time.strftime('%H:%M:%S')}] 本轮{'成功' if ok else '失败'}，耗时 {time.monotonic() - started:.2f}s。继续监听...{RESET}")
+    except KeyboardInterrupt:
+        print(f"\n{YELLOW}已退出监听模式。{RESET}")
+    finally:
+        watcher.close()
+    return True
+
+def collect_matrix_entries(patterns, active_workflows, active_builds, all_presets_map, project_dir):
+    """按 fnmatch 模式选出工作流预设和构建预设，返回 [(名称, 类型, 构建目录或 None)]。"""
+    entries = []
+    for preset_type, presets in (("workflow", active_workflows), ("build", active_builds)):
+        for preset in presets:
+            name = preset['name']
+            if not any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+                continue
+            entries.append((name, preset_type, get_preset_binary_dir(preset_type, preset, all_presets_map, project_dir)))
+    return entries
+
+def run_matrix(entries, project_dir, cmake_exe, total_jobs=None, timeout=AsyncProcessRunner.DEFAULT_TIMEOUT):
+    """并发执行多个工作流 / 构建预设: 构建目录相同的预设依次执行，其余并行；总并行度 total_jobs 平均分给同时运行的预设。
+    每行输出带 "[预设名] " 前缀，最后打印汇总表 (含各预设的诊断数量，诊断索引见 BuildDiagnostics.py)。返回是否全部成功。"""
+    total_jobs = total_jobs or os.cpu_count() or 1
+    lanes = {} # 构建目录 -> [(名称, 类型, 构建目录), ...]；无法确定构建目录的预设单独成组
+    for name, preset_type, binary_dir in entries:
+        lanes.setdefault(str(binary_dir) if binary_dir else f"<{preset_type}:{name}>", []).append((name, preset_type, binary_dir))
+    jobs_per_lane = max(1, total_jobs // len(lanes))
+    env = dict(global_env)
+    env["CMAKE_BUILD_PARALLEL_LEVEL"] = str(jobs_per_lane) # 预设本身定义了 jobs 时以预设为准
+    env["CTEST_PARALLEL_LEVEL"] = str(jobs_per_lane)
+    label_width = max(len(name) for name, _, _ in entries)
+
+    print(f"{BLUE}矩阵执行: {len(entries)} 个预设，{len(lanes)} 组并行，每组并行度 {jobs_per_lane} (总计 {total_jobs})。{RESET}")
+    for lane_key, lane in lanes.items():
+        if len(lane) > 1:
+            print(f"  {YELLOW}共用构建目录 {lane_key}，依次执行:{RESET} {' -> '.join(name for name, _, _ in lane)}")
+
+    async def run_lane(lane):
+        lane_results = []
+        for name, preset_type, binary_dir in lane:
+            command = [cmake_exe, "--workflow", "--preset", name] if preset_type == "workflow" \
+                else [cmake_exe, "--build", "--preset", name]
+            prefix = f"{BLUE}[{name.ljust(label_width)}]{RESET} "
+            command_to_display = ' '.join(shlex.quote(part) for part in command)
+            print(f"{prefix}▶️  {command_to_display}", flush=True)
+            sink = OutputColorizer.ColorizingSink(sys.stdout, prefix)
+            diagnostics = create_build_diagnostics(binary_dir, name, project_dir)
+            if diagnostics is not None:
+                diagnostics.inner_sink = sink
+                sink = diagnostics
+            result = None
+            try:
+                result = await AsyncProcessRunner.run_process(command, env=env, cwd=project_dir, timeout=timeout, sink=sink)
+            except FileNotFoundError:
+                print(f"{prefix}{RED}❌ 命令 '{command[0]}' 未找到。{RESET}", flush=True)
+            new_warnings = None
+            if diagnostics is not None:
+                _, new_warnings = diagnostics.save(result is not None and result.ok, command_to_display)
+            lane_results.append((name, preset_type, result, diagnostics, new_warnings))
+        return lane_results
+
+    async def run_all():
+        return await asyncio.gather(*(run_lane(lane) for lane in lanes.values()))
+
+    started = time.monotonic()
+    lane_results = AsyncProcessRunner.run_async(run_all())
+    # 预设名只在同一类型内唯一，工作流预设和构建预设可能同名
+    results = {(preset_type, name): rest for lane in lane_results for name, preset_type, *rest in lane}
+
+    print(f"\n{BLUE}矩阵执行汇总 (总耗时 {time.monotonic() - started:.1f}s):{RESET}")
+    print(f"  {'预设'.ljust(label_width)}  {'类型':<8}  {'状态':<6}  {'耗时':>8}  {'错误/警告 (新增)':<14}  构建目录")
+    all_ok = True
+    for name, preset_type, binary_dir in entries:
+        result, diagnostics, new_warnings = results[(preset_type, name)]
+        if diagnostics is not None:
+            counts = diagnostics.counts()
+            diagnostics_text = f"{counts['error']}/{counts['warning']}" + (f" (+{len(new_warnings)})" if new_warnings else "")
+        else:
+            diagnostics_text = "-"
+        if result is None:
+            status, color, duration = "未启动", RED, "-"
+        else:
+            duration = f"{result.duration:.1f}s"
+            if result.ok:
+                status, color = "成功", GREEN
+            elif result.timed_out:
+                status, color = "超时", RED
+            else:
+                status, color = f"失败({result.returncode})", RED
+        all_ok = all_ok and result is not None and result.ok
+        print(f"  {name.ljust(label_width)}  {preset_type:<8}  {color}{status:<6}{RESET}  {duration:>8}  {diagnostics_text:<14}  {binary_dir or '-'}")
+    return all_ok
+
 def handle_clean_action(presets_data, current_os, project_dir, global_env, cmake_exe):
     """处理 CMake 清理操作的逻辑。"""
-    while True:
-        all_presets_map = get_all_presets_by_name(presets_data)
-        available_to_clean_presets = get_visible_configure_presets_for_os(presets_data, current_os, all_presets_map)
-
-        if not available_to_clean_presets:
-            print(f"{YELLOW}对于操作系统 '{current_os}'，没有找到可供清理的、可见的配置预设。{RESET}")
-            return
+    available_to_clean_presets = get_visible_configure_presets(presets_data)
+    if not available_to_clean_presets:
+        print(f"{YELLOW}对于操作系统 '{current_os}'，没有找到可供清理的、可见的配置预设。{RESET}")
+        return
 
+    while True:
         choice_idx, selected_preset_name = display_menu_and_get_choice(
             available_to_clean_presets,
             "请选择要清理其构建目录的配置预设 (将删除 CMakeCache.txt 并执行 clean 目标):"
@@ -290,7 +599,7 @@ def handle_clean_action(presets_data, current_os, project_dir, global_env, cmake
 
         if not resolved_binary_dir_path.is_dir():
             print(f"  {YELLOW}⚠️ 构建目录 '{resolved_binary_dir_path}' 不存在。{RESET}")
-            proceed_q = input(f"  是否仍要尝试执行 'cmake --target clean' 命令 (它可能会失败或无效果)? (yes/no): ").strip().lower()
+            proceed_q = input("  是否仍要尝试执行 'cmake --target clean' 命令 (它可能会失败或无效果)? (yes/no): ").strip().lower()
             if proceed_q != 'yes':
                 print(f"  {YELLOW}已跳过 'cmake --target clean' 命令。{RESET}"); continue
 
@@ -309,6 +618,24 @@ def main():
     if platform.system() == "Windows":
         os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
 
+    parser = argparse.ArgumentParser(description="按 CMakePresets.json 交互式执行 CMake 操作")
+    parser.add_argument("--analyze-build-log", metavar="构建预设",
+                        help="不进入菜单，只分析该构建预设的 .ninja_log 并打印构建耗时报告")
+    parser.add_argument("--affected", metavar="构建预设",
+                        help="不进入菜单，只构建受 git 改动影响的目标并运行受影响的测试 (返回码表示是否成功)")
+    parser.add_argument("--base", help="--affected 比较的基准提交 (默认上游分支，没有上游时为 HEAD)")
+    parser.add_argument("--changed", nargs="+", metavar="文件", help="--affected 使用这些改动文件，不读取 git diff")
+    parser.add_argument("--watch", metavar="构建预设",
+                        help="不进入菜单，监听源码改动并增量构建受影响的目标，直到 Ctrl+C")
+    parser.add_argument("--watch-tests", action="store_true", help="--watch 每轮构建后运行受影响的测试")
+    parser.add_argument("--diagnostics", metavar="预设",
+                        help="不进入菜单，打印该构建预设 (或工作流预设) 上一次构建记录的诊断")
+    parser.add_argument("--new-warnings", action="store_true", help="--diagnostics 只打印相对再上一次构建新出现的警告")
+    parser.add_argument("--matrix", nargs="+", metavar="模式",
+                        help="不进入菜单，并发执行名称匹配这些模式 (如 'linux-*-workflow-*') 的工作流预设和构建预设")
+    parser.add_argument("--jobs", type=int, help="--matrix 的总并行度，平均分给同时运行的预设 (默认 CPU 核数)")
+    args = parser.parse_args()
+
     try:
         project_dir_env = os.environ.get("PROJECT_DIR")
         project_dir = Path(project_dir_env).resolve() if project_dir_env else Path(".").resolve()
@@ -327,22 +654,63 @@ def main():
         cpack_exe = "cpack.exe" if current_os == "Windows" else "cpack"
 
         all_presets_map = get_all_presets_by_name(presets_data)
-        valid_cfg_names = get_all_valid_configure_preset_names_for_os(presets_data, current_os, all_presets_map)
+        valid_cfg_names = get_valid_configure_preset_names(presets_data)
 
         if not valid_cfg_names:
             print(f"{YELLOW}警告: 对于操作系统 '{current_os}'，没有找到有效的配置预设 (configurePresets)。{RESET}")
             print("这可能会导致后续的构建、测试或打包预设无法使用。")
 
-        active_builds = get_dependent_presets('buildPresets', presets_data, valid_cfg_names, current_os, all_presets_map)
-        active_tests = get_dependent_presets('testPresets', presets_data, valid_cfg_names, current_os, all_presets_map)
-        active_packages = get_dependent_presets('packagePresets', presets_data, valid_cfg_names, current_os, all_presets_map)
-        active_workflows = get_active_workflow_presets(presets_data, valid_cfg_names, current_os, all_presets_map)
-
+        active_builds = get_dependent_presets('buildPresets', presets_data, valid_cfg_names)
+        active_tests = get_dependent_presets('testPresets', presets_data, valid_cfg_names)
+        active_packages = get_dependent_presets('packagePresets', presets_data, valid_cfg_names)
+        active_workflows = get_active_workflow_presets(presets_data, valid_cfg_names, all_presets_map)
+
+        if args.analyze_build_log:
+            if args.analyze_build_log not in all_presets_map:
+                print(f"{RED}找不到构建预设 '{args.analyze_build_log}'。{RESET}")
+                return 1
+            ok = analyze_build_timings(args.analyze_build_log, all_presets_map, project_dir)
+            return 0 if ok else 1
+        if args.affected:
+            if args.affected not in all_presets_map:
+                print(f"{RED}找不到构建预设 '{args.affected}'。{RESET}")
+                return 1
+            changed_files = [str(Path(path).resolve()) for path in args.changed] if args.changed else None
+            ok = run_affected_build_and_test(args.affected, all_presets_map, project_dir, cmake_exe, ctest_exe,
+                                             active_tests, args.base, changed_files)
+            return 0 if ok else 1
+        if args.diagnostics:
+            preset = all_presets_map.get(args.diagnostics)
+            if preset is None:
+                print(f"{RED}找不到预设 '{args.diagnostics}'。{RESET}")
+                return 1
+            preset_type = "workflow" if any(wp['name'] == args.diagnostics for wp in presets_data.get('workflowPresets', [])) else "build"
+            binary_dir = get_preset_binary_dir(preset_type, preset, all_presets_map, project_dir)
+            if binary_dir is None:
+                print(f"{RED}无法确定预设 '{args.diagnostics}' 的构建目录。{RESET}")
+                return 1
+            return 0 if BuildDiagnostics.print_index(str(binary_dir), args.diagnostics, args.new_warnings) else 1
+        if args.matrix:
+            entries = collect_matrix_entries(args.matrix, active_workflows, active_builds, all_presets_map, project_dir)
+            if not entries:
+                print(f"{RED}没有名称匹配 {' '.join(args.matrix)} 的工作流预设或构建预设。{RESET}")
+                return 1
+            return 0 if run_matrix(entries, project_dir, cmake_exe, args.jobs) else 1
+        if args.watch:
+            if args.watch not in all_presets_map:
+                print(f"{RED}找不到构建预设 '{args.watch}'。{RESET}")
+                return 1
+            ok = run_watch_mode(args.watch, all_presets_map, project_dir, cmake_exe, ctest_exe, active_tests, args.watch_tests)
+            return 0 if ok else 1
+
+        # 预设在会话期间不会变化，菜单每一轮直接复用
+        visible_configure_presets = get_visible_configure_presets(presets_data)
         while True:
             main_menu_options = []
             if active_workflows: main_menu_options.append(("执行工作流 (Execute Workflow)", "workflow"))
+            if active_workflows or active_builds:
+                main_menu_options.append(("并发执行多个预设 (Matrix)", "matrix"))
 
-            visible_configure_presets = get_visible_configure_presets_for_os(presets_data, current_os, all_presets_map)
             if visible_configure_presets:
                 main_menu_options.append(("清理构建目录 (Clean Build Directory)", "clean"))
 
@@ -350,6 +718,9 @@ def main():
                 main_menu_options.append(("执行构建预设 (Execute Build Preset)", "build"))
                 if any(bp.get("targets") for bp in active_builds):
                     main_menu_options.append(("执行构建目标 (Execute Build Target)", "target"))
+                main_menu_options.append(("受影响的目标构建与测试 (Affected Build & Test)", "affected"))
+                main_menu_options.append(("监听并增量构建 (Watch & Rebuild)", "watch"))
+                main_menu_options.append(("分析构建耗时 (Analyze Build Timings)", "timings"))
             if active_tests: main_menu_options.append(("执行测试预设 (Execute Test Preset)", "test"))
             if active_packages: main_menu_options.append(("执行打包预设 (Execute Package Preset)", "package"))
 
@@ -361,7 +732,7 @@ def main():
             print(f"\n{BLUE}主菜单 - 请选择 CMake 操作:{RESET}")
             for i, (display_name, _) in enumerate(main_menu_options):
                 print(f"  {i + 1}. {display_name}")
-            print(f"  0. 退出 (Exit)")
+            print("  0. 退出 (Exit)")
 
             user_main_choice_idx_str = ""
             try:
@@ -378,6 +749,8 @@ def main():
             except KeyboardInterrupt: print(f"\n{YELLOW}操作已取消，正在退出程序。{RESET}"); break
 
             final_command_str = None
+            build_preset_for_timings = None # 命令执行后需要分析 .ninja_log 的构建预设
+            workflow_preset_for_diagnostics = None # 工作流的配置和构建输出同样收集诊断
             chosen_presets_list_for_submenu = []
             prompt_msg_for_submenu = ""
 
@@ -401,8 +774,36 @@ def main():
                             target_choice_idx, sel_target_name = display_menu_and_get_choice(targets, f"请为构建预设 '{sel_build_name}' 选择一个目标:")
                             if target_choice_idx > 0 and sel_target_name:
                                 final_command_str = f"{cmake_exe} --build --preset {sel_build_name} --target {sel_target_name}"
+                                build_preset_for_timings = sel_build_name
                         else: print(f"{YELLOW}构建预设 '{sel_build_name}' 的目标格式不正确。{RESET}")
                     else: print(f"{YELLOW}未能找到构建预设 '{sel_build_name}' 或其没有定义目标。{RESET}")
+            elif selected_action_key == "affected":
+                choice_idx, sel_build_name = display_menu_and_get_choice(active_builds, "请选择受影响模式使用的构建预设:")
+                if choice_idx > 0 and sel_build_name:
+                    base_ref = input("比较的基准提交 (回车使用上游分支，没有上游时只看未提交的改动): ").strip() or None
+                    run_affected_build_and_test(sel_build_name, all_presets_map, project_dir, cmake_exe, ctest_exe,
+                                                active_tests, base_ref)
+                continue
+            elif selected_action_key == "matrix":
+                patterns = input("要执行的工作流 / 构建预设名称模式 (空格分隔，支持 * ?): ").split()
+                entries = collect_matrix_entries(patterns, active_workflows, active_builds, all_presets_map, project_dir) if patterns else []
+                if not entries:
+                    print(f"{YELLOW}没有匹配的预设。{RESET}"); continue
+                print(f"{BLUE}匹配的预设:{RESET} {' '.join(name for name, _, _ in entries)}")
+                if input("确认执行? (Y/n): ").strip().lower() in ("", "y", "yes"):
+                    run_matrix(entries, project_dir, cmake_exe)
+                continue
+            elif selected_action_key == "watch":
+                choice_idx, sel_build_name = display_menu_and_get_choice(active_builds, "请选择监听模式使用的构建预设:")
+                if choice_idx > 0 and sel_build_name:
+                    run_tests = input("每轮构建后运行受影响的测试? (y/N): ").strip().lower() in ("y", "yes")
+                    run_watch_mode(sel_build_name, all_presets_map, project_dir, cmake_exe, ctest_exe, active_tests, run_tests)
+                continue
+            elif selected_action_key == "timings":
+                choice_idx, sel_build_name = display_menu_and_get_choice(active_builds, "请选择要分析构建耗时的构建预设:")
+                if choice_idx > 0 and sel_build_name:
+                    analyze_build_timings(sel_build_name, all_presets_map, project_dir)
+                continue
             elif selected_action_key == "test":
                 chosen_presets_list_for_submenu, prompt_msg_for_submenu = active_tests, "请选择要执行的测试预设:"
             elif selected_action_key == "package":
@@ -411,14 +812,33 @@ def main():
             if chosen_presets_list_for_submenu:
                 choice_idx, sel_name = display_menu_and_get_choice(chosen_presets_list_for_submenu, prompt_msg_for_submenu)
                 if choice_idx > 0 and sel_name:
-                    if selected_action_key == "workflow": final_command_str = f"{cmake_exe} --workflow --preset {sel_name}"
-                    elif selected_action_key == "build": final_command_str = f"{cmake_exe} --build --preset {sel_name}"
+                    if selected_action_key == "workflow":
+                        final_command_str = f"{cmake_exe} --workflow --preset {sel_name}"
+                        workflow_preset_for_diagnostics = sel_name
+                    elif selected_action_key == "build":
+                        final_command_str = f"{cmake_exe} --build --preset {sel_name}"
+                        build_preset_for_timings = sel_name
                     elif selected_action_key == "test": final_command_str = f"{ctest_exe} --preset {sel_name}"
                     elif selected_action_key == "package": final_command_str = f"{cpack_exe} --preset {sel_name}"
 
             if final_command_str:
                 command_parts_to_run = shlex.split(final_command_str)
-                run_command(command_parts_to_run, global_env, cwd_path=project_dir)
+                progress = create_build_progress(build_preset_for_timings, all_presets_map, project_dir) \
+                    if build_preset_for_timings else None
+                diagnostics = None
+                if build_preset_for_timings:
+                    diagnostics = create_build_diagnostics(
+                        get_preset_binary_dir("build", all_presets_map[build_preset_for_timings], all_presets_map, project_dir),
+                        build_preset_for_timings, project_dir)
+                elif workflow_preset_for_diagnostics:
+                    diagnostics = create_build_diagnostics(
+                        get_preset_binary_dir("workflow", next(wp for wp in active_workflows if wp['name'] == workflow_preset_for_diagnostics),
+                                              all_presets_map, project_dir),
+                        workflow_preset_for_diagnostics, project_dir)
+                run_command(command_parts_to_run, global_env, cwd_path=project_dir, progress=progress, diagnostics=diagnostics)
+                # 构建失败时日志中也记录了已完成的边，同样导入
+                if build_preset_for_timings and BUILD_TIMINGS_ENABLED:
+                    analyze_build_timings(build_preset_for_timings, all_presets_map, project_dir)
 
     except KeyboardInterrupt:
         print(f"\n{YELLOW}捕获到 KeyboardInterrupt，程序正在退出。{RESET}")
@@ -430,4 +850,4 @@ def main():
         print(f"{BLUE}脚本执行完毕。{RESET}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -1,36 +1,81 @@
 import sys
-import datetime
 import os
 import time # 导入 time 模块
 import json
 import re
+import hashlib
+import sqlite3
+import itertools
+import posixpath
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import AtomicWriteBack
+import Instrumentation
 
 # --- 配置 ---
-LOG_FILE_NAME = "event.log" # 主日志文件
 # DEBUG_LOG_FILE_NAME = "debug_script_trace.log" # 可选的更详细的调试日志
 TARGET_FILE_BASENAME = "compile_commands.json"
 SLEEP_DURATION_SECONDS = 1 # 为文件稳定操作设置的延时
+# 流式模式: 逐条目解析并改写 compile_commands.json，峰值内存约为单个条目，而不是整个文件的数倍
+# 可通过环境变量 COMPILE_COMMANDS_STREAMING=0 切换回整文件文本模式
+STREAMING_MODE = os.environ.get("COMPILE_COMMANDS_STREAMING", "1") != "0"
+STREAM_READ_CHUNK_SIZE = 1 << 20 # 流式读取时每次读取的字符数
+# 条目级增量缓存: 以条目 file + directory + 原始命令的哈希为键，复用上次改写的结果 (仅流式模式)
+# 可通过环境变量 COMPILE_COMMANDS_CACHE=0 关闭
+ENTRY_CACHE_ENABLED = os.environ.get("COMPILE_COMMANDS_CACHE", "1") != "0"
+ENTRY_CACHE_SUFFIX = ".rewrite-cache.sqlite" # 缓存文件 = 数据库路径 + 此后缀
+# 多进程改写: 数据库超过阈值时把条目分块交给 ProcessPoolExecutor 改写，输出顺序保持不变
+# 小项目低于阈值时走串行路径，不付出启动工作进程的开销。COMPILE_COMMANDS_PARALLEL=0 关闭
+PARALLEL_ENABLED = os.environ.get("COMPILE_COMMANDS_PARALLEL", "1") != "0"
+PARALLEL_THRESHOLD_BYTES = 32 * 1024 * 1024 # 数据库文件小于该大小时始终串行
+PARALLEL_CHUNK_ENTRIES = 1000 # 每个任务块包含的条目数
+PARALLEL_MIN_MISSES_PER_CHUNK = 64 # 一个块中未命中缓存的条目少于该数量时直接在主进程处理
+PARALLEL_MAX_WORKERS = int(os.environ.get("COMPILE_COMMANDS_WORKERS", "0")) or (os.cpu_count() or 1)
+# 查找索引: 写回数据库时同时生成 <数据库>.index.json，记录 规范化源文件路径 -> 条目的字节偏移/长度，
+# lookup_compile_command() 借此只需一次 seek 和一次小的 JSON 解析。COMPILE_COMMANDS_INDEX=0 关闭
+INDEX_ENABLED = os.environ.get("COMPILE_COMMANDS_INDEX", "1") != "0"
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+# 参数压缩 (可选): 把 command 拆成 arguments 数组，对每组不同的共享参数 (去掉源文件和 -o 等逐文件参数后)
+# 只应用一次规则，并把共享参数移入响应文件 (@file)，数据库中每个条目只剩编译器、@file 和逐文件参数。
+# 缩小数据库靠的是响应文件: 单独的 arguments 数组 (写在一行内) 每个参数多出引号和逗号，比 command 字符串还略大，
+# 代价是 clangd 等工具要多读一次响应文件，手工查看条目时也看不到完整参数。
+# COMPILE_COMMANDS_COMPACT=1 开启；COMPILE_COMMANDS_RESPONSE_FILES=0 时只做记忆化的规则处理，不写响应文件
+COMPACT_ENABLED = os.environ.get("COMPILE_COMMANDS_COMPACT", "0") == "1"
+RESPONSE_FILES_ENABLED = os.environ.get("COMPILE_COMMANDS_RESPONSE_FILES", "1") != "0"
+RESPONSE_FILE_DIR_NAME = ".compile_commands_rsp" # 响应文件目录，默认位于条目的 directory 下
+RESPONSE_FILE_DIR = os.environ.get("COMPILE_COMMANDS_RESPONSE_FILE_DIR") or None # 设置时所有响应文件都写到这个目录
+RESPONSE_FILE_MIN_BYTES = 128 # 共享参数总长度小于该值时不值得使用响应文件 (@引用本身约占 60~100 字节)
+# 项目范围过滤 (可选): 按源文件路径的 glob 规则丢弃第三方 / 生成代码的条目，clangd 就不会去后台索引它们。
+# COMPILE_COMMANDS_FILTER=1 开启 (仅流式模式)；规则匹配规范化后的绝对路径 ('/' 分隔，不区分大小写)，
+# "**" 匹配任意多级目录，"*" 和 "?" 不跨越 '/'。include 为空表示不限制，exclude 优先于 include。
+# 也可以用 COMPILE_COMMANDS_FILTER_INCLUDE / COMPILE_COMMANDS_FILTER_EXCLUDE (以 ';' 分隔) 覆盖下面的默认值
+FILTER_ENABLED = os.environ.get("COMPILE_COMMANDS_FILTER", "0") == "1"
+FILTER_INCLUDE_GLOBS = []
+FILTER_EXCLUDE_GLOBS = [
+    "**/vcpkg_installed/**",
+    "**/conan_*/**",
+    "**/*_autogen/**",
+    "**/moc_*.cpp",
+    "**/ext/**",
+]
+# 头文件条目合成 (可选): 扫描各翻译单元的 #include，为没有条目的项目头文件追加一条借用 "最匹配的包含者" 参数的条目，
+# clangd 打开头文件时就不必猜测编译参数。COMPILE_COMMANDS_HEADERS=1 开启 (仅流式模式)。
+# 扫描结果按文件 mtime 缓存在 <数据库>.include-scan.json 中；项目头文件指通过 -I / -iquote / 当前目录找到、
+# 不在 -isystem 等系统目录下、并且通过上面项目范围过滤规则的头文件
+HEADER_ENTRIES_ENABLED = os.environ.get("COMPILE_COMMANDS_HEADERS", "0") == "1"
+HEADER_SCAN_CACHE_SUFFIX = ".include-scan.json"
+HEADER_SCAN_CACHE_VERSION = 1
+HEADER_SCAN_WORKERS = int(os.environ.get("COMPILE_COMMANDS_HEADER_WORKERS", "0")) or min(32, 4 * (os.cpu_count() or 1))
+HEADER_EXTENSIONS = (".h", ".hh", ".hpp", ".hxx", ".h++", ".inl", ".ipp", ".tpp")
 
-# --- 日志记录函数 ---
-def log_message_to_file(log_file, message_prefix, event_type, file_path_affected, additional_info=""):
-    return
-    # timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    # log_entry = f"[{timestamp}] {message_prefix}: Event='{event_type}', Path='{file_path_affected}'"
-    # if additional_info:
-    #     log_entry += f", Info='{additional_info}'"
-    # log_entry += "\n"
-    
-    # print(log_entry.strip()) # 总是打印到 stdout/stderr，方便直接查看
-
-    # try:
-    #     with open(log_file, "a", encoding="utf-8") as f:
-    #         f.write(log_entry)
-    # except Exception as e_log:
-    #     # 如果写入主日志失败，尝试打印一个更紧急的错误
-    #     print(f"[{timestamp}] VERY CRITICAL: Logging to {log_file} FAILED: {e_log}. Original message: {log_entry.strip()}")
-
-def log_event(event_type, file_path_affected, additional_info=""):
-    log_message_to_file(LOG_FILE_NAME, "EVENT", event_type, file_path_affected, additional_info)
+# --- 日志与埋点 ---
+# 设置环境变量 REWRITE_METRICS (文件路径或 "stderr") 后输出 JSON Lines 事件和每次处理的汇总 (见 Instrumentation.py)；
+# 未设置时 log_event 是空操作，消息用 "%s" 占位符和参数传入，只有开启时才会格式化
+INSTRUMENTATION = Instrumentation.recorder("ModifyCompileCommand")
+log_event = INSTRUMENTATION.event
 
 # def log_debug(message): # 可选的调试日志函数
 #     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -42,107 +87,1157 @@ def log_event(event_type, file_path_affected, additional_info=""):
 #     except Exception:
 #         pass # 调试日志失败就算了
 
+# --- 规则定义 ---
+# 每条规则为 (名称, 正则表达式, 替换模板, 起始字符集)。
+# 替换模板中的 \1、\2 ... 指向该规则自身的捕获组；起始字符集是匹配可能开头的字符 (正则字符类)，
+# 用来在组合正则前加一个前瞻，跳过不可能匹配的位置。
+# 所有规则在导入时被编译成一个组合正则，对输入只扫描一遍；新增规则不会增加额外的全文遍历。
+# 注释掉某一行即可停用对应规则。
+_IMSVC_PATH_PATTERN = r'([A-Za-z]:[\\/][^<>:"/\\|?*\s]*|[^<>:"/\\|?*\s]+)'
+COMPILE_COMMAND_RULES = [
+    # 规则 1: -imsvc <path> 替换为 -I<path> (路径模式兼容 Windows 盘符路径，并避免吞掉后面的空格)
+    ("Rule 1 (-imsvc)", rf'-imsvc\s*({_IMSVC_PATH_PATTERN})', r'-I\1', r'-'),
+    # 规则 2: 删除 /MP (连同它前面的空白)
+    ("Rule 2 (/MP)", r'\s*/MP\b', '', r'\s/'),
+    # 规则 3: -std:c++XX 替换为 /std:c++XX，前后不能紧挨单词字符，确保替换的是独立的标志
+    ("Rule 3 (-std:c++XX to /std:c++XX)", r'(?<!\w)-std:(c\+\+\d{2})(?!\w)', r'/std:\1', r'-'),
+]
+
+class CompiledRuleEngine:
+    """把多条规则编译成一个组合扫描器，一次遍历完成全部替换，并分别统计每条规则的替换次数。"""
+
+    def __init__(self, rules):
+        self.rule_names = [rule[0] for rule in rules]
+        self._replacements = {}
+        alternatives = []
+        first_chars = []
+        group_number = 1
+        for index, (name, pattern, template, first_char_class) in enumerate(rules):
+            group_name = f"rule{index}"
+            alternatives.append(f"(?P<{group_name}>{pattern})")
+            first_chars.append(first_char_class)
+            # 规则内部的 \N 在组合正则中的组号会整体后移，这里预先把模板拆成 (字面量, 绝对组号) 片段
+            self._replacements[group_name] = (index, self._compile_template(template, group_number))
+            group_number += 1 + re.compile(pattern).groups
+        combined = "|".join(alternatives)
+        if all(first_chars):
+            lookahead = "|".join(f"[{chars}]" for chars in dict.fromkeys(first_chars))
+            combined = f"(?={lookahead})(?:{combined})"
+        self.regex = re.compile(combined)
+
+    @staticmethod
+    def _compile_template(template, base_group):
+        parts = []
+        for literal, group in re.findall(r'((?:[^\\]|\\[^\d])*)(?:\\(\d+))?', template):
+            if literal:
+                parts.append(literal.replace('\\\\', '\\'))
+            if group:
+                parts.append(base_group + int(group))
+        if all(isinstance(part, str) for part in parts):
+            return "".join(parts) # 纯字面量替换
+        return tuple(parts)
+
+    def apply(self, text, rule_seconds=None):
+        """对 text 应用所有规则。返回 (新文本, 每条规则的替换次数列表)。
+
+        rule_seconds 为列表时 (仅埋点开启时传入)，把每条规则替换回调的耗时累加到对应位置。
+        组合正则只扫描一遍，扫描本身的耗时无法拆分到单条规则，由调用方整体计时。
+        """
+        counts = [0] * len(self.rule_names)
+        replacements = self._replacements
+
+        def replace(match):
+            index, template = replacements[match.lastgroup]
+            counts[index] += 1
+            if isinstance(template, str):
+                return template
+            return "".join(part if isinstance(part, str) else (match.group(part) or "") for part in template)
+
+        if rule_seconds is None:
+            return self.regex.sub(replace, text), counts
+
+        def timed_replace(match):
+            started = time.perf_counter()
+            result = replace(match)
+            rule_seconds[replacements[match.lastgroup][0]] += time.perf_counter() - started
+            return result
+
+        return self.regex.sub(timed_replace, text), counts
+
+COMPILE_COMMAND_RULE_ENGINE = CompiledRuleEngine(COMPILE_COMMAND_RULES)
+
+def _apply_rules_instrumented(content_string):
+    """埋点开启时的规则应用: 额外累计扫描耗时、输入长度和每条规则的替换次数与耗时。"""
+    engine = COMPILE_COMMAND_RULE_ENGINE
+    rule_seconds = [0.0] * len(engine.rule_names)
+    started = time.perf_counter()
+    processed_content, replacement_counts = engine.apply(content_string, rule_seconds)
+    INSTRUMENTATION.add_time("rules.scan", time.perf_counter() - started)
+    INSTRUMENTATION.add_rule_stats(engine.rule_names, replacement_counts, rule_seconds)
+    INSTRUMENTATION.count("rules.calls")
+    INSTRUMENTATION.count("rules.input_chars", len(content_string))
+    return processed_content, replacement_counts
+
 def process_compile_commands_content(content_string):
-    log_event("DEBUG", "process_function", f"Entering process_compile_commands_content. Input length: {len(content_string if isinstance(content_string, str) else [])}. Type: {type(content_string)}")
-    
+    # 流式模式下每个参数都会调用一次，这里不记录逐次调用的事件，规则统计汇总在每次处理结束时的 summary 记录中
     if not isinstance(content_string, str):
-        log_event("ERROR", "process_function", f"content_string is not a string, it's {type(content_string)}. Returning as is.")
+        log_event("ERROR", "process_function", "content_string is not a string, it's %s. Returning as is.", type(content_string))
         return content_string, False
 
-    # 初始化，假设最初内容为输入内容
-    current_processing_content = content_string 
-    overall_changes_made = False
+    try:
+        if INSTRUMENTATION.enabled:
+            processed_content, replacement_counts = _apply_rules_instrumented(content_string)
+        else:
+            processed_content, replacement_counts = COMPILE_COMMAND_RULE_ENGINE.apply(content_string)
+    except Exception as e_rules:
+        log_event("ERROR", "process_function", "Exception while applying rules: %s - %s", type(e_rules).__name__, e_rules)
+        return content_string, False
+
+    overall_changes_made = any(replacement_counts) # 标记总的更改状态
+    return processed_content, overall_changes_made
+
+# --- 流式处理 ---
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iter_compile_commands_entries(f_read, chunk_size=STREAM_READ_CHUNK_SIZE):
+    """逐个产出 compile_commands.json 顶层数组中的条目，内存中只保留当前读取块和当前条目。"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = f_read.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk # 丢弃已经消费的部分，避免缓冲区无限增长
+        pos = 0
+        return True
+
+    def next_char():
+        # 跳过空白，返回下一个有效字符 (文件结束时返回 None)
+        nonlocal pos
+        while True:
+            pos = _JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return None
+
+    first = next_char()
+    if first is None:
+        return # 空文件或只有空白
+    if first != '[':
+        raise ValueError(f"compile_commands.json must be a JSON array, got {first!r} at top level")
+    pos += 1
+
+    if next_char() == ']':
+        return
+    while True:
+        if next_char() is None:
+            raise ValueError("Unexpected end of file inside compile_commands.json array")
+        while True:
+            try:
+                entry, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # 当前条目跨越了读取块的边界，继续读取；已经到文件末尾则说明 JSON 本身有误
+                if eof or not read_more():
+                    raise
+        pos = end
+        yield entry
+
+        separator = next_char()
+        if separator == ',':
+            pos += 1
+        elif separator == ']':
+            return
+        else:
+            raise ValueError(f"Expected ',' or ']' after entry in compile_commands.json, got {separator!r}")
+
+def process_compile_command_arguments(arguments):
+    """对 'arguments' 数组应用与 'command' 字符串相同的规则。返回 (新数组, 是否有修改)。"""
+    new_arguments = []
+    changes_made = False
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        # 规则 1 作用于 "-imsvc <path>"，数组形式下路径是下一个元素，合并后交给规则处理
+        if argument == "-imsvc" and index + 1 < len(arguments):
+            merged_argument, merged_changed = process_compile_commands_content(argument + arguments[index + 1])
+            if merged_changed:
+                new_arguments.append(merged_argument)
+                changes_made = True
+                index += 2
+                continue
+        processed_argument, argument_changed = process_compile_commands_content(argument)
+        index += 1
+        if argument_changed:
+            changes_made = True
+            processed_argument = processed_argument.strip()
+            if not processed_argument:
+                continue # 整个参数被规则删除 (例如 "/MP")
+        new_arguments.append(processed_argument)
+    return new_arguments, changes_made
+
+def rewrite_compile_command_entry(entry):
+    """改写单个编译数据库条目的 'command' / 'arguments'。返回 (条目, 是否有修改)。"""
+    changes_made = False
+    if not isinstance(entry, dict):
+        return entry, False
+    if COMPACT_ENABLED:
+        return compact_compile_command_entry(entry)
+
+    command = entry.get("command")
+    if isinstance(command, str):
+        processed_command, command_changed = process_compile_commands_content(command)
+        if command_changed:
+            entry["command"] = processed_command
+            changes_made = True
+
+    arguments = entry.get("arguments")
+    if isinstance(arguments, list) and all(isinstance(a, str) for a in arguments):
+        processed_arguments, arguments_changed = process_compile_command_arguments(arguments)
+        if arguments_changed:
+            entry["arguments"] = processed_arguments
+            changes_made = True
+
+    return entry, changes_made
+
+def serialize_compile_command_entry(entry):
+    """按 CMake 生成的格式 (缩进 2 格) 序列化单个条目，返回 UTF-8 字节串。参数压缩开启时 arguments 数组写在一行内。"""
+    if not (COMPACT_ENABLED and isinstance(entry, dict) and isinstance(entry.get("arguments"), list)):
+        return json.dumps(entry, indent=2, ensure_ascii=False).encode('utf-8')
+    fields = ",\n".join(f"  {json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}"
+                        for key, value in entry.items())
+    return ("{\n" + fields + "\n}").encode('utf-8')
+
+# --- 项目范围过滤 ---
+def glob_to_regex(pattern):
+    """把 glob 转换为正则表达式 (不带锚点): "**/" 匹配零或多级目录，"**" 匹配任意字符，"*" / "?" 不跨越 '/'。"""
+    parts = []
+    index = 0
+    length = len(pattern)
+    while index < length:
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+        elif char == "*":
+            parts.append("[^/]*")
+            index += 1
+        elif char == "?":
+            parts.append("[^/]")
+            index += 1
+        elif char == "[" and "]" in pattern[index + 2:]:
+            end = pattern.index("]", index + 2)
+            content = pattern[index + 1:end]
+            if content.startswith("!"):
+                content = "^" + content[1:]
+            parts.append("[" + content.replace("\\", "\\\\") + "]")
+            index = end + 1
+        else:
+            parts.append(re.escape(char))
+            index += 1
+    return "".join(parts)
+
+def _globs_from_env(variable, default):
+    value = os.environ.get(variable)
+    if value is None:
+        return default
+    return [glob.strip() for glob in value.split(";") if glob.strip()]
+
+class CompileCommandEntryFilter:
+    """按源文件路径过滤条目。include / exclude 规则各自在构造时编译成一个组合正则，每个条目只做一次匹配。"""
+
+    def __init__(self, include_globs, exclude_globs):
+        self.include_globs = list(include_globs)
+        self.exclude_globs = list(exclude_globs)
+        self._include = self._compile(self.include_globs)
+        self._exclude = self._compile(self.exclude_globs)
+
+    @staticmethod
+    def _compile(globs):
+        if not globs:
+            return None
+        # 源文件键可能已经按 Windows 规则转换为小写，规则统一不区分大小写
+        return re.compile("|".join(f"(?:{glob_to_regex(glob.replace(chr(92), '/'))})" for glob in globs), re.IGNORECASE)
+
+    def keeps(self, source_key):
+        """source_key 为 compile_command_entry_source_key() 的结果；没有源文件的条目总是保留。"""
+        if source_key is None:
+            return True
+        if self._exclude is not None and self._exclude.fullmatch(source_key):
+            return False
+        return self._include is None or self._include.fullmatch(source_key) is not None
+
+    def apply(self, entries, stats):
+        """过滤条目迭代器，丢弃的条目数累加到 stats["dropped"]。"""
+        for entry in entries:
+            if self.keeps(compile_command_entry_source_key(entry)):
+                yield entry
+            else:
+                stats["dropped"] += 1
+
+COMPILE_COMMAND_ENTRY_FILTER = CompileCommandEntryFilter(
+    _globs_from_env("COMPILE_COMMANDS_FILTER_INCLUDE", FILTER_INCLUDE_GLOBS),
+    _globs_from_env("COMPILE_COMMANDS_FILTER_EXCLUDE", FILTER_EXCLUDE_GLOBS))
+
+# --- 参数压缩 ---
+_WINDOWS_COMMAND_HINT = re.compile(r'(?:^|\s)"?[A-Za-z]:[\\/]|^\s*"?[^\s"]+\.exe\b', re.IGNORECASE)
+# 逐文件 (每个翻译单元各不相同) 的参数: 选项 -> 是否带一个独立的值参数
+_PER_FILE_OPTIONS_WITH_VALUE = {"-o", "-MF", "-MT", "-MQ", "/Fo", "-Fo"}
+_PER_FILE_OPTION_PREFIXES = ("-o", "/Fo", "-Fo", "/Fd", "-Fd", "-MF", "-MT", "-MQ")
+_SHARED_FLAGS_MEMO = {} # (编译器, 共享参数元组) -> 应用规则后的共享参数 (或响应文件引用)
+
+def split_windows_command_line(command):
+    """按 CommandLineToArgvW 的规则拆分 Windows 命令行 (处理引号和引号前的反斜杠)。"""
+    arguments = []
+    current = []
+    in_quotes = False
+    has_token = False
+    index = 0
+    length = len(command)
+    while index < length:
+        char = command[index]
+        if char == '\\':
+            end = index
+            while end < length and command[end] == '\\':
+                end += 1
+            count = end - index
+            if end < length and command[end] == '"':
+                current.append('\\' * (count // 2))
+                if count % 2:
+                    current.append('"') # 奇数个反斜杠: 转义的引号
+                    end += 1
+            else:
+                current.append('\\' * count)
+            index = end
+            has_token = True
+        elif char == '"':
+            if in_quotes and index + 1 < length and command[index + 1] == '"':
+                current.append('"') # 引号内的 "" 表示一个字面量引号
+                index += 2
+                continue
+            in_quotes = not in_quotes
+            has_token = True
+            index += 1
+        elif char in ' \t' and not in_quotes:
+            if has_token:
+                arguments.append("".join(current))
+                current = []
+                has_token = False
+            index += 1
+        else:
+            current.append(char)
+            has_token = True
+            index += 1
+    if has_token:
+        arguments.append("".join(current))
+    return arguments
+
+# POSIX 命令行的组成片段: 普通字符 / 单引号串 / 双引号串 / 反斜杠转义 / 空白 (与 shlex.split(posix=True) 的结果一致)
+_POSIX_WORD_PART = re.compile(r"""([^\s'"\\]+)|'([^']*)'|"((?:[^"\\]|\\.)*)"|\\(.)|(\s+)""", re.DOTALL)
+_POSIX_DOUBLE_QUOTED_ESCAPE = re.compile(r'\\([\\"])')
+
+def split_posix_command_line(command):
+    """按 POSIX shell 的引号规则拆分命令行。shlex.split 逐字符处理，对数万条目来说太慢，这里按片段匹配。"""
+    if not any(c in command for c in '\'"\\'):
+        return command.split()
+    arguments = []
+    current = []
+    has_token = False
+    position = 0
+    length = len(command)
+    while position < length:
+        match = _POSIX_WORD_PART.match(command, position)
+        if match is None:
+            raise ValueError("No closing quotation")
+        position = match.end()
+        plain, single_quoted, double_quoted, escaped, whitespace = match.groups()
+        if whitespace is not None:
+            if has_token:
+                arguments.append("".join(current))
+                current = []
+                has_token = False
+            continue
+        if double_quoted is not None:
+            current.append(_POSIX_DOUBLE_QUOTED_ESCAPE.sub(r'\1', double_quoted))
+        else:
+            current.append(plain if plain is not None else single_quoted if single_quoted is not None else escaped)
+        has_token = True
+    if has_token:
+        arguments.append("".join(current))
+    return arguments
+
+def split_command_line(command):
+    """把 command 字符串拆成参数列表，根据命令中的路径风格选择 Windows 或 POSIX 规则。"""
+    if _WINDOWS_COMMAND_HINT.search(command):
+        return split_windows_command_line(command)
+    return split_posix_command_line(command)
+
+def _is_cl_driver(compiler, arguments):
+    name = os.path.basename(compiler.replace('\\', '/')).lower()
+    return name in ("cl", "cl.exe", "clang-cl", "clang-cl.exe") or "--driver-mode=cl" in arguments
+
+def _quote_response_file_argument(argument, windows_style):
+    if argument and not any(c in argument for c in ' \t\n"\'\\'):
+        return argument
+    if windows_style:
+        return subprocess.list2cmdline([argument])
+    return '"' + argument.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _split_per_file_arguments(arguments, entry):
+    """拆分为 (共享参数, 逐文件参数)。逐文件参数是源文件本身以及 -o/-MF/-Fo 等输出相关参数。"""
+    source_key = compile_command_entry_source_key(entry)
+    directory = entry.get("directory") if isinstance(entry.get("directory"), str) else ""
+    # 先用文件名做廉价的预筛选，只有结尾匹配的参数才做完整的路径规范化比较
+    source_name = posixpath.basename(source_key) if source_key else None
+    shared = []
+    per_file = []
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        if argument in _PER_FILE_OPTIONS_WITH_VALUE and index + 1 < len(arguments):
+            per_file.extend(arguments[index:index + 2])
+            index += 2
+            continue
+        is_source = source_name is not None and not argument.startswith(('-', '@')) and \
+            argument.casefold().endswith(source_name.casefold()) and normalize_source_path(argument, directory) == source_key
+        if is_source or argument.startswith(_PER_FILE_OPTION_PREFIXES):
+            per_file.append(argument)
+        else:
+            shared.append(argument)
+        index += 1
+    return shared, per_file
+
+def _write_response_file(directory, compiler, shared_flags):
+    """把共享参数写入以内容哈希命名的响应文件 (已存在则复用)，返回文件的绝对路径。"""
+    windows_style = _is_cl_driver(compiler, shared_flags)
+    content = "\n".join(_quote_response_file_argument(flag, windows_style) for flag in shared_flags) + "\n"
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=12).hexdigest()
+    response_dir = RESPONSE_FILE_DIR or os.path.join(directory, RESPONSE_FILE_DIR_NAME)
+    response_path = os.path.join(response_dir, f"{digest}.rsp")
+    if not os.path.exists(response_path):
+        os.makedirs(response_dir, exist_ok=True)
+        # 内容由哈希决定，多个工作进程同时写入同一个文件也没有问题
+        AtomicWriteBack.atomic_write_text(response_path, content, record=False)
+    return response_path
+
+def _rewrite_shared_flags(compiler, shared_flags, directory):
+    """对一组共享参数应用规则 (每组不同的参数只处理一次)，需要时换成响应文件引用。"""
+    memo_key = (compiler, directory if RESPONSE_FILES_ENABLED else None, tuple(shared_flags))
+    rewritten = _SHARED_FLAGS_MEMO.get(memo_key)
+    if rewritten is None:
+        rewritten, _ = process_compile_command_arguments(shared_flags)
+        if RESPONSE_FILES_ENABLED and directory and sum(len(flag) + 1 for flag in rewritten) >= RESPONSE_FILE_MIN_BYTES:
+            rewritten = ["@" + _write_response_file(directory, compiler, rewritten)]
+        _SHARED_FLAGS_MEMO[memo_key] = rewritten
+    return rewritten
+
+def compact_compile_command_entry(entry):
+    """把条目转换为 arguments 形式，共享参数经过记忆化的规则处理 (并可移入响应文件)。返回 (条目, 是否有修改)。"""
+    command = entry.get("command")
+    arguments = entry.get("arguments")
+    if isinstance(arguments, list) and all(isinstance(a, str) for a in arguments):
+        original_arguments = arguments
+    elif isinstance(command, str):
+        try:
+            original_arguments = split_command_line(command)
+        except ValueError:
+            # 引号不配对等无法拆分的命令，退回普通的字符串改写
+            processed_command, command_changed = process_compile_commands_content(command)
+            if command_changed:
+                entry["command"] = processed_command
+            return entry, command_changed
+    else:
+        return entry, False
+    if not original_arguments:
+        return entry, False
+
+    compiler = original_arguments[0]
+    shared_flags, per_file_arguments = _split_per_file_arguments(original_arguments[1:], entry)
+    directory = entry.get("directory") if isinstance(entry.get("directory"), str) else ""
+    compacted = [compiler] + _rewrite_shared_flags(compiler, shared_flags, directory) + per_file_arguments
+    if "command" not in entry and compacted == original_arguments:
+        return entry, False
+    entry.pop("command", None)
+    entry["arguments"] = compacted
+    return entry, True
+
+# --- 条目级增量缓存 ---
+def compile_command_entry_key(entry):
+    """计算条目的缓存键: file + directory + 原始 command/arguments (+ output) 的哈希。"""
+    if not isinstance(entry, dict):
+        return None
+    command = entry.get("command")
+    if not isinstance(command, str):
+        arguments = entry.get("arguments")
+        if not isinstance(arguments, list):
+            return None
+        command = "\x1f".join(str(a) for a in arguments)
+    parts = (str(entry.get("file", "")), str(entry.get("directory", "")), command, str(entry.get("output", "")))
+    return hashlib.blake2b("\x00".join(parts).encode('utf-8'), digest_size=16).digest()
+
+def compile_command_rules_fingerprint():
+    """规则集合的指纹，规则变化后缓存自动失效。"""
+    settings = (COMPILE_COMMAND_RULES, COMPACT_ENABLED, RESPONSE_FILES_ENABLED, RESPONSE_FILE_MIN_BYTES, RESPONSE_FILE_DIR)
+    return hashlib.blake2b(repr(settings).encode('utf-8'), digest_size=16).hexdigest()
+
+class CompileCommandsRewriteCache:
+    """compile_commands.json 旁的 SQLite 缓存: 条目键 -> (改写后的序列化条目, 是否被改写)。
+
+    无需改写的条目只记录键 (serialized 为 NULL)，命中时直接序列化原条目，缓存体积与被改写的条目数成正比。
+
+    使用 SQLite 而不是一次性加载的 JSON，这样查找是逐条的，流式模式的内存上限不受缓存大小影响。
+    缓存可随时删除，损坏或规则变化时会被重建。因为关闭了日志和同步，改写过程中也可能读到损坏的页:
+    此时删除缓存文件，本次剩余的条目不经缓存直接改写 (见 _disable)。
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self.disabled = False
+        self._pending = []
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute("PRAGMA journal_mode=OFF")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, serialized BLOB, changed INTEGER)")
+        fingerprint = compile_command_rules_fingerprint()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'rules'").fetchone()
+        if not row or row[0] != fingerprint:
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rules', ?)", (fingerprint,))
+
+    @classmethod
+    def for_database(cls, database_path):
+        """打开 database_path 对应的缓存；缓存文件不可用时删除重建，仍失败则返回 None (不使用缓存)。"""
+        cache_path = database_path + ENTRY_CACHE_SUFFIX
+        for _ in range(2):
+            try:
+                return cls(cache_path)
+            except sqlite3.Error as e_cache:
+                log_event("WARNING", cache_path, "Rewrite cache unusable (%s). Recreating.", e_cache)
+                try:
+                    os.remove(cache_path)
+                except OSError:
+                    return None
+        return None
+
+    def _disable(self, error):
+        """缓存在使用过程中出错 (通常是文件损坏): 关闭并删除缓存文件，之后的 get 全部未命中、put 被忽略。"""
+        log_event("WARNING", self.cache_path, "Rewrite cache failed during use (%s). Deleting it and continuing without cache.", error)
+        self.disabled = True
+        self._pending = []
+        try:
+            self.connection.close()
+        except sqlite3.Error:
+            pass
+        try:
+            os.remove(self.cache_path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        if self.disabled:
+            self.misses += 1
+            return None
+        try:
+            row = self.connection.execute("SELECT serialized, changed FROM entries WHERE key = ?", (key,)).fetchone()
+        except sqlite3.DatabaseError as e_cache:
+            self._disable(e_cache)
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], bool(row[1])
+
+    def put(self, key, serialized, changed):
+        if self.disabled:
+            return
+        self._pending.append((key, serialized, 1 if changed else 0))
+        if len(self._pending) >= 1000:
+            self.flush()
+
+    def flush(self):
+        if self._pending and not self.disabled:
+            try:
+                self.connection.executemany("INSERT OR REPLACE INTO entries (key, serialized, changed) VALUES (?, ?, ?)", self._pending)
+            except sqlite3.DatabaseError as e_cache:
+                self._disable(e_cache)
+            self._pending = []
+
+    def close(self, live_entry_count=0):
+        """写入挂起的条目并关闭。缓存条目数远超当前数据库条目数时整体清空，避免无限增长。"""
+        self.flush()
+        if self.disabled:
+            return
+        try:
+            total = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if live_entry_count and total > 4 * live_entry_count:
+                self.connection.execute("DELETE FROM entries")
+            self.connection.commit()
+        except sqlite3.DatabaseError as e_cache:
+            self._disable(e_cache)
+        finally:
+            if not self.disabled:
+                self.connection.close()
+
+def _rewrite_and_serialize(entry):
+    """改写并序列化单个条目。返回 (序列化结果, 是否被修改, 改写后条目的缓存键或 None)。"""
+    entry, entry_changed = rewrite_compile_command_entry(entry)
+    rewritten_key = compile_command_entry_key(entry) if entry_changed else None
+    return serialize_compile_command_entry(entry), entry_changed, rewritten_key
+
+def _rewrite_entry_chunk(entries):
+    """改写一块条目，结果顺序与输入一致。"""
+    return [_rewrite_and_serialize(entry) for entry in entries]
 
-    # --- 规则 1: -imsvc 处理 ---
-    changes_made_rule1 = False
+def _rewrite_entry_chunk_in_worker(entries):
+    """工作进程中执行。工作进程的埋点累计值不会回到主进程，每块结束时各自写出一条汇总。"""
+    results = _rewrite_entry_chunk(entries)
+    INSTRUMENTATION.flush(scope="parallel_chunk", entries=len(entries))
+    return results
+
+def _lookup_cached(entry, cache):
+    """查询缓存。返回 (缓存键, 命中时的 (序列化结果, 是否被修改) 或 None)。"""
+    key = compile_command_entry_key(entry) if cache is not None else None
+    cached = cache.get(key) if key is not None else None
+    if cached is not None and cached[0] is None:
+        cached = (serialize_compile_command_entry(entry), cached[1]) # 无需改写的条目只缓存了键
+    return key, cached
+
+def _store_in_cache(cache, key, result):
+    serialized, entry_changed, rewritten_key = result
+    if cache is None or key is None:
+        return
+    cache.put(key, serialized if entry_changed else None, entry_changed)
+    if rewritten_key is not None:
+        # 改写后的条目写回后会再次被读到，把它也记为 "无需修改"，避免下一次事件重复处理
+        cache.put(rewritten_key, None, False)
+
+def _iter_rewritten_entries_serial(entries, cache):
+    """逐条改写，产出 (序列化结果, 是否被修改, 规范化源文件路径)。"""
+    for entry in entries:
+        source_key = compile_command_entry_source_key(entry)
+        key, cached = _lookup_cached(entry, cache)
+        if cached is not None:
+            yield cached[0], cached[1], source_key
+            continue
+        result = _rewrite_and_serialize(entry)
+        _store_in_cache(cache, key, result)
+        yield result[0], result[1], source_key
+
+def _iter_rewritten_entries_parallel(entries, cache, max_workers):
+    """分块并行改写。同时在途的块数有上限，内存占用与块大小和进程数成正比，而不是与整个数据库成正比。"""
+    executor = None
+    in_flight = deque() # (每个条目的结果槽, 未命中条目的缓存键, future 或已算好的结果)
     try:
-        # (使用您最终解决空格问题的规则1代码)
-        # 例如，我们假设这是之前能正确工作的版本：
-        path_pattern_for_rule1 = r'([A-Za-z]:[\\/][^<>:"/\\|?*\s]*|[^<>:"/\\|?*\s]+)'
-        regex_imsvc_combined = rf'-imsvc\s*({path_pattern_for_rule1})'
-        
-        processed_content_rule1, num_replacements1 = re.subn(regex_imsvc_combined, r'-I\1', current_processing_content)
-        log_event("DEBUG", "process_function_rule1", f"re.subn (Rule 1) result: num_replacements={num_replacements1}")
-
-        if num_replacements1 > 0:
-            current_processing_content = processed_content_rule1 # 更新内容
-            changes_made_rule1 = True
-            overall_changes_made = True # 标记总的更改状态
-            log_event("INFO", "process_function_rule1", f"Rule 1 (-imsvc) applied. Replacements: {num_replacements1}.")
-            
-    except Exception as e_r1:
-        log_event("ERROR", "process_function_rule1", f"Exception during Rule 1 (-imsvc): {type(e_r1).__name__} - {e_r1}")
-        # 根据策略，如果一个规则失败，可以选择是否中止或继续。这里我们选择继续，但标记 overall_changes_made 可能不准确。
-        # 或者直接 return content_string, False
+        while True:
+            batch = list(itertools.islice(entries, PARALLEL_CHUNK_ENTRIES))
+            if not batch:
+                break
+            slots = []
+            missed_keys = []
+            missed_entries = []
+            for entry in batch:
+                key, cached = _lookup_cached(entry, cache)
+                # 槽位: (序列化结果或 None, 是否被修改, 规范化源文件路径)，源文件路径在主进程中计算
+                source_key = compile_command_entry_source_key(entry)
+                slots.append((cached[0], cached[1], source_key) if cached is not None else (None, False, source_key))
+                if cached is None:
+                    missed_keys.append(key)
+                    missed_entries.append(entry)
+            if len(missed_entries) >= PARALLEL_MIN_MISSES_PER_CHUNK:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=max_workers)
+                pending = executor.submit(_rewrite_entry_chunk_in_worker, missed_entries)
+            else:
+                pending = _rewrite_entry_chunk(missed_entries)
+            in_flight.append((slots, missed_keys, pending))
+            while len(in_flight) > 2 * max_workers:
+                yield from _drain_rewritten_chunk(in_flight.popleft(), cache)
+        while in_flight:
+            yield from _drain_rewritten_chunk(in_flight.popleft(), cache)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+def _drain_rewritten_chunk(chunk, cache):
+    slots, missed_keys, pending = chunk
+    results = iter(pending.result() if hasattr(pending, "result") else pending)
+    missed_index = 0
+    for serialized, entry_changed, source_key in slots:
+        if serialized is not None:
+            yield serialized, entry_changed, source_key
+            continue
+        result = next(results)
+        _store_in_cache(cache, missed_keys[missed_index], result)
+        missed_index += 1
+        yield result[0], result[1], source_key
+
+def write_rewritten_entries(entries, output_file, cache=None, parallel=False, index=None):
+    """把条目迭代器中的条目逐个改写并以 CMake 的格式写入二进制输出 output_file。
+
+    返回 (条目总数, 被修改的条目数, 写入的字节数)。cache / index 的含义见 stream_process_compile_commands。
+    MergeCompileCommands.py 也通过它把多个数据库合并后的条目写出。
+    """
+    entry_count = 0
+    changed_count = 0
+    if parallel:
+        rewritten = _iter_rewritten_entries_parallel(entries, cache, PARALLEL_MAX_WORKERS)
+    else:
+        rewritten = _iter_rewritten_entries_serial(entries, cache)
+    output_file.write(b"[\n")
+    offset = 2
+    for serialized, entry_changed, source_key in rewritten:
+        if entry_changed:
+            changed_count += 1
+        # 与 CMake 生成的格式保持一致: 条目之间用 ",\n" 分隔
+        if entry_count:
+            output_file.write(b",\n")
+            offset += 2
+        output_file.write(serialized)
+        if index is not None and source_key is not None:
+            index.setdefault(source_key, []).append([offset, len(serialized)])
+        offset += len(serialized)
+        entry_count += 1
+    trailer = b"\n]\n" if entry_count else b"]\n"
+    output_file.write(trailer)
+    return entry_count, changed_count, offset + len(trailer)
+
+def stream_process_compile_commands(source_path, output_file, cache=None, parallel=None, index=None, entry_filter=None,
+                                    header_synthesizer=None):
+    """流式读取 source_path，逐条改写并直接写入二进制输出 output_file。
+    返回 (写出的条目数, 被修改的条目数, 被过滤掉的条目数)。
+
+    传入 cache 时，命中缓存的条目直接复用上次改写后的序列化结果，只有新增或变化的条目才会经过规则。
+    parallel 为 None 时按 PARALLEL_ENABLED 和文件大小阈值自动决定是否使用多进程。
+    传入 index (字典) 时，记录 规范化源文件路径 -> [[偏移, 长度], ...]，偏移相对于 output_file 的起始位置。
+    传入 entry_filter (CompileCommandEntryFilter) 时，被过滤掉的条目在查缓存和改写之前就被丢弃。
+    传入 header_synthesizer (HeaderEntrySynthesizer) 时，在全部条目之后追加合成的头文件条目 (同样经过规则改写)。
+    """
+    started = time.perf_counter()
+    if parallel is None:
+        parallel = should_rewrite_in_parallel(os.path.getsize(source_path))
+    filter_stats = {"dropped": 0}
+    with open(source_path, 'r', encoding='utf-8') as f_read:
+        entries = iter_compile_commands_entries(f_read)
+        if entry_filter is not None:
+            entries = entry_filter.apply(entries, filter_stats)
+        if header_synthesizer is not None:
+            entries = header_synthesizer.wrap(entries)
+        entry_count, changed_count, output_bytes = write_rewritten_entries(entries, output_file, cache, parallel, index)
+    if INSTRUMENTATION.enabled:
+        INSTRUMENTATION.add_time("stream_process", time.perf_counter() - started)
+        INSTRUMENTATION.count("entries", entry_count)
+        INSTRUMENTATION.count("entries.changed", changed_count)
+        INSTRUMENTATION.count("entries.dropped", filter_stats["dropped"])
+        INSTRUMENTATION.count("bytes.input", os.path.getsize(source_path))
+        INSTRUMENTATION.count("bytes.output", output_bytes)
+        if cache is not None:
+            INSTRUMENTATION.count("cache.hits", cache.hits)
+            INSTRUMENTATION.count("cache.misses", cache.misses)
+    log_event("DEBUG", "stream_process", "Streamed %d entries, %d changed, %d dropped by filter (parallel=%s).",
+              entry_count, changed_count, filter_stats["dropped"], parallel)
+    return entry_count, changed_count, filter_stats["dropped"]
+
+def should_rewrite_in_parallel(input_bytes):
+    """按 PARALLEL_ENABLED、可用工作进程数和输入大小决定是否使用多进程改写。"""
+    return PARALLEL_ENABLED and PARALLEL_MAX_WORKERS > 1 and input_bytes >= PARALLEL_THRESHOLD_BYTES
+
+# --- 查找索引 ---
+_WINDOWS_ABSOLUTE_PATH = re.compile(r'^(?:[A-Za-z]:[\\/]|[\\/]{2})')
+
+def normalize_source_path(file_path, directory=""):
+    """把条目中的 file (可能相对于 directory) 规范化为索引键: 绝对路径、统一使用 '/'，Windows 路径不区分大小写。"""
+    is_windows_path = bool(_WINDOWS_ABSOLUTE_PATH.match(file_path) or _WINDOWS_ABSOLUTE_PATH.match(directory or ""))
+    if not (file_path.startswith('/') or _WINDOWS_ABSOLUTE_PATH.match(file_path)) and directory:
+        file_path = directory.rstrip('/\\') + '/' + file_path
+    normalized = posixpath.normpath(file_path.replace('\\', '/')) # normpath 会保留 UNC 路径开头的 "//"
+    return normalized.casefold() if is_windows_path or os.name == 'nt' else normalized
+
+def compile_command_entry_source_key(entry):
+    if not isinstance(entry, dict) or not isinstance(entry.get("file"), str):
+        return None
+    directory = entry.get("directory")
+    return normalize_source_path(entry["file"], directory if isinstance(directory, str) else "")
+
+def index_path_for(database_path):
+    return database_path + INDEX_SUFFIX
 
-    # --- 规则 2: /MP 处理 ---
-    changes_made_rule2 = False
+def write_compile_commands_index(database_path, index):
+    """为 database_path 的当前内容写入查找索引，并记录数据库的大小和 mtime 用于校验。"""
+    stat_result = os.stat(database_path)
+    payload = {
+        "version": INDEX_VERSION,
+        "database": {"size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns},
+        "entries": index,
+    }
+    AtomicWriteBack.atomic_write_text(index_path_for(database_path), json.dumps(payload, ensure_ascii=False, separators=(',', ':')), record=False)
+
+def load_compile_commands_index(database_path):
+    """读取 database_path 的索引。索引不存在、版本不符或与数据库当前状态不一致时返回 None。"""
     try:
-        # 规则2 在 规则1 处理后的 current_processing_content 上操作
-        log_event("DEBUG", "process_function_rule2", f"Before Rule 2 (/MP). Input length: {len(current_processing_content)}")
-        processed_content_rule2, num_replacements2 = re.subn(r'\s*/MP\b', '', current_processing_content)
-        log_event("DEBUG", "process_function_rule2", f"re.subn (Rule 2) result: num_replacements={num_replacements2}")
-        if num_replacements2 > 0:
-            current_processing_content = processed_content_rule2 # 更新内容
-            changes_made_rule2 = True
-            overall_changes_made = True # 标记总的更改状态
-            log_event("INFO", "process_function_rule2", f"Rule 2 (/MP) applied. Replacements: {num_replacements2}.")
-    except Exception as e_r2:
-        log_event("ERROR", "process_function_rule2", f"Exception during Rule 2 (/MP): {type(e_r2).__name__} - {e_r2}")
-        # return content_string, False # 或者之前的 current_processing_content (如果规则1有修改)
-
-    # --- 规则 3: -std:c++XX 替换为 /std:c++XX ---
-    changes_made_rule3 = False
+        with open(index_path_for(database_path), 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        stat_result = os.stat(database_path)
+    except (OSError, ValueError):
+        return None
+    database = payload.get("database") or {}
+    if payload.get("version") != INDEX_VERSION or database.get("size") != stat_result.st_size or \
+       database.get("mtime_ns") != stat_result.st_mtime_ns:
+        return None
+    return payload.get("entries")
+
+def is_compile_commands_index_current(database_path):
+    return load_compile_commands_index(database_path) is not None
+
+def lookup_compile_command(database_path, source_file, directory=""):
+    """返回 source_file 在 database_path 中的全部条目 (列表，可能为空)。
+
+    索引有效时只 seek 到对应位置解析这几个条目；否则退化为流式扫描整个数据库。
+    """
+    source_key = normalize_source_path(source_file, directory)
+    index = load_compile_commands_index(database_path)
+    if index is not None:
+        entries = []
+        with open(database_path, 'rb') as f:
+            for offset, length in index.get(source_key, []):
+                f.seek(offset)
+                entries.append(json.loads(f.read(length).decode('utf-8')))
+        return entries
+    with open(database_path, 'r', encoding='utf-8') as f_read:
+        return [entry for entry in iter_compile_commands_entries(f_read) if compile_command_entry_source_key(entry) == source_key]
+
+def filter_compile_commands_file(source_path, output_path, entry_filter=None):
+    """按过滤规则写出只包含项目自身源文件的数据库 (同时应用改写规则)，返回 (保留的条目数, 丢弃的条目数)。"""
+    entry_filter = entry_filter or COMPILE_COMMAND_ENTRY_FILTER
+    lookup_index = {} if INDEX_ENABLED else None
+    with AtomicWriteBack.AtomicFileWriter(output_path) as writer:
+        entry_count, _, dropped_count = stream_process_compile_commands(source_path, writer, index=lookup_index, entry_filter=entry_filter)
+        writer.commit()
+    if lookup_index is not None:
+        write_compile_commands_index(output_path, lookup_index)
+    return entry_count, dropped_count
+
+# --- 头文件条目合成 ---
+_INCLUDE_DIRECTIVE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.MULTILINE)
+# 选项 -> 目录类别。值可以紧跟在选项后 (-Ifoo)，也可以是下一个参数 (-I foo)
+_INCLUDE_DIR_OPTIONS = (
+    ("-iquote", "quote"), ("-isystem", "system"), ("-idirafter", "system"), ("-imsvc", "system"),
+    ("/external:I", "system"), ("-external:I", "system"), ("-I", "include"), ("/I", "include"),
+)
+
+def scan_include_directives(path):
+    """读取 path 中的 #include 指令，返回 [[是否为引号形式, 被包含的名字], ...]；文件不可读时返回 None。"""
     try:
-        # 规则3 在 规则2 处理后的 current_processing_content 上操作
-        log_event("DEBUG", "process_function_rule3", f"Before Rule 3 (-std:c++). Input length: {len(current_processing_content)}")
-        
-        # 正则表达式：匹配 "-std:c++" 后面跟着数字 (例如 17, 20, 23 等)
-        # 捕获组 \1: c++
-        # 捕获组 \2: XX (版本号)
-        # 我们也可以直接匹配整个 -std:c++XX
-        # regex_std_cpp = r'-std:(c\+\+\d+)' # 捕获 "c++XX"
-        # 替换为 r'/std:\1'
-
-        # 或者更简单，直接替换 "-std:" 为 "/std:" 如果后面是 "c++"
-        # 为了精确匹配 -std:c++20 或 -std:c++17 等
-        # (\d{2}) 捕获两位数字作为版本号
-        # 使用 (c\+\+) 是为了让 '+' 被正确处理，而不是作为正则表达式的量词
-        # `\b` 词边界，确保我们替换的是独立的标志
-        regex_std_cpp_version = r'(?<!\w)-std:(c\+\+\d{2})(?!\w)'
-        
-        processed_content_rule3, num_replacements3 = re.subn(regex_std_cpp_version, r'/std:\1', current_processing_content)
-        log_event("DEBUG", "process_function_rule3", f"re.subn (Rule 3 with regex '{regex_std_cpp_version}') result: num_replacements={num_replacements3}")
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        return None
+    return [[quote == b'"', name.decode('utf-8', 'replace').strip()] for quote, name in _INCLUDE_DIRECTIVE.findall(content)]
 
-        if num_replacements3 > 0:
-            current_processing_content = processed_content_rule3 # 更新内容
-            changes_made_rule3 = True
-            overall_changes_made = True # 标记总的更改状态
-            log_event("INFO", "process_function_rule3", f"Rule 3 (-std:c++XX to /std:c++XX) applied. Replacements: {num_replacements3}.")
-    except Exception as e_r3:
-        log_event("ERROR", "process_function_rule3", f"Exception during Rule 3 (-std:c++XX): {type(e_r3).__name__} - {e_r3}")
-        # return content_string, False
+def _entry_arguments(entry):
+    """返回条目的参数列表 (command 会被拆分)，@响应文件会被展开一层。无法解析时返回 None。"""
+    arguments = entry.get("arguments")
+    if not (isinstance(arguments, list) and all(isinstance(a, str) for a in arguments)):
+        command = entry.get("command")
+        if not isinstance(command, str):
+            return None
+        try:
+            arguments = split_command_line(command)
+        except ValueError:
+            return None
+    if not any(argument.startswith("@") for argument in arguments):
+        return arguments
+    directory = entry.get("directory") if isinstance(entry.get("directory"), str) else ""
+    expanded = []
+    for argument in arguments:
+        if argument.startswith("@"):
+            try:
+                with open(os.path.join(directory, argument[1:]), 'r', encoding='utf-8') as f:
+                    expanded.extend(split_command_line(f.read().replace("\n", " ")))
+                continue
+            except (OSError, ValueError):
+                pass
+        expanded.append(argument)
+    return expanded
 
-    log_event("DEBUG", "process_function", f"Exiting process_compile_commands_content. Overall changes made: {overall_changes_made}. Final length: {len(current_processing_content)}")
-    return current_processing_content, overall_changes_made
+def _include_search_dirs(arguments, directory):
+    """从参数中提取 (引号目录, 普通包含目录, 系统目录) 三个元组，相对路径按 directory 解析。"""
+    found = {"quote": [], "include": [], "system": []}
+    index = 1
+    while index < len(arguments):
+        argument = arguments[index]
+        index += 1
+        for option, kind in _INCLUDE_DIR_OPTIONS:
+            if argument.startswith(option):
+                value = argument[len(option):]
+                if not value and index < len(arguments):
+                    value = arguments[index]
+                    index += 1
+                if value:
+                    found[kind].append(os.path.normpath(os.path.join(directory, value)))
+                break
+    return tuple(found["quote"]), tuple(found["include"]), tuple(found["system"])
 
-# --- 主逻辑 ---
-if __name__ == "__main__":
-    # log_debug(f"Script execution started. Raw arguments: {sys.argv}")
+def _header_match_score(header_path, includer_path, depth):
+    """包含者与头文件的匹配程度，越大越好: 同名 (foo.h / foo.cpp) > 同目录 > 包含层级浅 > 公共目录前缀长。"""
+    header_dir, header_name = os.path.split(header_path)
+    includer_dir, includer_name = os.path.split(includer_path)
+    same_stem = os.path.splitext(header_name)[0] == os.path.splitext(includer_name)[0]
+    common_prefix = len(os.path.commonprefix([header_dir, includer_dir]))
+    return (same_stem, header_dir == includer_dir, -depth, common_prefix)
 
-    if len(sys.argv) < 3:
-        log_event("Script Error", "N/A", f"Insufficient arguments. Received: {sys.argv}")
-        sys.exit(1)
+class HeaderEntrySynthesizer:
+    """包装条目迭代器: 原样产出所有条目并记录各翻译单元的包含目录，结束时追加合成的头文件条目。
 
-    script_path = sys.argv[0]
-    event_type = sys.argv[1]
-    file_path = sys.argv[2]
+    reopen_entries() 返回原始数据库的新条目迭代器，用于第二遍读取被借用参数的翻译单元条目，
+    因此内存中只保留每个翻译单元的路径和 (去重后的) 包含目录，而不是完整条目。
+    """
 
-    log_event(event_type, file_path, f"Script invoked. Script path: {script_path}")
+    def __init__(self, database_path, reopen_entries, entry_filter=None):
+        self.database_path = database_path
+        self.reopen_entries = reopen_entries
+        self.entry_filter = entry_filter or COMPILE_COMMAND_ENTRY_FILTER
+        self.synthesized_count = 0
+        self.scanned_count = 0
+        self._covered = set() # 已有条目的源文件键
+        self._units = [] # (源文件键, 源文件路径, 包含目录编号)
+        self._search_dirs = {} # (引号目录, 包含目录, 系统目录) -> 编号，同一目标的翻译单元共用一组
+        self._search_dir_list = []
+        self._scan_cache = {}
+        self._scan_cache_dirty = False
+        self._used_scan_entries = {}
+        self._resolve_memo = {}
+
+    def wrap(self, entries):
+        for entry in entries:
+            self._observe(entry)
+            yield entry
+        yield from self._synthesize()
+
+    def _observe(self, entry):
+        source_key = compile_command_entry_source_key(entry)
+        if source_key is None:
+            return
+        self._covered.add(source_key)
+        if source_key.endswith(HEADER_EXTENSIONS):
+            return # 已有的头文件条目 (包括上一次合成的) 不作为包含者
+        arguments = _entry_arguments(entry)
+        if not arguments:
+            return
+        directory = entry.get("directory") if isinstance(entry.get("directory"), str) else ""
+        search_dirs = _include_search_dirs(arguments, directory)
+        dirs_id = self._search_dirs.get(search_dirs)
+        if dirs_id is None:
+            dirs_id = self._search_dirs[search_dirs] = len(self._search_dir_list)
+            self._search_dir_list.append(search_dirs)
+        source_path = os.path.normpath(os.path.join(directory, entry["file"]))
+        self._units.append((source_key, source_path, dirs_id))
+
+    # --- 扫描 (带 mtime 缓存，多线程并行) ---
+    def _load_scan_cache(self):
+        try:
+            with open(self.database_path + HEADER_SCAN_CACHE_SUFFIX, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            if payload.get("version") == HEADER_SCAN_CACHE_VERSION:
+                self._scan_cache = payload.get("files") or {}
+        except (OSError, ValueError):
+            self._scan_cache = {}
+
+    def _save_scan_cache(self):
+        # 只保留本次用到的文件，已删除的源文件不会一直留在缓存里
+        if not self._scan_cache_dirty and len(self._used_scan_entries) == len(self._scan_cache):
+            return
+        payload = {"version": HEADER_SCAN_CACHE_VERSION, "files": self._used_scan_entries}
+        try:
+            AtomicWriteBack.atomic_write_text(self.database_path + HEADER_SCAN_CACHE_SUFFIX,
+                                              json.dumps(payload, ensure_ascii=False, separators=(',', ':')), record=False)
+        except OSError as e_cache:
+            log_event("WARNING", self.database_path, "Failed to save include scan cache: %s", e_cache)
+
+    def _scan_one(self, path):
+        """返回 (path, 缓存条目或 None, 是否重新扫描)。在工作线程中执行。"""
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return path, None, False
+        cached = self._scan_cache.get(path)
+        if cached and cached[0] == stat_result.st_mtime_ns and cached[1] == stat_result.st_size:
+            return path, cached, False
+        directives = scan_include_directives(path)
+        if directives is None:
+            return path, None, False
+        return path, [stat_result.st_mtime_ns, stat_result.st_size, directives], True
+
+    def _scan(self, paths):
+        """并行扫描 paths，返回 {路径: [[是否引号形式, 名字], ...]}。"""
+        results = {}
+        paths = [path for path in dict.fromkeys(paths) if path not in self._used_scan_entries]
+        if len(paths) > 1 and HEADER_SCAN_WORKERS > 1:
+            with ThreadPoolExecutor(max_workers=HEADER_SCAN_WORKERS) as executor:
+                scanned = list(executor.map(self._scan_one, paths, chunksize=64))
+        else:
+            scanned = [self._scan_one(path) for path in paths]
+        for path, cache_entry, rescanned in scanned:
+            if cache_entry is None:
+                continue
+            self._used_scan_entries[path] = cache_entry
+            if rescanned:
+                self.scanned_count += 1
+                self._scan_cache_dirty = True
+        for path in paths:
+            if path in self._used_scan_entries:
+                results[path] = self._used_scan_entries[path][2]
+        return results
+
+    # --- 解析 #include ---
+    def _resolve(self, includer_path, quoted, name, dirs_id):
+        """返回被包含文件的路径；找不到或位于系统目录下时返回 None。"""
+        includer_dir = os.path.dirname(includer_path)
+        memo_key = (includer_dir if quoted else None, quoted, name, dirs_id)
+        if memo_key in self._resolve_memo:
+            return self._resolve_memo[memo_key]
+        quote_dirs, include_dirs, system_dirs = self._search_dir_list[dirs_id]
+        candidates = ((includer_dir,) + quote_dirs + include_dirs) if quoted else include_dirs
+        resolved = None
+        for directory in candidates:
+            candidate = os.path.normpath(os.path.join(directory, name))
+            if os.path.isfile(candidate):
+                resolved = candidate
+                break
+        if resolved is not None and any(resolved.startswith(system_dir + os.sep) for system_dir in system_dirs):
+            resolved = None
+        self._resolve_memo[memo_key] = resolved
+        return resolved
+
+    def _is_project_header(self, path, header_key):
+        return header_key not in self._covered and path.lower().endswith(HEADER_EXTENSIONS) and self.entry_filter.keeps(header_key)
+
+    def _assign_headers(self):
+        """返回 {头文件键: (头文件路径, 翻译单元编号)}。直接包含者逐个打分；只被头文件包含的头文件沿用其包含者的翻译单元。"""
+        best = {} # 头文件键 -> (分数, 翻译单元编号, 头文件路径)
+        directives_by_path = self._scan([source_path for _, source_path, _ in self._units])
+        for unit_index, (_, source_path, dirs_id) in enumerate(self._units):
+            for quoted, name in directives_by_path.get(source_path, ()):
+                header_path = self._resolve(source_path, quoted, name, dirs_id)
+                if header_path is None:
+                    continue
+                header_key = normalize_source_path(header_path)
+                if not self._is_project_header(header_path, header_key):
+                    continue
+                score = _header_match_score(header_path, source_path, 0)
+                current = best.get(header_key)
+                if current is None or score > current[0]:
+                    best[header_key] = (score, unit_index, header_path)
+
+        # 逐层向下: 上一层确定的头文件中包含的、尚未分配的头文件
+        frontier = {header_key: (unit_index, header_path) for header_key, (_, unit_index, header_path) in best.items()}
+        depth = 1
+        while frontier:
+            directives_by_path = self._scan([header_path for _, header_path in frontier.values()])
+            next_level = {}
+            for unit_index, header_path in frontier.values():
+                _, source_path, dirs_id = self._units[unit_index]
+                for quoted, name in directives_by_path.get(header_path, ()):
+                    included_path = self._resolve(header_path, quoted, name, dirs_id)
+                    if included_path is None:
+                        continue
+                    included_key = normalize_source_path(included_path)
+                    if included_key in best or not self._is_project_header(included_path, included_key):
+                        continue
+                    score = _header_match_score(included_path, source_path, depth)
+                    current = next_level.get(included_key)
+                    if current is None or score > current[0]:
+                        next_level[included_key] = (score, unit_index, included_path)
+            best.update(next_level)
+            frontier = {header_key: (unit_index, header_path) for header_key, (_, unit_index, header_path) in next_level.items()}
+            depth += 1
+        return {header_key: (header_path, unit_index) for header_key, (_, unit_index, header_path) in best.items()}
+
+    @staticmethod
+    def _make_header_entry(entry, unit_key, header_path):
+        """复制翻译单元条目，把其中的源文件换成头文件。无法在命令中定位源文件时返回 None。"""
+        header_entry = dict(entry)
+        header_entry.pop("output", None)
+        directory = entry.get("directory") if isinstance(entry.get("directory"), str) else ""
+        arguments = entry.get("arguments")
+        if isinstance(arguments, list):
+            replaced = [header_path if isinstance(argument, str) and not argument.startswith("-") and
+                        normalize_source_path(argument, directory) == unit_key else argument for argument in arguments]
+            if replaced == arguments:
+                return None
+            header_entry["arguments"] = replaced
+        elif isinstance(entry.get("command"), str) and entry["file"] in entry["command"]:
+            header_entry["command"] = entry["command"].replace(entry["file"], header_path)
+        else:
+            return None
+        header_entry["file"] = header_path
+        return header_entry
+
+    def _synthesize(self):
+        started = time.perf_counter()
+        self._load_scan_cache()
+        assignments = self._assign_headers()
+        self._save_scan_cache()
+        headers_by_unit_key = {}
+        for header_key in sorted(assignments):
+            header_path, unit_index = assignments[header_key]
+            headers_by_unit_key.setdefault(self._units[unit_index][0], []).append(header_path)
+        # 不再需要的大块状态尽早释放
+        self._units = []
+        self._resolve_memo = {}
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.add_time("headers.scan", time.perf_counter() - started)
+            INSTRUMENTATION.count("headers.scanned", self.scanned_count)
+        if not headers_by_unit_key:
+            return
+        # 第二遍: 读取被借用参数的翻译单元条目，每个源文件只取第一个条目
+        for entry in self.reopen_entries():
+            unit_key = compile_command_entry_source_key(entry)
+            header_paths = headers_by_unit_key.pop(unit_key, None) if unit_key is not None else None
+            if not header_paths:
+                continue
+            for header_path in header_paths:
+                header_entry = self._make_header_entry(entry, unit_key, header_path)
+                if header_entry is not None:
+                    self.synthesized_count += 1
+                    yield header_entry
+            if not headers_by_unit_key:
+                break
+        INSTRUMENTATION.count("headers.synthesized", self.synthesized_count)
+        log_event("DEBUG", self.database_path, "Synthesized %d header entries (%d files rescanned).",
+                  self.synthesized_count, self.scanned_count)
+
+def iter_compile_commands_file(path):
+    """打开 path 并逐个产出其中的条目 (读完后关闭文件)。"""
+    with open(path, 'r', encoding='utf-8') as f_read:
+        yield from iter_compile_commands_entries(f_read)
+
+# --- 事件处理 ---
+def handle_file_event(event_type, file_path, script_path=__file__):
+    """处理一次文件事件，返回进程退出码。供命令行入口和常驻监听进程 (WatchDispatcher.py) 共同调用。"""
+    started = time.perf_counter()
+    exit_code = _handle_file_event(event_type, file_path, script_path)
+    INSTRUMENTATION.flush(event=event_type, path=file_path, exit_code=exit_code, seconds=round(time.perf_counter() - started, 6))
+    return exit_code
+
+def _handle_file_event(event_type, file_path, script_path):
+    log_event(event_type, file_path, "Script invoked. Script path: %s", script_path)
 
     # 对特定事件类型引入延时
     if event_type == "Change New" or event_type == "Change Mod":
-        log_event(event_type, file_path, f"Event requires delay. Sleeping for {SLEEP_DURATION_SECONDS} second(s).")
+        log_event(event_type, file_path, "Event requires delay. Sleeping for %s second(s).", SLEEP_DURATION_SECONDS)
         # time.sleep(SLEEP_DURATION_SECONDS)
         log_event(event_type, file_path, "Resumed after sleep.")
 
@@ -159,21 +1254,61 @@ if __name__ == "__main__":
             # log_debug(f"Checking existence of '{file_path}'")
             if not os.path.exists(file_path):
                 log_event(event_type, file_path, "File not found (after potential sleep). Skipping content modification.")
-                sys.exit(0) # 文件可能在延时期间被删除了
+                return 0 # 文件可能在延时期间被删除了
             
             # log_debug(f"File '{file_path}' exists. Is it a file? {os.path.isfile(file_path)}")
             if not os.path.isfile(file_path):
                 log_event(event_type, file_path, "Path is not a regular file. Skipping content modification.")
-                sys.exit(0)
+                return 0
+
+            # 文件仍是上一次由本脚本写回的版本 (写回本身触发的事件)，无需重新读取
+            if AtomicWriteBack.is_self_written(file_path):
+                log_event(event_type, file_path, "File unchanged since our own write-back. Skipping.")
+                return 0
+
+            if STREAMING_MODE:
+                # --- 流式模式: 逐条目读取、改写并写入临时文件，有修改时再原子替换原文件 ---
+                rewrite_cache = CompileCommandsRewriteCache.for_database(file_path) if ENTRY_CACHE_ENABLED else None
+                lookup_index = {} if INDEX_ENABLED else None
+                entry_count = 0
+                try:
+                    with AtomicWriteBack.AtomicFileWriter(file_path) as writer:
+                        entry_filter = COMPILE_COMMAND_ENTRY_FILTER if FILTER_ENABLED else None
+                        header_synthesizer = HeaderEntrySynthesizer(file_path, lambda: iter_compile_commands_file(file_path)) \
+                            if HEADER_ENTRIES_ENABLED else None
+                        entry_count, changed_count, dropped_count = stream_process_compile_commands(
+                            file_path, writer, rewrite_cache, index=lookup_index, entry_filter=entry_filter,
+                            header_synthesizer=header_synthesizer)
+                        synthesized_count = header_synthesizer.synthesized_count if header_synthesizer else 0
+                        if changed_count > 0 or dropped_count > 0 or synthesized_count > 0:
+                            with INSTRUMENTATION.timer("write_back"):
+                                writer.commit()
+                                if lookup_index is not None:
+                                    write_compile_commands_index(file_path, lookup_index)
+                            log_event(event_type, file_path, "Streaming mode: %d/%d entries modified, %d dropped by filter, %d header entries added, written back by script.",
+                                      changed_count, entry_count, dropped_count, synthesized_count)
+                        else:
+                            # 没有修改时数据库保持不动 (否则会触发 clangd 重新加载)，只补写过期的索引。
+                            # 索引中的偏移对应我们输出的格式，只有原文件与输出逐字节相同 (CMake 生成的格式) 时才可用
+                            if lookup_index is not None and not is_compile_commands_index_current(file_path):
+                                if writer.matches_target():
+                                    write_compile_commands_index(file_path, lookup_index)
+                                else:
+                                    log_event(event_type, file_path, "Database format differs from ours; lookup index not written.")
+                            log_event(event_type, file_path, "Streaming mode: no content modification needed (%d entries).", entry_count)
+                finally:
+                    if rewrite_cache is not None:
+                        rewrite_cache.close(entry_count)
+                return 0
 
             # log_debug(f"Attempting to open and read '{file_path}'")
-            with open(file_path, 'r', encoding='utf-8') as f_read:
+            with INSTRUMENTATION.timer("read"), open(file_path, 'r', encoding='utf-8') as f_read:
                 original_content_str = f_read.read()
             # log_debug(f"Successfully read content from '{file_path}'. Length: {len(original_content_str)}")
 
             if not original_content_str.strip(): # 如果文件是空的或只包含空白
                  log_event(event_type, file_path, "File is empty or contains only whitespace. Skipping processing.")
-                 sys.exit(0)
+                 return 0
 
             # --- 阶段 2: 处理内容 ---
             processed_content_str, changes_were_made = process_compile_commands_content(original_content_str)
@@ -181,8 +1316,8 @@ if __name__ == "__main__":
             # --- 阶段 3: 写回文件 (如果需要) ---
             if changes_were_made:
                 # log_debug(f"Content was modified by script. Attempting to write back to '{file_path}'")
-                with open(file_path, 'w', encoding='utf-8') as f_write:
-                    f_write.write(processed_content_str)
+                with INSTRUMENTATION.timer("write_back"):
+                    AtomicWriteBack.atomic_write_text(file_path, processed_content_str)
                 # log_debug(f"Successfully wrote back to '{file_path}'")
                 log_event(event_type, file_path, "Content modified and written back by script.")
                 
@@ -191,18 +1326,47 @@ if __name__ == "__main__":
                     json.loads(processed_content_str)
                     # log_debug("Modified content is valid JSON.")
                 except json.JSONDecodeError as je:
-                    log_event("JSON Error", file_path, f"CRITICAL: Script modification resulted in invalid JSON: {je}")
+                    log_event("JSON Error", file_path, "CRITICAL: Script modification resulted in invalid JSON: %s", je)
             else:
                 log_event(event_type, file_path, "No content modification needed by script (rules applied but content was already compliant or no rules matched).")
 
         except IOError as ioe:
-            log_event("IOError", file_path, f"IOError during file processing: {ioe}. Errno: {ioe.errno if hasattr(ioe, 'errno') else 'N/A'}")
-            sys.exit(1)
+            log_event("IOError", file_path, "IOError during file processing: %s. Errno: %s", ioe, getattr(ioe, 'errno', 'N/A'))
+            return 1
         except Exception as e:
-            log_event("Processing Error", file_path, f"Generic error during file processing: {type(e).__name__} - {e}. Original content was read: {original_content_str is not None}")
-            sys.exit(1)
+            log_event("Processing Error", file_path, "Generic error during file processing: %s - %s. Original content was read: %s", type(e).__name__, e, original_content_str is not None)
+            return 1
     else:
         log_event(event_type, file_path, "File or event type not targeted for content processing.")
 
+    return 0
+
+# --- 主逻辑 ---
+if __name__ == "__main__":
+    # log_debug(f"Script execution started. Raw arguments: {sys.argv}")
+
+    # 查询模式: ModifyCompileCommand.py --lookup <compile_commands.json> <源文件> [目录]
+    # 输出该源文件的条目 (JSON 数组)，供 clang-tidy 包装脚本等工具使用
+    if len(sys.argv) >= 4 and sys.argv[1] == "--lookup":
+        found_entries = lookup_compile_command(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else "")
+        print(json.dumps(found_entries, indent=2, ensure_ascii=False))
+        sys.exit(0 if found_entries else 1)
+
+    # 过滤模式: ModifyCompileCommand.py --filter <compile_commands.json> [输出路径]
+    # 按 FILTER_INCLUDE_GLOBS / FILTER_EXCLUDE_GLOBS 写出裁剪后的数据库 (默认覆盖原文件)，并报告丢弃的条目数
+    if len(sys.argv) >= 3 and sys.argv[1] == "--filter":
+        output_path = sys.argv[3] if len(sys.argv) > 3 else sys.argv[2]
+        kept_count, dropped_count = filter_compile_commands_file(sys.argv[2], output_path)
+        print(f"{output_path}: 保留 {kept_count} 个条目，丢弃 {dropped_count} 个条目")
+        sys.exit(0)
+
+    if len(sys.argv) < 3:
+        log_event("Script Error", "N/A", "Insufficient arguments. Received: %s", sys.argv)
+        sys.exit(1)
+
+    script_path = sys.argv[0]
+    event_type = sys.argv[1]
+    file_path = sys.argv[2]
+
     # log_debug("Script execution finished.")
-    sys.exit(0) # 确保脚本正常结束时返回0
\ No newline at end of file
+    sys.exit(handle_file_event(event_type, file_path, script_path)) # 确保脚本正常结束时返回0
@@ -1,85 +1,238 @@
 import sys
-import datetime
 import os
 import time # 导入 time 模块
-import json
 import re
 
+import AtomicWriteBack
+import Instrumentation
+
 # --- 配置 ---
-LOG_FILE_NAME = "event.log" # 主日志文件
 # DEBUG_LOG_FILE_NAME = "debug_script_trace.log" # 可选的更详细的调试日志
 TARGET_FILE_BASENAME = "build.ninja"
 SLEEP_DURATION_SECONDS = 1 # 为文件稳定操作设置的延时
+# 流式模式: 逐行解析 build.ninja (识别 $ 续行和 rule / build 作用域)，只改写 FLAGS / DEFINES 类变量的赋值，
+# 其余行原样复制到临时文件，有修改时再原子替换。NINJA_CONFIG_STREAMING=0 切换回整文件正则替换
+STREAMING_MODE = os.environ.get("NINJA_CONFIG_STREAMING", "1") != "0"
+# 需要改写的变量名 (build 作用域或顶层的赋值)；rule 作用域中的 command 等变量不改写
+REWRITTEN_VARIABLE_PATTERN = re.compile(r'^[A-Za-z0-9_]*(?:FLAGS|DEFINES)$')
+# 写回后把 build.ninja 的 atime / mtime 恢复为改写前的值。build.ninja 是 CMake 重新生成规则
+# (build build.ninja: RERUN_CMAKE | CMakeLists.txt CMakeFiles/rules.ninja ...) 的输出，
+# 保持它与这些输入、CMake 时间戳文件之间的先后顺序不变，ninja 就不会因为这次改写而重新运行 CMake。
+# NINJA_CONFIG_PRESERVE_MTIME=0 时写回的文件使用当前时间
+PRESERVE_MANIFEST_TIMESTAMPS = os.environ.get("NINJA_CONFIG_PRESERVE_MTIME", "1") != "0"
+
+# --- 日志与埋点 ---
+# 设置环境变量 REWRITE_METRICS (文件路径或 "stderr") 后输出 JSON Lines 事件和每次处理的汇总 (见 Instrumentation.py)；
+# 未设置时 log_event 是空操作，消息用 "%s" 占位符和参数传入，只有开启时才会格式化
+INSTRUMENTATION = Instrumentation.recorder("ModifyNinjaConfig")
+log_event = INSTRUMENTATION.event
+
+# --- 规则定义 ---
+MP_RULE_NAME = "Rule 2 (/MP)"
+MP_RULE_PATTERN = re.compile(r'\s*/MP\b')
+# 变量值中使用的版本: /MP 必须是独立的参数 (不会命中 /EHsc/MP 或 -I/MP 这类路径)。
+# 位于值开头时连同其后的空白一起删除 ("/MP /W3" -> "/W3")；位于中间或末尾时删除其前的空白，
+# 被删除的空白必须紧跟在一个普通字符之后，不会吃掉 "$ " (转义空格) 中的空格
+MP_VALUE_RULE_PATTERN = re.compile(r'^/MP(?:\s+|$)|(?<=[^$\s])\s+/MP(?=\s|$)')
 
-# --- 日志记录函数 ---
-def log_message_to_file(log_file, message_prefix, event_type, file_path_affected, additional_info=""):
-    return
-    # timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    # log_entry = f"[{timestamp}] {message_prefix}: Event='{event_type}', Path='{file_path_affected}'"
-    # if additional_info:
-    #     log_entry += f", Info='{additional_info}'"
-    # log_entry += "\n"
-    #
-    # print(log_entry.strip()) # 总是打印到 stdout/stderr，方便直接查看
-    #
-    # try:
-    #     with open(log_file, "a", encoding="utf-8") as f:
-    #         f.write(log_entry)
-    # except Exception as e_log:
-    #     # 如果写入主日志失败，尝试打印一个更紧急的错误
-    #     print(f"[{timestamp}] VERY CRITICAL: Logging to {log_file} FAILED: {e_log}. Original message: {log_entry.strip()}")
-
-def log_event(event_type, file_path_affected, additional_info=""):
-    log_message_to_file(LOG_FILE_NAME, "EVENT", event_type, file_path_affected, additional_info)
-
-
-
-def process_compile_commands_content(content_string):
-    log_event("DEBUG", "process_function", f"Entering process_compile_commands_content. Input length: {len(content_string if isinstance(content_string, str) else [])}. Type: {type(content_string)}")
-    
+
+def process_compile_commands_content(content_string, rule_pattern=MP_RULE_PATTERN):
+    """对 content_string 应用规则，返回 (新内容, 是否有修改)。整文件模式传入全部内容，流式模式传入单个变量值片段。"""
     if not isinstance(content_string, str):
-        log_event("ERROR", "process_function", f"content_string is not a string, it's {type(content_string)}. Returning as is.")
+        log_event("ERROR", "process_function", "content_string is not a string, it's %s. Returning as is.", type(content_string))
         return content_string, False
 
     # 初始化，假设最初内容为输入内容
     current_processing_content = content_string 
     overall_changes_made = False
     # --- 规则 2: /MP 处理 ---
-    changes_made_rule2 = False
     try:
         # 规则2 在 规则1 处理后的 current_processing_content 上操作
-        log_event("DEBUG", "process_function_rule2", f"Before Rule 2 (/MP). Input length: {len(current_processing_content)}")
-        processed_content_rule2, num_replacements2 = re.subn(r'\s*/MP\b', '', current_processing_content)
-        log_event("DEBUG", "process_function_rule2", f"re.subn (Rule 2) result: num_replacements={num_replacements2}")
+        if INSTRUMENTATION.enabled:
+            started = time.perf_counter()
+            processed_content_rule2, num_replacements2 = rule_pattern.subn('', current_processing_content)
+            INSTRUMENTATION.add_rule_stats([MP_RULE_NAME], [num_replacements2], [time.perf_counter() - started])
+            INSTRUMENTATION.count("rules.input_chars", len(current_processing_content))
+        else:
+            processed_content_rule2, num_replacements2 = rule_pattern.subn('', current_processing_content)
         if num_replacements2 > 0:
             current_processing_content = processed_content_rule2 # 更新内容
-            changes_made_rule2 = True
             overall_changes_made = True # 标记总的更改状态
-            log_event("INFO", "process_function_rule2", f"Rule 2 (/MP) applied. Replacements: {num_replacements2}.")
+            log_event("INFO", "process_function_rule2", "%s applied. Replacements: %d.", MP_RULE_NAME, num_replacements2)
     except Exception as e_r2:
-        log_event("ERROR", "process_function_rule2", f"Exception during Rule 2 (/MP): {type(e_r2).__name__} - {e_r2}")
+        log_event("ERROR", "process_function_rule2", "Exception during Rule 2 (/MP): %s - %s", type(e_r2).__name__, e_r2)
 
     return current_processing_content, overall_changes_made
         # return content_string, False # 或者之前的 current_processing_content (如果规则1有修改)
 
 
-# --- 主逻辑 ---
-if __name__ == "__main__":
-    # log_debug(f"Script execution started. Raw arguments: {sys.argv}")
+# --- 流式处理 ---
+# 名字符合 REWRITTEN_VARIABLE_PATTERN 的赋值的开头 (缩进、变量名、"=" 及其后的空白)
+_ASSIGNMENT_PATTERN = re.compile(r'([ \t]*)(' + REWRITTEN_VARIABLE_PATTERN.pattern.strip('^$') + r')([ \t]*=[ \t]*)')
+_SCOPE_KEYWORDS = {"build": "build", "rule": "rule", "pool": "pool"}
 
-    if len(sys.argv) < 3:
-        log_event("Script Error", "N/A", f"Insufficient arguments. Received: {sys.argv}")
-        sys.exit(1)
 
-    script_path = sys.argv[0]
-    event_type = sys.argv[1]
-    file_path = sys.argv[2]
+def _ends_with_continuation(line):
+    """行尾 (去掉换行符后) 是否为奇数个 '$'，即 ninja 的续行符 (偶数个是转义的字面量 '$')。"""
+    body = line.rstrip('\r\n')
+    count = len(body) - len(body.rstrip('$'))
+    return count % 2 == 1
+
+
+def _rewrite_assignment(physical_lines, prefix_length):
+    """改写一个 (可能跨多行的) 变量赋值。规则逐行作用于 "$\n" 之前的内容，续行结构保持不变。
+    返回 (新的行列表, 是否有修改)。"""
+    new_lines = []
+    changes_made = False
+    for line_index, line in enumerate(physical_lines):
+        body = line.rstrip('\r\n')
+        # 续行开头的缩进保留原样，只改写其后的内容
+        start = prefix_length if line_index == 0 else len(body) - len(body.lstrip(' \t'))
+        ending = line[len(body):]
+        continued = _ends_with_continuation(line)
+        content = body[start:-1] if continued else body[start:]
+        new_content, content_changed = process_compile_commands_content(content, MP_VALUE_RULE_PATTERN)
+        if content_changed:
+            changes_made = True
+            # "a $\n" 中 '$' 前的空格是值的一部分，删掉末尾的 /MP 后仍要保留，否则会和下一行的内容连在一起
+            # 值被删空时不补: 前面的 "VAR = " 或续行缩进已经起到分隔作用
+            if continued and content[-1:].isspace() and new_content and not new_content[-1:].isspace():
+                new_content += " "
+            line = body[:start] + new_content + ("$" if continued else "") + ending
+        new_lines.append(line)
+    return new_lines, changes_made
+
+
+def stream_process_ninja_file(f_read, write, batch_lines=8192, manifest_name=TARGET_FILE_BASENAME):
+    """逐行读取 build.ninja，只改写 build 作用域和顶层中 FLAGS / DEFINES 类变量的赋值，其余行原样输出。
+    write(str) 接收输出 (按批调用)。返回 (改写过的赋值数, 读取的行数, 重新生成 manifest_name 的 build 语句的输入)；
+    找不到该语句时第三项为 None。"""
+    scope = None # 当前缩进行所属的声明: "build" / "rule" / "pool" / None (顶层)
+    continuation = False # 上一行以续行符结尾，本行属于同一条语句
+    rewritten_count = 0
+    line_count = 0
+    pending = []
+    candidate_statements = [] # 提到 manifest_name 的 build 语句 (其中之一是 CMake 的 RERUN_CMAKE)，原样收集
+    capturing = False
+    lines = iter(f_read)
+    for line in lines:
+        line_count += 1
+        if continuation:
+            # 续行原样复制，不当作新的声明或赋值解析
+            pending.append(line)
+            if capturing:
+                candidate_statements[-1].append(line)
+            continuation = '$' in line[-3:] and _ends_with_continuation(line)
+            continue
+        capturing = False
+        first = line[:1]
+        if first == ' ' or first == '\t':
+            candidate = scope == "build" # build 作用域中的变量必须缩进；rule / pool 作用域中的变量不改写
+        elif first in ('\n', '\r', '#', ''):
+            candidate = False # 空行和注释不改变作用域
+        else:
+            # 非缩进行开始新的声明；顶层赋值只在非缩进时有效
+            scope = _SCOPE_KEYWORDS.get(line.split(None, 1)[0] if line.strip() else "")
+            candidate = scope is None
+            if scope == "build" and manifest_name in line:
+                candidate_statements.append([line])
+                capturing = True
+        match = _ASSIGNMENT_PATTERN.match(line) if candidate and '=' in line else None
+        if match is None:
+            pending.append(line)
+            continuation = '$' in line[-3:] and _ends_with_continuation(line)
+        else:
+            physical_lines = [line]
+            while _ends_with_continuation(physical_lines[-1]):
+                next_line = next(lines, "")
+                if not next_line:
+                    break
+                line_count += 1
+                physical_lines.append(next_line)
+            new_lines, assignment_changed = _rewrite_assignment(physical_lines, match.end())
+            if assignment_changed:
+                rewritten_count += 1
+            pending.extend(new_lines)
+        if len(pending) >= batch_lines:
+            write("".join(pending))
+            pending.clear()
+    if pending:
+        write("".join(pending))
+    regeneration_inputs = None
+    for statement_lines in candidate_statements:
+        regeneration_inputs = parse_regeneration_inputs("".join(statement_lines), manifest_name)
+        if regeneration_inputs is not None:
+            break
+    return rewritten_count, line_count, regeneration_inputs
 
-    log_event(event_type, file_path, f"Script invoked. Script path: {script_path}")
+
+# --- 重新生成规则 ---
+# 路径 (可含 "$x" 转义) 或 ":"；续行符 "$\n" 和空白都不属于任何记号。转义按 ninja 的规则还原 ("$ " -> " "、"$:" -> ":"、"$$" -> "$")
+_PATH_TOKEN_PATTERN = re.compile(r'(?:\$[^\r\n]|[^$ \t:\r\n])+|:')
+_PATH_ESCAPE_PATTERN = re.compile(r'\$(.)')
+
+
+def parse_regeneration_inputs(statement, manifest_name=TARGET_FILE_BASENAME):
+    """解析 "build 输出...: 规则 显式输入... | 隐式输入... || 仅顺序依赖..." 语句。
+    输出中包含 manifest_name 时返回决定它是否过期的输入 (显式 + 隐式，不含仅顺序依赖和 |@ 校验)，否则返回 None。"""
+    tokens = _PATH_TOKEN_PATTERN.findall(statement)
+    if not tokens or tokens[0] != "build" or ":" not in tokens:
+        return None
+    colon = tokens.index(":")
+    outputs = [_PATH_ESCAPE_PATTERN.sub(r'\1', token) for token in tokens[1:colon] if token != "|"]
+    if not any(os.path.basename(output) == manifest_name for output in outputs):
+        return None
+    inputs = []
+    for token in tokens[colon + 2:]: # 跳过规则名
+        if token in ("||", "|@"):
+            break
+        if token != "|":
+            inputs.append(_PATH_ESCAPE_PATTERN.sub(r'\1', token))
+    return inputs
+
+
+def newest_regeneration_input(manifest_path, inputs):
+    """返回 (最新的输入路径, 其 mtime_ns)。相对路径相对于 build.ninja 所在目录 (ninja 的工作目录)；不存在的输入被忽略。"""
+    build_dir = os.path.dirname(os.path.abspath(manifest_path))
+    newest_path, newest_mtime_ns = None, None
+    for path in inputs:
+        try:
+            mtime_ns = os.stat(os.path.join(build_dir, path)).st_mtime_ns
+        except OSError:
+            continue
+        if newest_mtime_ns is None or mtime_ns > newest_mtime_ns:
+            newest_path, newest_mtime_ns = path, mtime_ns
+    return newest_path, newest_mtime_ns
+
+
+def manifest_times_ns(event_type, file_path, original_stat, regeneration_inputs=None):
+    """写回时 build.ninja 应使用的 (atime_ns, mtime_ns)；不保留时间戳时返回 None。
+    已知重新生成语句的输入时检查先后顺序: 若某个输入本来就比 build.ninja 新，ninja 无论如何都会重新运行 CMake，记录一条警告。"""
+    if not PRESERVE_MANIFEST_TIMESTAMPS:
+        return None
+    if regeneration_inputs:
+        newest_path, newest_mtime_ns = newest_regeneration_input(file_path, regeneration_inputs)
+        if newest_mtime_ns is not None and newest_mtime_ns > original_stat.st_mtime_ns:
+            log_event(event_type, file_path, "Regeneration input '%s' is newer than the manifest; ninja will re-run CMake regardless of this write-back.", newest_path)
+    elif regeneration_inputs is not None:
+        log_event(event_type, file_path, "Manifest regeneration statement has no inputs.")
+    return (original_stat.st_atime_ns, original_stat.st_mtime_ns)
+
+
+# --- 事件处理 ---
+def handle_file_event(event_type, file_path, script_path=__file__):
+    """处理一次文件事件，返回进程退出码。供命令行入口和常驻监听进程 (WatchDispatcher.py) 共同调用。"""
+    started = time.perf_counter()
+    exit_code = _handle_file_event(event_type, file_path, script_path)
+    INSTRUMENTATION.flush(event=event_type, path=file_path, exit_code=exit_code, seconds=round(time.perf_counter() - started, 6))
+    return exit_code
+
+def _handle_file_event(event_type, file_path, script_path):
+    log_event(event_type, file_path, "Script invoked. Script path: %s", script_path)
 
     # 对特定事件类型引入延时
     if event_type == "Change New" or event_type == "Change Mod":
-        log_event(event_type, file_path, f"Event requires delay. Sleeping for {SLEEP_DURATION_SECONDS} second(s).")
+        log_event(event_type, file_path, "Event requires delay. Sleeping for %s second(s).", SLEEP_DURATION_SECONDS)
         # time.sleep(SLEEP_DURATION_SECONDS)
         log_event(event_type, file_path, "Resumed after sleep.")
 
@@ -96,43 +249,82 @@ if __name__ == "__main__":
             # log_debug(f"Checking existence of '{file_path}'")
             if not os.path.exists(file_path):
                 log_event(event_type, file_path, "File not found (after potential sleep). Skipping content modification.")
-                sys.exit(0) # 文件可能在延时期间被删除了
+                return 0 # 文件可能在延时期间被删除了
             
             # log_debug(f"File '{file_path}' exists. Is it a file? {os.path.isfile(file_path)}")
             if not os.path.isfile(file_path):
                 log_event(event_type, file_path, "Path is not a regular file. Skipping content modification.")
-                sys.exit(0)
+                return 0
+
+            # 文件仍是上一次由本脚本写回的版本 (写回本身触发的事件)，无需重新读取
+            if AtomicWriteBack.is_self_written(file_path):
+                log_event(event_type, file_path, "File unchanged since our own write-back. Skipping.")
+                return 0
+
+            if STREAMING_MODE:
+                # --- 流式模式: 逐行读取并写入临时文件，只有改写过变量时才原子替换原文件 ---
+                with INSTRUMENTATION.timer("stream_process"), \
+                     open(file_path, 'r', encoding='utf-8', errors='surrogateescape', newline='') as f_read, \
+                     AtomicWriteBack.AtomicFileWriter(file_path) as writer:
+                    original_stat = os.fstat(f_read.fileno())
+                    rewritten_count, line_count, regeneration_inputs = stream_process_ninja_file(
+                        f_read, lambda text: writer.write(text.encode('utf-8', 'surrogateescape')))
+                    INSTRUMENTATION.count("lines", line_count)
+                    INSTRUMENTATION.count("assignments.rewritten", rewritten_count)
+                    if rewritten_count > 0:
+                        writer.commit(times_ns=manifest_times_ns(event_type, file_path, original_stat, regeneration_inputs))
+                        log_event(event_type, file_path, "Streaming mode: %d variable assignments rewritten (%d lines).", rewritten_count, line_count)
+                    else:
+                        log_event(event_type, file_path, "Streaming mode: no content modification needed (%d lines).", line_count)
+                return 0
 
             # log_debug(f"Attempting to open and read '{file_path}'")
-            with open(file_path, 'r', encoding='utf-8') as f_read:
+            with INSTRUMENTATION.timer("read"), open(file_path, 'r', encoding='utf-8') as f_read:
+                original_stat = os.fstat(f_read.fileno())
                 original_content_str = f_read.read()
             # log_debug(f"Successfully read content from '{file_path}'. Length: {len(original_content_str)}")
 
             if not original_content_str.strip(): # 如果文件是空的或只包含空白
                  log_event(event_type, file_path, "File is empty or contains only whitespace. Skipping processing.")
-                 sys.exit(0)
+                 return 0
 
             # --- 阶段 2: 处理内容 ---
-            processed_content_str, changes_were_made = process_compile_commands_content(original_content_str)
+            with INSTRUMENTATION.timer("rules"):
+                processed_content_str, changes_were_made = process_compile_commands_content(original_content_str)
             
             # --- 阶段 3: 写回文件 (如果需要) ---
             if changes_were_made:
                 # log_debug(f"Content was modified by script. Attempting to write back to '{file_path}'")
-                with open(file_path, 'w', encoding='utf-8') as f_write:
-                    f_write.write(processed_content_str)
+                with INSTRUMENTATION.timer("write_back"):
+                    AtomicWriteBack.atomic_write_text(file_path, processed_content_str,
+                                                      times_ns=manifest_times_ns(event_type, file_path, original_stat))
                 # log_debug(f"Successfully wrote back to '{file_path}'")
                 log_event(event_type, file_path, "Content modified and written back by script.")
             else:
                 log_event(event_type, file_path, "No content modification needed by script (rules applied but content was already compliant or no rules matched).")
 
         except IOError as ioe:
-            log_event("IOError", file_path, f"IOError during file processing: {ioe}. Errno: {ioe.errno if hasattr(ioe, 'errno') else 'N/A'}")
-            sys.exit(1)
+            log_event("IOError", file_path, "IOError during file processing: %s. Errno: %s", ioe, getattr(ioe, 'errno', 'N/A'))
+            return 1
         except Exception as e:
-            log_event("Processing Error", file_path, f"Generic error during file processing: {type(e).__name__} - {e}. Original content was read: {original_content_str is not None}")
-            sys.exit(1)
+            log_event("Processing Error", file_path, "Generic error during file processing: %s - %s. Original content was read: %s", type(e).__name__, e, original_content_str is not None)
+            return 1
     else:
         log_event(event_type, file_path, "File or event type not targeted for content processing.")
 
+    return 0
+
+# --- 主逻辑 ---
+if __name__ == "__main__":
+    # log_debug(f"Script execution started. Raw arguments: {sys.argv}")
+
+    if len(sys.argv) < 3:
+        log_event("Script Error", "N/A", "Insufficient arguments. Received: %s", sys.argv)
+        sys.exit(1)
+
+    script_path = sys.argv[0]
+    event_type = sys.argv[1]
+    file_path = sys.argv[2]
+
     # log_debug("Script execution finished.")
-    sys.exit(0) # 确保脚本正常结束时返回0
\ No newline at end of file
+    sys.exit(handle_file_event(event_type, file_path, script_path)) # 确保脚本正常结束时返回0
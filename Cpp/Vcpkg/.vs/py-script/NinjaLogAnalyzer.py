@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import platform
+import statistics
+import subprocess
+
+# 分析构建目录中的 .ninja_log，把每次构建各输出的耗时追加到本地 SQLite 历史库，并报告最慢的构建边
+# 以及相对前 N 次构建 (同一预设) 变慢最多的输出。CMakeWorkflow.py 在执行构建预设后自动调用，也可单独运行:
+#   python NinjaLogAnalyzer.py build/ --preset ninja-debug [--history 5] [--top 15] [--report-only]
+#
+# .ninja_log (v5 / v6 / v7) 每行为 "开始毫秒 \t 结束毫秒 \t mtime \t 输出 \t 命令哈希"，ninja 每完成一条边就追加一行。
+# 上次读到的字节偏移记录在历史库中，每次只解析新追加的部分；ninja 重写 (压缩) 日志后文件变短或 inode 改变，
+# 此时从头读取，并跳过 (输出, mtime) 与历史中最近一次记录相同的旧行。
+# 一段新内容中结束时间回退说明 ninja 被运行了不止一次，按此拆分为多次构建分别记录。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+NINJA_LOG_NAME = ".ninja_log"
+SUPPORTED_LOG_VERSIONS = (5, 6, 7) # 更早的版本第五列是完整命令而不是哈希，不再支持
+# 历史库默认位于构建目录下；NINJA_LOG_HISTORY_DB 可指向一个共享的位置
+HISTORY_DB_NAME = ".ninja_log_history.sqlite"
+HISTORY_DB_ENV = "NINJA_LOG_HISTORY_DB"
+DEFAULT_HISTORY_BUILDS = 5 # 与前几次构建比较
+DEFAULT_TOP_COUNT = 10 # 报告中每个列表显示的行数
+REGRESSION_MIN_DELTA_MS = 200 # 变慢不足该毫秒数的输出不算回退 (避免噪声)
+REGRESSION_MIN_RATIO = 1.2 # 耗时至少为基线的该倍数才算回退
+
+
+class NinjaLogEdge:
+    """日志中的一条构建边 (同一条边的多个输出在日志中各占一行，开始/结束时间与命令哈希相同)。"""
+    __slots__ = ("start_ms", "end_ms", "mtime", "outputs", "command_hash")
+
+    def __init__(self, start_ms, end_ms, mtime, output, command_hash):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.mtime = mtime
+        self.outputs = [output]
+        self.command_hash = command_hash
+
+    @property
+    def duration_ms(self):
+        return self.end_ms - self.start_ms
+
+
+def read_log_version(log_path):
+    """返回 .ninja_log 的版本号；首行不是 "# ninja log vN" 时返回 None。"""
+    with open(log_path, 'rb') as f:
+        header = f.readline().decode('utf-8', 'replace').strip()
+    prefix = "# ninja log v"
+    if not header.startswith(prefix) or not header[len(prefix):].isdigit():
+        return None
+    return int(header[len(prefix):])
+
+
+def parse_log_lines(data):
+    """解析新追加的日志内容 (bytes，只含完整的行)，返回按 ninja 运行拆分的构建列表 [[NinjaLogEdge, ...], ...]。"""
+    runs = []
+    edges = []
+    last_edge = None
+    previous_end = -1
+    for raw_line in data.split(b"\n"):
+        if not raw_line or raw_line.startswith(b"#"):
+            continue
+        fields = raw_line.rstrip(b"\r").split(b"\t")
+        if len(fields) != 5:
+            continue
+        try:
+            start_ms, end_ms, mtime = int(fields[0]), int(fields[1]), int(fields[2])
+        except ValueError:
+            continue
+        output = fields[3].decode('utf-8', 'surrogateescape')
+        command_hash = fields[4].decode('ascii', 'replace')
+        if end_ms < previous_end and edges:
+            # 结束时间回退: 新的一次 ninja 运行 (同一次运行中的行按完成顺序追加，结束时间单调不减)
+            runs.append(edges)
+            edges = []
+            last_edge = None
+        previous_end = end_ms
+        if last_edge is not None and last_edge.start_ms == start_ms and last_edge.end_ms == end_ms \
+                and last_edge.command_hash == command_hash:
+            last_edge.outputs.append(output)
+            continue
+        last_edge = NinjaLogEdge(start_ms, end_ms, mtime, output, command_hash)
+        edges.append(last_edge)
+    if edges:
+        runs.append(edges)
+    return runs
+
+
+def latest_durations(binary_dir):
+    """从 binary_dir/.ninja_log 读取每个输出最近一次的耗时 (毫秒)。日志不存在或版本不支持时返回空字典。"""
+    log_path = os.path.join(binary_dir, NINJA_LOG_NAME)
+    if not os.path.isfile(log_path) or read_log_version(log_path) not in SUPPORTED_LOG_VERSIONS:
+        return {}
+    with open(log_path, 'rb') as f:
+        data = f.read()
+    durations = {}
+    for edges in parse_log_lines(data[:data.rfind(b"\n") + 1]):
+        for edge in edges:
+            for output in edge.outputs:
+                durations[output] = edge.duration_ms
+    return durations
+
+
+def current_commit(project_dir):
+    """返回 project_dir 当前的 git 提交 (短哈希，工作区有修改时带 "-dirty")；不是 git 仓库时返回 "unknown"。"""
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty", "--abbrev=12"], cwd=project_dir,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return result.stdout.strip() if result.returncode == 0 and result.stdout.strip() else "unknown"
+
+
+class BuildHistory:
+    """构建耗时历史库。builds 表每次构建一行 (按 构建目录 + 预设 + 提交 记录)，durations 表每个输出一行，
+    log_state 表记录每个 .ninja_log 上次读到的位置。"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS log_state (
+                log_path TEXT PRIMARY KEY, inode INTEGER, offset INTEGER, version INTEGER);
+            CREATE TABLE IF NOT EXISTS builds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, binary_dir TEXT, preset TEXT, commit_hash TEXT,
+                recorded_at REAL, edge_count INTEGER, wall_ms INTEGER, total_ms INTEGER);
+            CREATE TABLE IF NOT EXISTS durations (
+                build_id INTEGER, output TEXT, duration_ms INTEGER, mtime INTEGER);
+            CREATE INDEX IF NOT EXISTS builds_by_preset ON builds (binary_dir, preset, id);
+            CREATE INDEX IF NOT EXISTS durations_by_build ON durations (build_id);
+            CREATE INDEX IF NOT EXISTS durations_by_output ON durations (output, build_id);
+        """)
+
+    @classmethod
+    def for_binary_dir(cls, binary_dir, db_path=None):
+        return cls(db_path or os.environ.get(HISTORY_DB_ENV) or os.path.join(binary_dir, HISTORY_DB_NAME))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def read_new_runs(self, log_path):
+        """读取 log_path 自上次以来新增的完整行。返回 (构建列表, 日志是否被重写过)。"""
+        log_path = os.path.abspath(log_path)
+        version = read_log_version(log_path)
+        if version not in SUPPORTED_LOG_VERSIONS:
+            raise ValueError(f"不支持的 .ninja_log 版本: {version} ({log_path})")
+        stat_result = os.stat(log_path)
+        row = self.connection.execute("SELECT inode, offset, version FROM log_state WHERE log_path = ?", (log_path,)).fetchone()
+        rewritten = row is not None and (row[0] != stat_result.st_ino or row[1] > stat_result.st_size or row[2] != version)
+        offset = row[1] if row is not None and not rewritten else 0
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # 只处理完整的行，未写完的最后一行留到下次
+        complete_length = data.rfind(b"\n") + 1
+        data = data[:complete_length]
+        self.connection.execute("INSERT OR REPLACE INTO log_state (log_path, inode, offset, version) VALUES (?, ?, ?, ?)",
+                                (log_path, stat_result.st_ino, offset + complete_length, version))
+        runs = parse_log_lines(data)
+        if rewritten or row is None:
+            runs = self._drop_known_edges(os.path.dirname(log_path), runs)
+        return runs, rewritten
+
+    def _drop_known_edges(self, binary_dir, runs):
+        """日志从头读取时，去掉 (输出, mtime) 与该构建目录历史中最近一次记录相同的边 (压缩后保留下来的旧行)。"""
+        latest = {}
+        for output, mtime in self.connection.execute("""
+                SELECT d.output, d.mtime FROM durations d JOIN builds b ON b.id = d.build_id
+                WHERE b.binary_dir = ? ORDER BY d.build_id""", (binary_dir,)):
+            latest[output] = mtime
+        if not latest:
+            return runs
+        filtered = []
+        for edges in runs:
+            edges = [edge for edge in edges if latest.get(edge.outputs[0]) != edge.mtime]
+            if edges:
+                filtered.append(edges)
+        return filtered
+
+    def record_build(self, binary_dir, preset, commit_hash, edges):
+        """记录一次构建，返回其 id。"""
+        wall_ms = max(edge.end_ms for edge in edges) - min(edge.start_ms for edge in edges)
+        total_ms = sum(edge.duration_ms for edge in edges)
+        cursor = self.connection.execute(
+            "INSERT INTO builds (binary_dir, preset, commit_hash, recorded_at, edge_count, wall_ms, total_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (binary_dir, preset, commit_hash, time.time(), len(edges), wall_ms, total_ms))
+        build_id = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO durations (build_id, output, duration_ms, mtime) VALUES (?, ?, ?, ?)",
+            ((build_id, edge.outputs[0], edge.duration_ms, edge.mtime) for edge in edges))
+        self.connection.commit()
+        return build_id
+
+    def latest_build(self, binary_dir, preset):
+        return self.connection.execute(
+            "SELECT id, commit_hash, recorded_at, edge_count, wall_ms, total_ms FROM builds "
+            "WHERE binary_dir = ? AND preset = ? ORDER BY id DESC LIMIT 1", (binary_dir, preset)).fetchone()
+
+    def build_durations(self, build_id):
+        return dict(self.connection.execute("SELECT output, duration_ms FROM durations WHERE build_id = ?", (build_id,)))
+
+    def baseline_durations(self, binary_dir, preset, before_build_id, history):
+        """同一构建目录和预设中 before_build_id 之前最近 history 次构建里，各输出耗时的中位数。返回 (基线字典, 参与比较的构建数)。"""
+        build_ids = [row[0] for row in self.connection.execute(
+            "SELECT id FROM builds WHERE binary_dir = ? AND preset = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (binary_dir, preset, before_build_id, history))]
+        if not build_ids:
+            return {}, 0
+        samples = {}
+        placeholders = ",".join("?" * len(build_ids))
+        for output, duration_ms in self.connection.execute(
+                f"SELECT output, duration_ms FROM durations WHERE build_id IN ({placeholders})", build_ids):
+            samples.setdefault(output, []).append(duration_ms)
+        return {output: statistics.median(values) for output, values in samples.items()}, len(build_ids)
+
+
+def find_regressions(current, baseline, min_delta_ms=REGRESSION_MIN_DELTA_MS, min_ratio=REGRESSION_MIN_RATIO):
+    """返回 [(输出, 本次耗时, 基线耗时), ...]，按变慢的毫秒数从大到小排列。"""
+    regressions = []
+    for output, duration_ms in current.items():
+        base_ms = baseline.get(output)
+        if base_ms is None:
+            continue
+        if duration_ms - base_ms >= min_delta_ms and duration_ms >= base_ms * min_ratio:
+            regressions.append((output, duration_ms, base_ms))
+    regressions.sort(key=lambda item: item[1] - item[2], reverse=True)
+    return regressions
+
+
+def _format_ms(milliseconds):
+    return f"{milliseconds / 1000:.2f}s"
+
+
+def print_build_report(history, binary_dir, preset, build_id, history_builds=DEFAULT_HISTORY_BUILDS, top=DEFAULT_TOP_COUNT):
+    """打印一次构建的最慢输出和相对前 history_builds 次构建的回退。"""
+    build = history.connection.execute(
+        "SELECT commit_hash, edge_count, wall_ms, total_ms FROM builds WHERE id = ?", (build_id,)).fetchone()
+    commit_hash, edge_count, wall_ms, total_ms = build
+    current = history.build_durations(build_id)
+    print(f"\n{BLUE}构建耗时 [{preset}] @ {commit_hash}:{RESET} {edge_count} 条边，"
+          f"墙钟 {_format_ms(wall_ms)}，累计 {_format_ms(total_ms)}")
+
+    slowest = sorted(current.items(), key=lambda item: item[1], reverse=True)[:top]
+    if slowest:
+        print(f"{BLUE}  最慢的 {len(slowest)} 个输出:{RESET}")
+        for output, duration_ms in slowest:
+            print(f"    {_format_ms(duration_ms):>9}  {output}")
+
+    baseline, compared_builds = history.baseline_durations(binary_dir, preset, build_id, history_builds)
+    if not compared_builds:
+        print(f"{YELLOW}  没有该预设更早的构建记录，暂无可比较的基线。{RESET}")
+        return
+    regressions = find_regressions(current, baseline)
+    if not regressions:
+        print(f"{GREEN}  与前 {compared_builds} 次构建相比没有明显变慢的输出。{RESET}")
+        return
+    print(f"{YELLOW}  与前 {compared_builds} 次构建 (中位数) 相比变慢最多的输出:{RESET}")
+    for output, duration_ms, base_ms in regressions[:top]:
+        print(f"    {RED}+{_format_ms(duration_ms - base_ms):>8}{RESET}  {_format_ms(base_ms)} -> {_format_ms(duration_ms)}  {output}")
+
+
+def analyze_build_dir(binary_dir, preset, project_dir=None, history_builds=DEFAULT_HISTORY_BUILDS, top=DEFAULT_TOP_COUNT,
+                      report_only=False, db_path=None):
+    """导入 binary_dir/.ninja_log 的新内容并打印报告。返回是否成功。"""
+    binary_dir = os.path.abspath(binary_dir)
+    log_path = os.path.join(binary_dir, NINJA_LOG_NAME)
+    if not os.path.isfile(log_path):
+        print(f"{YELLOW}未找到 {log_path} (该预设可能不使用 Ninja 生成器，或尚未构建)。{RESET}")
+        return False
+    try:
+        history = BuildHistory.for_binary_dir(binary_dir, db_path)
+    except sqlite3.Error as e:
+        print(f"{RED}无法打开构建历史库: {e}{RESET}")
+        return False
+    try:
+        build_ids = []
+        if not report_only:
+            runs, rewritten = history.read_new_runs(log_path)
+            if rewritten:
+                print(f"{YELLOW}.ninja_log 已被 ninja 重写，已跳过历史中已有的记录。{RESET}")
+            commit_hash = current_commit(project_dir or binary_dir)
+            build_ids = [history.record_build(binary_dir, preset, commit_hash, edges) for edges in runs]
+            if not build_ids:
+                print(f"{BLUE}.ninja_log 中没有新的构建记录 (构建可能已是最新)。{RESET}")
+            elif len(build_ids) > 1:
+                print(f"{BLUE}自上次分析以来 ninja 运行了 {len(build_ids)} 次，均已记录；下面只报告最后一次。{RESET}")
+        if not build_ids:
+            latest = history.latest_build(binary_dir, preset)
+            if latest is None:
+                print(f"{YELLOW}预设 '{preset}' 还没有构建耗时记录。{RESET}")
+                return True
+            build_ids = [latest[0]]
+        print_build_report(history, binary_dir, preset, build_ids[-1], history_builds, top)
+        return True
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"{RED}分析 .ninja_log 失败: {type(e).__name__}: {e}{RESET}")
+        return False
+    finally:
+        history.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量解析 .ninja_log，记录构建耗时历史并报告最慢的输出和回退")
+    parser.add_argument("binary_dir", help="构建目录 (包含 .ninja_log)")
+    parser.add_argument("--preset", default="default", help="记录时使用的预设名 (默认 default)")
+    parser.add_argument("--project-dir", help="用于读取 git 提交的项目目录 (默认构建目录)")
+    parser.add_argument("--history", type=int, default=DEFAULT_HISTORY_BUILDS, help=f"与前几次构建比较 (默认 {DEFAULT_HISTORY_BUILDS})")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_COUNT, help=f"每个列表显示的行数 (默认 {DEFAULT_TOP_COUNT})")
+    parser.add_argument("--report-only", action="store_true", help="不导入新内容，只报告该预设最近一次记录的构建")
+    parser.add_argument("--db", help=f"历史库路径 (默认 <构建目录>/{HISTORY_DB_NAME}，或环境变量 {HISTORY_DB_ENV})")
+    args = parser.parse_args()
+    ok = analyze_build_dir(args.binary_dir, args.preset, args.project_dir, args.history, args.top, args.report_only, args.db)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import os
+import re
+import sys
+import time
+import datetime
+import threading
+import unicodedata
+
+import NinjaLogAnalyzer
+import AffectedTargets
+import OutputColorizer
+
+# CMakeWorkflow.py 执行构建时的进度显示: 识别 ninja 的 "[N/M] 描述" 进度行，不再逐行滚动输出，
+# 而是在终端底部维护一行状态 (完成/总数、关键路径估计、预计剩余时间)；警告、错误等其他输出照常打印在状态行上方。
+# 完整的原始输出写入日志文件 (<构建目录>/.build_logs/<预设>-<时间>.log，只保留最近 BUILD_LOG_KEEP 个)。
+#
+# 剩余时间的估计基于 .ninja_log 中各输出上一次的耗时:
+#   - ninja 的输出不是终端时，每条边 "完成" 时打印一行进度，N 是已完成的边数，描述以该边的输出结尾；
+#   - 有效并行度 = 已完成的边的历史耗时总和 / 已用时间；
+#   - 剩余工作量: 构建覆盖了历史记录中的大部分边 (全量构建) 时，取尚未完成的已知输出的历史耗时总和；
+#     否则按 剩余边数 x 本次已完成的边的历史耗时均值 估计。剩余工作量 / 有效并行度 即按吞吐量估计的剩余时间；
+#   - 关键路径 = 尚未走完的最长历史耗时链: 已完成的边在构建图中下游最长链的剩余部分，全量构建时还包括尚未完成的边自身 + 其下游链。
+#   预计剩余时间取两者中的较大者。没有历史记录时按本次的完成速度线性外推。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+CLEAR_LINE = "\r\033[K"
+
+# --- 配置 ---
+# CMAKE_WORKFLOW_PROGRESS=0 时照常逐行输出；标准输出不是终端时也不使用状态行
+PROGRESS_ENABLED = os.environ.get("CMAKE_WORKFLOW_PROGRESS", "1") != "0"
+BUILD_LOG_DIR_NAME = ".build_logs"
+BUILD_LOG_KEEP = 10
+STATUS_REFRESH_SECONDS = 0.2 # 状态行的最短刷新间隔
+PROGRESS_LINE_PATTERN = re.compile(r'^\[(\d+)/(\d+)\] (.*)$')
+
+
+def _format_seconds(seconds):
+    seconds = max(0, int(round(seconds)))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def truncate_to_width(text, width):
+    """按终端显示宽度截断 text: 东亚宽字符 (W / F) 占 2 列，组合字符占 0 列，其余占 1 列。"""
+    used = 0
+    for index, char in enumerate(text):
+        char_width = 0 if unicodedata.combining(char) else 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+        if used + char_width > width:
+            return text[:index]
+        used += char_width
+    return text
+
+
+def _description_output(description):
+    """CMake 的进度描述以输出路径结尾 ("Building CXX object CMakeFiles/app.dir/main.cpp.o"、"Linking CXX executable app")。"""
+    return description.rsplit(" ", 1)[-1].replace("\\", "/")
+
+
+def downstream_tails(graph, durations_ms, default_ms):
+    """返回 {节点: 从该节点出发向下游最长的历史耗时链 (毫秒)}。phony 边不计耗时；构建图中若有环 (不应出现) 则忽略回边。"""
+    tails = {}
+    visiting = set()
+    for start in list(graph.consumers):
+        if start in tails:
+            continue
+        # 迭代式后序遍历，避免深链导致递归过深
+        stack = [(start, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in tails:
+                continue
+            edge_ids = graph.consumers.get(node, ())
+            if not expanded:
+                if node in visiting:
+                    continue
+                visiting.add(node)
+                stack.append((node, True))
+                for edge_id in edge_ids:
+                    for output in graph.edges[edge_id][0]:
+                        if output not in tails and output not in visiting:
+                            stack.append((output, False))
+                continue
+            longest = 0
+            for edge_id in edge_ids:
+                outputs, rule, _ = graph.edges[edge_id]
+                if not outputs:
+                    continue
+                cost = 0 if rule == "phony" else durations_ms.get(outputs[0].replace("\\", "/"), default_ms)
+                longest = max(longest, cost + max(tails.get(output, 0) for output in outputs))
+            visiting.discard(node)
+            tails[node] = longest
+    return tails
+
+
+class BuildProgress:
+    """消费构建命令的输出行: 进度行更新状态行，其他行打印到状态行上方；所有行写入日志文件。可被多个线程同时调用。"""
+
+    def __init__(self, binary_dir, label, stream=None, use_status_line=None):
+        self.binary_dir = binary_dir
+        self.stream = stream or sys.stdout
+        self.use_status_line = self.stream.isatty() if use_status_line is None else use_status_line
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.finished = 0
+        self.total = 0
+        self.last_output = ""
+        self._finished_outputs = set()
+        self._finished_cost_ms = 0 # 已完成的边中有历史记录的边的历史耗时总和
+        self._finished_known = 0
+        self._open_tails = [] # (下游链耗时毫秒, 完成时间)，已完成的边尚未走完的下游链
+        self._last_render = 0.0
+        self._status_visible = False
+
+        self.durations_ms = {output.replace("\\", "/"): ms for output, ms in NinjaLogAnalyzer.latest_durations(binary_dir).items()}
+        self.default_ms = (sum(self.durations_ms.values()) / len(self.durations_ms)) if self.durations_ms else None
+        self.tails = {}
+        if self.durations_ms and os.path.isfile(os.path.join(binary_dir, AffectedTargets.MANIFEST_NAME)):
+            try:
+                graph = AffectedTargets.NinjaGraph(binary_dir)
+                self.tails = {node.replace("\\", "/"): ms for node, ms in downstream_tails(graph, self.durations_ms, self.default_ms).items()}
+            except (OSError, ValueError):
+                self.tails = {}
+        self._history_total_ms = sum(self.durations_ms.values())
+        # 全量构建时按 (自身耗时 + 下游链) 从大到小查找尚未完成的边
+        self._chains = sorted(((ms + self.tails.get(output, 0), output) for output, ms in self.durations_ms.items()), reverse=True)
+        self.log_path = self._open_log(label)
+
+    def _open_log(self, label):
+        log_dir = os.path.join(self.binary_dir, BUILD_LOG_DIR_NAME)
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)
+            log_path = os.path.join(log_dir, f"{safe_label}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+            self._log = open(log_path, 'w', encoding='utf-8', errors='replace')
+            logs = sorted((name for name in os.listdir(log_dir) if name.endswith(".log")),
+                          key=lambda name: os.path.getmtime(os.path.join(log_dir, name)))
+            for name in logs[:-BUILD_LOG_KEEP]:
+                os.remove(os.path.join(log_dir, name))
+            return log_path
+        except OSError:
+            self._log = None
+            return None
+
+    def write_lines(self, lines):
+        """AsyncProcessRunner 的 sink 接口: 处理一批输出行，着色和写出都按批进行，每批只 flush 一次。"""
+        with self._lock:
+            if self._log is not None:
+                self._log.write("".join(lines))
+            printed = []
+            for line in lines:
+                text = line.rstrip("\r\n")
+                match = PROGRESS_LINE_PATTERN.match(text)
+                if match is not None:
+                    self._record_progress(int(match.group(1)), int(match.group(2)), match.group(3))
+                    if self.use_status_line:
+                        continue
+                printed.append(text + "\n")
+            parts = []
+            if printed:
+                if self._status_visible:
+                    parts.append(CLEAR_LINE)
+                    self._status_visible = False
+                parts.extend(OutputColorizer.colorize_lines(printed))
+            if self.use_status_line and self.total:
+                now = time.monotonic()
+                if printed or now - self._last_render >= STATUS_REFRESH_SECONDS or self.finished >= self.total:
+                    parts.append(self._status_line(now))
+            if parts:
+                self.stream.write("".join(parts))
+                self.stream.flush()
+
+    def handle_line(self, line):
+        self.write_lines([line])
+
+    def _record_progress(self, finished, total, description):
+        now = time.monotonic()
+        self.finished = finished
+        self.total = total
+        output = _description_output(description)
+        self.last_output = output
+        if output in self._finished_outputs:
+            return
+        self._finished_outputs.add(output)
+        cost = self.durations_ms.get(output)
+        if cost is not None:
+            self._finished_cost_ms += cost
+            self._finished_known += 1
+        tail = self.tails.get(output, 0)
+        if tail > 0:
+            self._open_tails.append((tail, now))
+
+    def _full_build(self):
+        return bool(self.durations_ms) and self.total >= 0.8 * len(self.durations_ms)
+
+    def estimate(self, now=None):
+        """返回 (预计剩余秒数或 None, 关键路径秒数或 None)。"""
+        now = time.monotonic() if now is None else now
+        elapsed_ms = (now - self.started_at) * 1000
+        remaining_edges = max(0, self.total - self.finished)
+        if not self.finished:
+            return None, None
+        if remaining_edges == 0:
+            return 0.0, (0.0 if self.tails else None)
+        if not self._finished_known or elapsed_ms <= 0:
+            return elapsed_ms * remaining_edges / self.finished / 1000, None
+
+        parallelism = max(1.0, self._finished_cost_ms / elapsed_ms)
+        full_build = self._full_build()
+        if full_build:
+            unseen_known = len(self.durations_ms) - self._finished_known
+            unseen_ms = self._history_total_ms - self._finished_cost_ms
+            if unseen_known > 0:
+                work_ms = unseen_ms * remaining_edges / unseen_known
+            else:
+                work_ms = remaining_edges * self._finished_cost_ms / self._finished_known
+        else:
+            work_ms = remaining_edges * self._finished_cost_ms / self._finished_known
+
+        critical_ms = 0.0
+        if self.tails:
+            # 已完成的边的下游链: 减去完成后已经过去的时间，走完的不再保留
+            self._open_tails = [(tail, done) for tail, done in self._open_tails if tail - (now - done) * 1000 > 0]
+            for tail, done in self._open_tails:
+                critical_ms = max(critical_ms, tail - (now - done) * 1000)
+            if full_build:
+                for chain_ms, output in self._chains:
+                    if output not in self._finished_outputs:
+                        critical_ms = max(critical_ms, chain_ms)
+                        break
+        eta_ms = max(work_ms / parallelism, critical_ms)
+        return eta_ms / 1000, (critical_ms / 1000 if self.tails else None)
+
+    def _status_text(self, now):
+        elapsed = now - self.started_at
+        eta, critical = self.estimate(now)
+        parts = [f"[{self.finished}/{self.total}]", f"已用 {_format_seconds(elapsed)}"]
+        if critical is not None:
+            parts.append(f"关键路径 ~{_format_seconds(critical)}")
+        parts.append(f"预计剩余 ~{_format_seconds(eta)}" if eta is not None else "预计剩余 --")
+        text = "  ".join(parts) + (f"  {self.last_output}" if self.last_output else "")
+        try:
+            width = os.get_terminal_size(self.stream.fileno()).columns
+        except (OSError, ValueError, AttributeError):
+            width = 120
+        # 状态行超过一行会折行，\r\033[K 只能清除最后一行，因此按显示宽度截断 (中文标签和输出路径占两列)
+        return truncate_to_width(text, max(20, width - 1))
+
+    def _status_line(self, now):
+        self._last_render = now
+        self._status_visible = True
+        return CLEAR_LINE + BLUE + self._status_text(now) + RESET
+
+    def close(self, succeeded):
+        """结束状态行并打印汇总。"""
+        with self._lock:
+            if self._status_visible:
+                self.stream.write(CLEAR_LINE)
+                self._status_visible = False
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            color = GREEN if succeeded else RED
+            summary = f"{color}构建{'完成' if succeeded else '失败'}: [{self.finished}/{self.total}]，用时 {_format_seconds(time.monotonic() - self.started_at)}。{RESET}"
+            if self.log_path:
+                summary += f" 完整输出: {self.log_path}"
+            self.stream.write(summary + "\n")
+            self.stream.flush()
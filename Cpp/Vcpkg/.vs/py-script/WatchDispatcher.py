@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import argparse
+import platform
+import importlib
+from pathlib import Path
+
+import FileWatcher
+
+# 常驻监听进程: 代替 SyncFiles workflow.yaml 中 watchEntries 的 "每个事件启动一次 Python"。
+# 监听所有 watchEntries 路径，对同一路径的突发事件去抖合并，然后在本进程内调用对应脚本的
+# handle_file_event()，一次突发只处理一次，也不再为每个事件付出解释器启动和模块导入的开销。
+#
+# 用法: python WatchDispatcher.py [--project-dir DIR] [--workflow path/to/workflow.yaml]
+# 使用本进程时，应删除 (或注释掉) workflow.yaml 中对应的 watchEntries，避免同一事件被处理两次。
+
+# ANSI 转义码
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# --- 配置 ---
+# 与 workflow.yaml 中的 watchEntries 保持一致: (相对于项目目录的被监听文件, 处理模块名)
+DEFAULT_WATCH_ENTRIES = [
+    ("build/build.ninja", "ModifyNinjaConfig"),
+    ("build/compile_commands.json", "ModifyCompileCommand"),
+]
+DEBOUNCE_QUIET_SECONDS = 0.5 # 同一路径在该时间内没有新事件才处理
+DEBOUNCE_MAX_WAIT_SECONDS = 5.0 # 事件持续不断时最多推迟这么久
+RESCAN_INTERVAL_SECONDS = 2.0 # 被监听文件所在目录尚不存在时 (例如首次配置前)，重新尝试添加监听的间隔
+
+SYSTEM_TYPE_TO_WORKFLOW_PLATFORM = {"Windows": "windows", "Linux": "linux", "Darwin": "macos"}
+
+
+def load_watch_entries_from_workflow(workflow_path, project_dir):
+    """从 SyncFiles 的 workflow.yaml 读取当前平台的 watchEntries。需要 PyYAML，不可用时返回 None。"""
+    try:
+        import yaml
+    except ImportError:
+        print(f"{YELLOW}未安装 PyYAML，无法解析 {workflow_path}，使用内置的监听列表。{RESET}")
+        return None
+    try:
+        with open(workflow_path, 'r', encoding='utf-8') as f:
+            workflow = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"{RED}读取 {workflow_path} 失败: {e}{RESET}")
+        return None
+
+    platform_key = SYSTEM_TYPE_TO_WORKFLOW_PLATFORM.get(platform.system(), "linux")
+    platform_config = (workflow.get("platforms") or {}).get(platform_key) or workflow.get("SyncFiles") or workflow
+    entries = []
+    for watch_entry in platform_config.get("watchEntries") or []:
+        watched_path = watch_entry.get("watchedPath")
+        script = watch_entry.get("onEventScript")
+        if not watched_path or not script:
+            continue
+        watched_path = watched_path.replace("$PROJECT_DIR$", str(project_dir))
+        entries.append((watched_path, Path(script).stem))
+    return entries
+
+
+class WatchDispatcher:
+    """监听一组文件，去抖后在进程内调用处理模块的 handle_file_event(event_type, file_path)。"""
+
+    def __init__(self, project_dir, watch_entries, quiet_seconds=DEBOUNCE_QUIET_SECONDS,
+                 max_wait_seconds=DEBOUNCE_MAX_WAIT_SECONDS):
+        self.project_dir = Path(project_dir).resolve()
+        self.handlers = {} # 被监听文件的绝对路径 -> 处理模块
+        for watched_path, module_name in watch_entries:
+            absolute_path = os.path.abspath(self.project_dir / watched_path)
+            self.handlers[absolute_path] = importlib.import_module(module_name)
+        self.watcher = FileWatcher.create_watcher()
+        self.debouncer = FileWatcher.Debouncer(quiet_seconds, max_wait_seconds)
+        self._last_rescan = 0.0
+
+    def _ensure_watches(self):
+        """为每个被监听文件的所在目录添加监听；目录还不存在时稍后重试。"""
+        for file_path in self.handlers:
+            self.watcher.add_directory(os.path.dirname(file_path))
+        self._last_rescan = time.monotonic()
+
+    @staticmethod
+    def _merge_event_types(old_type, new_type):
+        # 一次突发中只要出现过创建，就按 "Change New" 处理
+        return "Change New" if "Change New" in (old_type, new_type) else new_type
+
+    def _on_event(self, event):
+        if event.kind == "overflow":
+            # 事件队列溢出，无法确定哪些文件变了，全部处理一遍
+            for file_path in self.handlers:
+                if os.path.isfile(file_path):
+                    self.debouncer.add(file_path, "Change Mod", self._merge_event_types)
+            return
+        if event.is_dir or event.path not in self.handlers:
+            return
+        if event.kind == "deleted":
+            self.debouncer.discard(event.path)
+            return
+        event_type = "Change New" if event.kind == "created" else "Change Mod"
+        self.debouncer.add(event.path, event_type, self._merge_event_types)
+
+    def _dispatch(self, file_path, event_type):
+        handler = self.handlers[file_path]
+        started = time.monotonic()
+        try:
+            exit_code = handler.handle_file_event(event_type, file_path)
+        except Exception as e:
+            print(f"{RED}❌ {handler.__name__} 处理 {file_path} 时出错: {type(e).__name__}: {e}{RESET}")
+            return
+        elapsed = time.monotonic() - started
+        color = GREEN if exit_code == 0 else RED
+        print(f"{color}[{time.strftime('%H:%M:%S')}] {handler.__name__} ({event_type}) {file_path} -> 返回码 {exit_code}, 耗时 {elapsed:.2f}s{RESET}")
+
+    def run(self):
+        self._ensure_watches()
+        print(f"{BLUE}正在监听 ({type(self.watcher).__name__}):{RESET}")
+        for file_path, handler in self.handlers.items():
+            print(f"  {file_path} -> {handler.__name__}")
+        try:
+            while True:
+                if time.monotonic() - self._last_rescan >= RESCAN_INTERVAL_SECONDS:
+                    self._ensure_watches()
+                timeout = min(self.debouncer.time_until_next(idle_timeout=RESCAN_INTERVAL_SECONDS), RESCAN_INTERVAL_SECONDS)
+                for event in self.watcher.read_events(timeout):
+                    self._on_event(event)
+                for file_path, event_type in self.debouncer.pop_ready():
+                    self._dispatch(file_path, event_type)
+        finally:
+            self.watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻监听 build.ninja / compile_commands.json 并在进程内执行改写脚本")
+    parser.add_argument("--project-dir", default=os.environ.get("PROJECT_DIR", "."), help="项目根目录 (默认取 PROJECT_DIR 环境变量)")
+    parser.add_argument("--workflow", help="SyncFiles workflow.yaml 路径，从中读取 watchEntries (需要 PyYAML)")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_QUIET_SECONDS, help="去抖静默时间 (秒)")
+    args = parser.parse_args()
+
+    # 处理模块与本脚本位于同一目录
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    project_dir = Path(args.project_dir).resolve()
+    watch_entries = None
+    if args.workflow:
+        watch_entries = load_watch_entries_from_workflow(args.workflow, project_dir)
+    if not watch_entries:
+        watch_entries = DEFAULT_WATCH_ENTRIES
+
+    dispatcher = WatchDispatcher(project_dir, watch_entries, quiet_seconds=args.debounce)
+    try:
+        dispatcher.run()
+    except KeyboardInterrupt:
+        print(f"\n{YELLOW}已停止监听。{RESET}")
+
+
+if __name__ == "__main__":
+    if platform.system() == "Windows":
+        os.system('') # 这个空命令可以激活某些终端的 ANSI 支持
+    main()
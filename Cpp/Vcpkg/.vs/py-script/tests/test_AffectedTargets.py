@@ -0,0 +1,41 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AffectedTargets
+
+
+class DropBuildDirFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.build_dir = os.path.join(self.root, "real", "build")
+        os.makedirs(os.path.join(self.build_dir, "CMakeFiles"))
+        os.makedirs(os.path.join(self.root, "src"))
+        self.generated = os.path.join("build", "CMakeFiles", "CMakeCXXCompiler.cmake")
+        self.source = os.path.join(self.root, "src", "a.cpp")
+        try:
+            os.symlink(os.path.join(self.root, "real"), os.path.join(self.root, "link"), target_is_directory=True)
+        except (OSError, NotImplementedError):
+            self.skipTest("无法创建符号链接")
+
+    def test_plain_paths(self):
+        changed = [os.path.join(self.root, "real", self.generated), self.source, self.build_dir + "2"]
+        self.assertEqual(AffectedTargets.drop_build_dir_files(changed, [self.build_dir]), [self.source, self.build_dir + "2"])
+
+    def test_file_reached_through_symlink(self):
+        changed = [os.path.join(self.root, "link", self.generated), self.source]
+        self.assertEqual(AffectedTargets.drop_build_dir_files(changed, [self.build_dir]), [self.source])
+
+    def test_build_dir_given_through_symlink(self):
+        changed = [os.path.join(self.root, "real", self.generated), self.source]
+        linked_build_dir = os.path.join(self.root, "link", "build")
+        self.assertEqual(AffectedTargets.drop_build_dir_files(changed, [linked_build_dir]), [self.source])
+
+
+if __name__ == "__main__":
+    unittest.main()
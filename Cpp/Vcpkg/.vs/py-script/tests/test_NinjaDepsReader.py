@@ -0,0 +1,107 @@
+import os
+import sys
+import struct
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NinjaDepsReader
+
+
+def path_record(path, node_id):
+    raw_path = path.encode('utf-8')
+    raw_path += b"\0" * (-len(raw_path) % 4)
+    return struct.pack("<I", len(raw_path) + 4) + raw_path + struct.pack("<I", ~node_id & 0xFFFFFFFF)
+
+
+def deps_record(version, out_id, mtime, dep_ids):
+    mtime_bytes = struct.pack("<q" if version >= 4 else "<I", mtime)
+    body = struct.pack("<i", out_id) + mtime_bytes + struct.pack(f"<{len(dep_ids)}i", *dep_ids)
+    return struct.pack("<I", len(body) | 0x80000000) + body
+
+
+def deps_blob(version, paths, records):
+    """按 ninja 的格式拼出 .ninja_deps: 先写出全部路径记录，再写依赖记录 [(输出编号, mtime, [依赖编号...]), ...]。"""
+    data = NinjaDepsReader.DEPS_SIGNATURE + struct.pack("<i", version)
+    data += b"".join(path_record(path, node_id) for node_id, path in enumerate(paths))
+    data += b"".join(deps_record(version, out_id, mtime, dep_ids) for out_id, mtime, dep_ids in records)
+    return data
+
+
+PATHS = ["a.o", "../src/a.cpp", "../include/common.h", "../inc/x.h", "b.o", "../src/b.cpp"]
+RECORDS = [(0, 111, [1, 2, 3]), (4, 222, [5, 2]), (0, 333, [1, 2])] # a.o 的后一条记录覆盖前一条
+
+
+class ReadNinjaDepsTest(unittest.TestCase):
+    def setUp(self):
+        self.binary_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.binary_dir, ignore_errors=True)
+        self.deps_path = os.path.join(self.binary_dir, NinjaDepsReader.NINJA_DEPS_NAME)
+
+    def write_deps(self, data):
+        with open(self.deps_path, 'wb') as f:
+            f.write(data)
+
+    def test_supported_versions(self):
+        for version in NinjaDepsReader.SUPPORTED_DEPS_VERSIONS:
+            with self.subTest(version=version):
+                self.write_deps(deps_blob(version, PATHS, RECORDS))
+                paths, deps = NinjaDepsReader.read_ninja_deps(self.deps_path)
+                self.assertEqual(paths, PATHS)
+                self.assertEqual(deps, {0: (1, 2), 4: (5, 2)})
+
+    def test_v4_mtime_wider_than_32_bits(self):
+        self.write_deps(deps_blob(4, PATHS, [(0, 1 << 40, [1, 3])]))
+        self.assertEqual(NinjaDepsReader.read_ninja_deps(self.deps_path)[1], {0: (1, 3)})
+
+    def test_truncated_record_is_ignored(self):
+        data = deps_blob(4, PATHS, RECORDS)
+        for cut in (1, 4, 7):
+            with self.subTest(cut=cut):
+                self.write_deps(data[:-cut])
+                paths, deps = NinjaDepsReader.read_ninja_deps(self.deps_path)
+                self.assertEqual(paths, PATHS)
+                self.assertEqual(deps, {0: (1, 2, 3), 4: (5, 2)})
+
+    def test_truncated_path_record_is_ignored(self):
+        data = deps_blob(3, PATHS[:2], [])
+        self.write_deps(data + path_record("../include/common.h", 2)[:-3])
+        self.assertEqual(NinjaDepsReader.read_ninja_deps(self.deps_path), (PATHS[:2], {}))
+
+    def test_bad_checksum_stops_reading(self):
+        data = deps_blob(4, PATHS[:2], []) + path_record("../include/common.h", 7) + deps_record(4, 0, 1, [1])
+        self.write_deps(data)
+        self.assertEqual(NinjaDepsReader.read_ninja_deps(self.deps_path), (PATHS[:2], {}))
+
+    def test_out_of_range_node_stops_reading(self):
+        self.write_deps(deps_blob(4, PATHS, [(4, 1, [5]), (0, 1, [9]), (0, 2, [1])]))
+        self.assertEqual(NinjaDepsReader.read_ninja_deps(self.deps_path)[1], {4: (5,)})
+
+    def test_unsupported_version(self):
+        for version in (1, 2, 5):
+            with self.subTest(version=version):
+                self.write_deps(deps_blob(version, PATHS, []))
+                with self.assertRaisesRegex(ValueError, f"不支持的 .ninja_deps 版本: {version}"):
+                    NinjaDepsReader.read_ninja_deps(self.deps_path)
+
+    def test_not_a_deps_file(self):
+        for data in (b"", b"# ninjadeps\n\x04", b"# ninja log v5\n"):
+            with self.subTest(data=data):
+                self.write_deps(data)
+                with self.assertRaisesRegex(ValueError, "不是 ninja 依赖日志"):
+                    NinjaDepsReader.read_ninja_deps(self.deps_path)
+
+    def test_index_excludes_translation_units_and_uses_cache(self):
+        self.write_deps(deps_blob(4, PATHS, RECORDS))
+        for use_cache in (True, True, False):
+            index = NinjaDepsReader.load_deps_index(self.binary_dir, use_cache)
+            self.assertEqual(index.output_count, 2)
+            self.assertEqual({header: sorted(outputs) for header, outputs in index.headers.items()},
+                             {"../include/common.h": ["a.o", "b.o"]})
+        self.assertTrue(os.path.exists(os.path.join(self.binary_dir, NinjaDepsReader.INDEX_CACHE_NAME)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NinjaLogAnalyzer
+
+
+def log_line(start_ms, end_ms, mtime, output, command_hash):
+    return f"{start_ms}\t{end_ms}\t{mtime}\t{output}\t{command_hash}\n".encode('utf-8')
+
+
+# 一次构建: a.o、b.o 以及一条有两个输出的边 (lib.a / lib.pdb)
+FIRST_RUN = (log_line(0, 100, 1000, "a.o", "1f2e3d4c5b6a7988")
+             + log_line(10, 250, 1001, "b.o", "0011223344556677")
+             + log_line(260, 400, 1002, "lib.a", "8899aabbccddeeff")
+             + log_line(260, 400, 1002, "lib.pdb", "8899aabbccddeeff"))
+# 下一次 ninja 运行: 结束时间从头开始
+SECOND_RUN = log_line(0, 80, 2000, "a.o", "1f2e3d4c5b6a7988")
+
+
+class NinjaLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.binary_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.binary_dir, ignore_errors=True)
+        self.log_path = os.path.join(self.binary_dir, NinjaLogAnalyzer.NINJA_LOG_NAME)
+
+    def write_log(self, content, version=5):
+        with open(self.log_path, 'wb') as f:
+            f.write(f"# ninja log v{version}\n".encode('ascii') + content)
+
+    def append_log(self, content):
+        with open(self.log_path, 'ab') as f:
+            f.write(content)
+
+    def open_history(self):
+        history = NinjaLogAnalyzer.BuildHistory.for_binary_dir(self.binary_dir, os.path.join(self.binary_dir, "history.sqlite"))
+        self.addCleanup(history.close)
+        return history
+
+
+class ParseLogTest(NinjaLogTestCase):
+    def test_supported_versions(self):
+        for version in NinjaLogAnalyzer.SUPPORTED_LOG_VERSIONS:
+            with self.subTest(version=version):
+                self.write_log(FIRST_RUN, version)
+                self.assertEqual(NinjaLogAnalyzer.read_log_version(self.log_path), version)
+                self.assertEqual(NinjaLogAnalyzer.latest_durations(self.binary_dir),
+                                 {"a.o": 100, "b.o": 240, "lib.a": 140, "lib.pdb": 140})
+
+    def test_edges_and_runs(self):
+        runs = NinjaLogAnalyzer.parse_log_lines(FIRST_RUN + SECOND_RUN.replace(b"\n", b"\r\n"))
+        self.assertEqual([len(edges) for edges in runs], [3, 1])
+        self.assertEqual(runs[0][2].outputs, ["lib.a", "lib.pdb"])
+        self.assertEqual(runs[0][2].command_hash, "8899aabbccddeeff")
+        self.assertEqual((runs[1][0].outputs, runs[1][0].duration_ms, runs[1][0].mtime), (["a.o"], 80, 2000))
+
+    def test_malformed_lines_are_skipped(self):
+        content = b"0\t100\t1000\ta.o\n" + b"x\t100\t1000\tb.o\tff\n" + log_line(0, 50, 1, "c.o", "ff")
+        runs = NinjaLogAnalyzer.parse_log_lines(content)
+        self.assertEqual([edge.outputs for edge in runs[0]], [["c.o"]])
+
+    def test_truncated_last_line_is_ignored(self):
+        self.write_log(FIRST_RUN + b"0\t80\t20")
+        self.assertNotIn("c.o", NinjaLogAnalyzer.latest_durations(self.binary_dir))
+        self.assertEqual(NinjaLogAnalyzer.latest_durations(self.binary_dir)["a.o"], 100)
+
+    def test_unsupported_version(self):
+        self.write_log(FIRST_RUN, version=4)
+        self.assertEqual(NinjaLogAnalyzer.read_log_version(self.log_path), 4)
+        self.assertEqual(NinjaLogAnalyzer.latest_durations(self.binary_dir), {})
+        with self.assertRaisesRegex(ValueError, "不支持的 .ninja_log 版本: 4"):
+            self.open_history().read_new_runs(self.log_path)
+
+    def test_missing_header(self):
+        with open(self.log_path, 'wb') as f:
+            f.write(FIRST_RUN)
+        self.assertIsNone(NinjaLogAnalyzer.read_log_version(self.log_path))
+        with self.assertRaisesRegex(ValueError, "不支持的 .ninja_log 版本: None"):
+            self.open_history().read_new_runs(self.log_path)
+
+
+class IncrementalReadTest(NinjaLogTestCase):
+    def test_reads_only_new_complete_lines(self):
+        history = self.open_history()
+        partial = SECOND_RUN[:5]
+        self.write_log(FIRST_RUN + partial, version=6)
+        runs, rewritten = history.read_new_runs(self.log_path)
+        self.assertFalse(rewritten)
+        self.assertEqual([len(edges) for edges in runs], [3])
+
+        # 未写完的行留到下次读取
+        self.append_log(SECOND_RUN[5:])
+        runs, rewritten = history.read_new_runs(self.log_path)
+        self.assertFalse(rewritten)
+        self.assertEqual([[edge.outputs for edge in edges] for edges in runs], [[["a.o"]]])
+
+        runs, _ = history.read_new_runs(self.log_path)
+        self.assertEqual(runs, [])
+
+    def test_recompacted_log_skips_recorded_edges(self):
+        history = self.open_history()
+        self.write_log(FIRST_RUN, version=7)
+        runs, _ = history.read_new_runs(self.log_path)
+        history.record_build(self.binary_dir, "dev", None, runs[0])
+
+        # ninja 重写 (压缩) 日志后 inode 和大小都会变化，旧行已经记录过，不再当作新构建
+        os.remove(self.log_path)
+        self.write_log(log_line(260, 400, 1002, "lib.a", "8899aabbccddeeff") + SECOND_RUN, version=7)
+        runs, rewritten = history.read_new_runs(self.log_path)
+        self.assertTrue(rewritten)
+        self.assertEqual([[edge.outputs for edge in edges] for edges in runs], [[["a.o"]]])
+
+
+if __name__ == "__main__":
+    unittest.main()